@@ -0,0 +1,137 @@
+"""Benchmark: Concurrent Reads and Writes.
+
+This script fills a temporary database with the stocks of a fleet of vending
+machines, then runs reader threads fetching the timeline of a random vending
+machine while a writer thread keeps saving the stock records. It compares the
+engine sqlalchemy creates by default (a new connection for every session in
+the rollback journal mode) with the engine options and pragmas of
+DatabaseService (a pool of connections in the WAL mode).
+
+    PYTHONPATH=src python benchmarks/concurrency.py --readers 4 --seconds 10
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
+
+def populate_stocks(
+    database_service: DatabaseService, vending_machines: int, products: int
+) -> None:
+    """Add a fleet of vending machines with the same products.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        vending_machines (int): A number of vending machines
+        products (int): A number of products in each vending machine
+    """
+    with database_service.begin() as session:
+        session.add_all(
+            VendingMachine(name=f"vm_{vm_id}", location=f"loc_{vm_id}")
+            for vm_id in range(1, vending_machines + 1)
+        )
+        session.add_all(
+            Stock(vm_id, prod_id, 100)
+            for vm_id in range(1, vending_machines + 1)
+            for prod_id in range(1, products + 1)
+        )
+
+
+def run(
+    database_service: DatabaseService,
+    vending_machines: int,
+    readers: int,
+    seconds: float,
+) -> dict:
+    """Read timelines from reader threads while a writer thread saves the stock records.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        vending_machines (int): A number of vending machines
+        readers (int): A number of reader threads
+        seconds (float): The duration of the run
+
+    Returns:
+        dict: The numbers of reads and writes per second and the median and the 99th percentile of the
+            latency of the reads in milliseconds
+    """
+    stopped = threading.Event()
+    latencies = [[] for _ in range(readers)]
+    writes = 0
+
+    def read(latencies: list) -> None:
+        generator = random.Random(len(latencies))
+        while not stopped.is_set():
+            start = time.perf_counter()
+            utils.get_stock_records_page(
+                database_service, vm_id=generator.randint(1, vending_machines)
+            )
+            latencies.append(time.perf_counter() - start)
+
+    def write() -> None:
+        nonlocal writes
+        while not stopped.is_set():
+            utils.save_stock_records(database_service)
+            writes += 1
+
+    threads = [
+        threading.Thread(target=read, args=(latencies[i],)) for i in range(readers)
+    ]
+    threads.append(threading.Thread(target=write))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stopped.set()
+    for thread in threads:
+        thread.join()
+    latencies = sorted(latency for thread in latencies for latency in thread)
+    return {
+        "reads": len(latencies) / seconds,
+        "writes": writes / seconds,
+        "median": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vending-machines", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(
+        f"{'engine':<12}{'reads':>12}{'writes':>12}{'median read':>16}{'p99 read':>14}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for name, options in [
+            ("default", {"engine_options": {}, "pragmas": {}}),
+            ("tuned", {}),
+        ]:
+            database_service = DatabaseService(
+                f"sqlite:///{os.path.join(directory, f'benchmark_{name}.db')}",
+                **options,
+            )
+            populate_stocks(database_service, args.vending_machines, args.products)
+            result = run(
+                database_service, args.vending_machines, args.readers, args.seconds
+            )
+            print(
+                f"{name:<12}{result['reads']:>10.0f}/s{result['writes']:>10.1f}/s"
+                f"{result['median']:>13.1f} ms{result['p99']:>11.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Benchmark: Depletion Forecast.
+
+This script fills a temporary database with the stock records of many product
+stocks and measures loading them into arrays and forecasting their depletion,
+compared with computing the consumption rate of one product stock at a time.
+
+    PYTHONPATH=src python benchmarks/forecast.py --series 100000 --snapshots 8
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from vmms_webapp.database import analytics
+from vmms_webapp.database.database_service import DatabaseService
+
+
+def populate_stock_records(
+    database_service: DatabaseService, series: int, products: int, snapshots: int
+) -> None:
+    """Insert the stock records of a number of product stocks at every snapshot.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        series (int): A number of product stocks
+        products (int): A number of products in each vending machine
+        snapshots (int): A number of snapshots
+    """
+    start = datetime(2023, 1, 1)
+    stocks = [random.randint(50, 100) for _ in range(series)]
+    with database_service.get_engine().begin() as connection:
+        connection.exec_driver_sql("PRAGMA synchronous = OFF")
+        for snapshot in range(snapshots):
+            time_stamp = str(start + timedelta(hours=snapshot))
+            for index in range(series):
+                # refill now and then, otherwise sell a few units
+                if random.random() < 0.05:
+                    stocks[index] = 100
+                else:
+                    stocks[index] = max(stocks[index] - random.randint(0, 3), 0)
+            connection.exec_driver_sql(
+                "INSERT INTO stock_records (time_stamp, vm_id, prod_id, stock) VALUES (?, ?, ?, ?)",
+                [
+                    (time_stamp, index // products + 1, index % products + 1, stock)
+                    for index, stock in enumerate(stocks)
+                ],
+            )
+
+
+def forecast_one_at_a_time(series: dict) -> dict:
+    """Compute the consumption rates of the product stocks one stock record at a time.
+
+    Args:
+        series (dict): The arrays loaded by analytics.load_stock_record_series
+
+    Returns:
+        dict: The units consumed per hour by the vm_id and the prod_id
+    """
+    records = sorted(
+        zip(
+            series["vm_id"].tolist(),
+            series["prod_id"].tolist(),
+            series["time_stamp"].tolist(),
+            series["stock"].tolist(),
+        )
+    )
+    first, previous, consumed, rates = None, None, 0, {}
+    for vm_id, prod_id, time_stamp, stock in records:
+        if previous is None or previous[:2] != (vm_id, prod_id):
+            first, consumed = time_stamp, 0
+        else:
+            consumed += max(previous[3] - stock, 0)
+        hours = (time_stamp - first) / (60 * 60)
+        rates[vm_id, prod_id] = consumed / hours if hours > 0 else None
+        previous = (vm_id, prod_id, time_stamp, stock)
+    return rates
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--series", type=int, default=100_000)
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--snapshots", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_service = DatabaseService(
+            f"sqlite:///{os.path.join(directory, 'benchmark.db')}",
+            default_populate=False,
+        )
+        start = time.perf_counter()
+        populate_stock_records(
+            database_service, args.series, args.products, args.snapshots
+        )
+        print(
+            f"{args.series * args.snapshots} stock records of {args.series} product stocks inserted "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+        start = time.perf_counter()
+        series = analytics.load_stock_record_series(database_service)
+        print(f"{'load the stock records':<42}{time.perf_counter() - start:>10.3f} s")
+        start = time.perf_counter()
+        forecast_one_at_a_time(series)
+        print(f"{'forecast one at a time':<42}{time.perf_counter() - start:>10.3f} s")
+        start = time.perf_counter()
+        analytics.forecast_depletion(series)
+        print(f"{'forecast vectorized':<42}{time.perf_counter() - start:>10.3f} s")
+        start = time.perf_counter()
+        analytics.get_depletion_forecast(
+            database_service, since=datetime(2023, 1, 1), columnar=True
+        )
+        print(f"{'forecast API (columnar)':<42}{time.perf_counter() - start:>10.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Benchmark: Hot Lookups.
+
+This script fills an in-memory database with the stocks of a fleet of vending
+machines and times the lookups made by almost every request, built as a new
+query on every call and as the prebuilt statements of utils, to compare their
+overhead per call.
+
+    PYTHONPATH=src python benchmarks/lookups.py --calls 20000
+"""
+
+import argparse
+import random
+import time
+from typing import Callable
+
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.product import Product
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
+
+def query_vending_machine_by_id(
+    database_service: DatabaseService, vm_id: int
+) -> VendingMachine:
+    """Get a vending machine with a new query."""
+    session = database_service.get_read_session()()
+    return session.query(VendingMachine).filter(VendingMachine.id == vm_id).first()
+
+
+def query_stock_by_vm_id_and_prod_id(
+    database_service: DatabaseService, vm_id: int, prod_id: int
+) -> Stock:
+    """Get a product stock with a new query."""
+    session = database_service.get_read_session()()
+    return (
+        session.query(Stock)
+        .filter(Stock.vm_id == vm_id, Stock.prod_id == prod_id)
+        .first()
+    )
+
+
+def query_stocks_by_vm_id(database_service: DatabaseService, vm_id: int) -> dict:
+    """Get the product stocks of a vending machine with a new query."""
+    session = database_service.get_read_session()()
+    results = (
+        session.query(
+            Stock.vm_id, Stock.prod_id, Product.name, Product.price, Stock.stock
+        )
+        .join(VendingMachine, VendingMachine.id == Stock.vm_id, isouter=True)
+        .join(Product, Product.id == Stock.prod_id, isouter=True)
+        .filter(Stock.vm_id == vm_id)
+        .all()
+    )
+    return {
+        Product(prod_id, name, price): stock
+        for _, prod_id, name, price, stock in results
+    }
+
+
+def time_calls(
+    database_service: DatabaseService, lookup: Callable, arguments: list
+) -> float:
+    """Time the calls of a lookup.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        lookup (Callable): The lookup to call
+        arguments (list): The arguments of each call after the database service
+
+    Returns:
+        float: The mean duration of a call in microseconds
+    """
+    # the first calls fill the compiled cache of the engine
+    for args in arguments[:100]:
+        lookup(database_service, *args)
+    database_service.remove_sessions()
+    start = time.perf_counter()
+    for args in arguments:
+        lookup(database_service, *args)
+    duration = time.perf_counter() - start
+    database_service.remove_sessions()
+    return duration / len(arguments) * 1e6
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vending-machines", type=int, default=100)
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    database_service = DatabaseService("sqlite://", default_populate=False)
+    with database_service.begin() as session:
+        session.add_all(
+            Product(id=prod_id, name=f"prod_{prod_id}", price=10.0)
+            for prod_id in range(1, args.products + 1)
+        )
+        session.add_all(
+            VendingMachine(name=f"vm_{vm_id}", location=f"loc_{vm_id}")
+            for vm_id in range(1, args.vending_machines + 1)
+        )
+        session.add_all(
+            Stock(vm_id, prod_id, 100)
+            for vm_id in range(1, args.vending_machines + 1)
+            for prod_id in range(1, args.products + 1)
+        )
+    database_service.remove_sessions()
+    # the statements are not logged however long they take
+    database_service.get_slow_query_log().threshold = None
+
+    random.seed(0)
+    vm_ids = [random.randint(1, args.vending_machines) for _ in range(args.calls)]
+    prod_ids = [random.randint(1, args.products) for _ in range(args.calls)]
+    lookups = [
+        (
+            "get_vending_machine_by_id",
+            query_vending_machine_by_id,
+            utils.get_vending_machine_by_id,
+            [(vm_id,) for vm_id in vm_ids],
+        ),
+        (
+            "get_stock_by_vm_id_and_prod_id",
+            query_stock_by_vm_id_and_prod_id,
+            utils.get_stock_by_vm_id_and_prod_id,
+            list(zip(vm_ids, prod_ids)),
+        ),
+        (
+            "get_stocks_by_vm_id",
+            query_stocks_by_vm_id,
+            utils.get_stocks_by_vm_id,
+            [(vm_id,) for vm_id in vm_ids],
+        ),
+    ]
+    print(f"{'lookup':<34}{'query':>12}{'prebuilt':>12}{'saved':>10}")
+    for name, query_lookup, prebuilt_lookup, arguments in lookups:
+        query = time_calls(database_service, query_lookup, arguments)
+        prebuilt = time_calls(database_service, prebuilt_lookup, arguments)
+        print(
+            f"{name:<34}{query:>9.1f} us{prebuilt:>9.1f} us"
+            f"{(1 - prebuilt / query) * 100:>9.0f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark: Stock Snapshots.
+
+This script fills a temporary database with the stocks of a fleet of vending
+machines and records a number of snapshots, changing a share of the stocks
+before each one, as full snapshots and as delta snapshots. It compares the
+time to record them, the number of stock records written and the time to read
+the timeline of a vending machine.
+
+    PYTHONPATH=src python benchmarks/snapshots.py --snapshots 50 --changed 0.05
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.stock_record import StockRecord
+from vmms_webapp.models.vending_machine import VendingMachine
+
+
+def record_snapshots(
+    database_service: DatabaseService,
+    vending_machines: int,
+    products: int,
+    snapshots: int,
+    changed: float,
+    delta: bool,
+) -> float:
+    """Record snapshots of the stocks of a fleet, changing a share of the stocks before each one.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        vending_machines (int): A number of vending machines
+        products (int): A number of products in each vending machine
+        snapshots (int): A number of snapshots
+        changed (float): A share of the stocks changed before each snapshot
+        delta (bool): A flag to tell if the snapshots are delta snapshots
+
+    Returns:
+        float: The total duration of save_stock_records in seconds
+    """
+    random.seed(0)
+    with database_service.begin() as session:
+        session.add_all(
+            VendingMachine(name=f"vm_{vm_id}", location=f"loc_{vm_id}")
+            for vm_id in range(1, vending_machines + 1)
+        )
+        session.add_all(
+            Stock(vm_id, prod_id, 100)
+            for vm_id in range(1, vending_machines + 1)
+            for prod_id in range(1, products + 1)
+        )
+    duration = 0.0
+    for _ in range(snapshots):
+        with database_service.get_engine().begin() as connection:
+            connection.exec_driver_sql(
+                "UPDATE stocks SET stock = stock - 1 WHERE abs(random()) % 10000 < ?",
+                (int(changed * 10000),),
+            )
+        start = time.perf_counter()
+        utils.save_stock_records(database_service, delta=delta)
+        duration += time.perf_counter() - start
+    return duration
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vending-machines", type=int, default=200)
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--snapshots", type=int, default=50)
+    parser.add_argument("--changed", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(f"{'snapshots':<12}{'save':>12}{'stock records':>16}{'timeline':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for delta in (False, True):
+            database_service = DatabaseService(
+                f"sqlite:///{os.path.join(directory, f'benchmark_{delta}.db')}"
+            )
+            duration = record_snapshots(
+                database_service,
+                args.vending_machines,
+                args.products,
+                args.snapshots,
+                args.changed,
+                delta,
+            )
+            session = database_service.get_session()()
+            count = session.query(StockRecord).count()
+            start = time.perf_counter()
+            utils.get_stock_records_by_vm_id(database_service, 1)
+            timeline = (time.perf_counter() - start) * 1000
+            print(
+                f"{'delta' if delta else 'full':<12}{duration:>10.2f} s{count:>16}"
+                f"{timeline:>9.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
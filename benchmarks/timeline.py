@@ -0,0 +1,153 @@
+"""Benchmark: Timeline Queries.
+
+This script fills a temporary database with stock records and compares the
+timeline queries of a vending machine and of a product without the composite
+indexes of stock_records (filtering and sorting as the timeline APIs used to)
+and with them (ordered range scans).
+
+    PYTHONPATH=src python benchmarks/timeline.py --records 10000000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import text
+
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock_record import StockRecord
+
+
+def populate_stock_records(
+    database_service: DatabaseService,
+    vending_machines: int,
+    products: int,
+    snapshots: int,
+) -> None:
+    """Insert vending_machines * products * snapshots stock records without the composite indexes.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        vending_machines (int): A number of vending machines
+        products (int): A number of products in each vending machine
+        snapshots (int): A number of snapshots
+    """
+    start = datetime(2023, 1, 1)
+    with database_service.get_engine().begin() as connection:
+        connection.exec_driver_sql("PRAGMA synchronous = OFF")
+        for index in StockRecord.__table__.indexes:
+            connection.exec_driver_sql(f"DROP INDEX {index.name}")
+        for snapshot in range(snapshots):
+            time_stamp = str(start + timedelta(minutes=snapshot))
+            connection.exec_driver_sql(
+                "INSERT INTO stock_records (time_stamp, vm_id, prod_id, stock) VALUES (?, ?, ?, ?)",
+                [
+                    (time_stamp, vm_id, prod_id, random.randint(0, 100))
+                    for vm_id in range(1, vending_machines + 1)
+                    for prod_id in range(1, products + 1)
+                ],
+            )
+
+
+def measure(function: Callable, arguments: list) -> float:
+    """Measure the median duration of a function over a list of arguments.
+
+    Args:
+        function (Callable): The function to measure
+        arguments (list): The arguments to call the function with, one call each
+
+    Returns:
+        float: The median duration in milliseconds
+    """
+    durations = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--vending-machines", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    snapshots = max(args.records // (args.vending_machines * args.products), 1)
+    with tempfile.TemporaryDirectory() as directory:
+        database_service = DatabaseService(
+            f"sqlite:///{os.path.join(directory, 'benchmark.db')}",
+            default_populate=False,
+        )
+        start = time.perf_counter()
+        populate_stock_records(
+            database_service, args.vending_machines, args.products, snapshots
+        )
+        print(
+            f"{args.vending_machines * args.products * snapshots} stock records inserted "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+        vm_ids = random.sample(range(1, args.vending_machines + 1), args.repeat)
+        prod_ids = [random.randint(1, args.products) for _ in range(args.repeat)]
+        session = database_service.get_session()()
+
+        def unindexed_timeline_vending_machine(vm_id: int) -> list:
+            stock_records = (
+                session.query(StockRecord).filter(StockRecord.vm_id == vm_id).all()
+            )
+            return sorted(
+                stock_records, key=lambda record: (record.prod_id, record.time_stamp)
+            )
+
+        def unindexed_timeline_product_page(prod_id: int) -> list:
+            stock_records = (
+                session.query(StockRecord).filter(StockRecord.prod_id == prod_id).all()
+            )
+            return sorted(
+                stock_records, key=lambda record: (record.vm_id, record.time_stamp)
+            )[:100]
+
+        def indexed_timeline_product_page(prod_id: int) -> list:
+            return utils.get_stock_records_page(
+                database_service, prod_id=prod_id, limit=100
+            )[0]
+
+        results = {
+            "timeline of a vending machine": [
+                measure(unindexed_timeline_vending_machine, vm_ids),
+            ],
+            "first 100 records of a product timeline": [
+                measure(unindexed_timeline_product_page, prod_ids),
+            ],
+        }
+        start = time.perf_counter()
+        with database_service.get_engine().begin() as connection:
+            for index in StockRecord.__table__.indexes:
+                index.create(connection)
+            connection.execute(text("ANALYZE"))
+        print(f"composite indexes created in {time.perf_counter() - start:.1f} s")
+        results["timeline of a vending machine"].append(
+            measure(
+                lambda vm_id: utils.get_stock_records_by_vm_id(database_service, vm_id),
+                vm_ids,
+            )
+        )
+        results["first 100 records of a product timeline"].append(
+            measure(indexed_timeline_product_page, prod_ids)
+        )
+        print(f"{'query':<42}{'without indexes':>18}{'with indexes':>18}")
+        for query, (before, after) in results.items():
+            print(f"{query:<42}{before:>15.1f} ms{after:>15.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,21 +9,53 @@ functions:
 
     * create_app - returns a flask app
 """
+import functools
 import http
+import os
+import time
+from datetime import datetime
+from typing import Callable, Iterator, Union
 
-from flask import Flask, Response, jsonify, make_response, render_template, request
-from flask_wtf.csrf import CSRFProtect
+from flask import (
+    Flask,
+    Response,
+    abort,
+    g,
+    jsonify,
+    make_response,
+    render_template,
+    request,
+    stream_template,
+    stream_with_context,
+)
+from flask_wtf.csrf import CSRFProtect, generate_csrf
+from markupsafe import Markup
 from sqlalchemy.exc import NoResultFound
 
-from vmms_webapp.database import utils
+from vmms_webapp.database import analytics, utils
 from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.metrics import COUNTER, HISTOGRAM
+from vmms_webapp.models.vending_machine import VendingMachine
+from vmms_webapp.snapshot_scheduler import SnapshotScheduler
 
+# cached fragments are shared by every client, so they are rendered with this
+# placeholder which is replaced by the csrf token of the client when served
+CSRF_TOKEN_PLACEHOLDER = "__csrf_token_placeholder__"
 
-def create_app(database_service: DatabaseService) -> Flask:
+
+def create_app(
+    database_service: DatabaseService,
+    snapshot_interval: float = None,
+    delta_stock_records: bool = False,
+) -> Flask:
     """Create flask app.
 
     Args:
         database_service (DatabaseService): The object used to interact with database
+        snapshot_interval (float): A number of seconds between two stock records saved in the background
+            (default is None, which means the stock records are only saved on request)
+        delta_stock_records (bool): A flag to tell if only the stocks that changed since the previous
+            snapshot are recorded, including by the background runs (default is False)
 
     Returns:
         Flask: An app
@@ -38,22 +70,199 @@ def create_app(database_service: DatabaseService) -> Flask:
     # this will be used to encrypt the cookies
     app.secret_key = "use-more-complex-secret-key-please"
     app.config["SQLALCHEMY_DATABASE_URI"] = database_service.get_uri()
+    # set to True to only record the stocks that changed since the previous snapshot
+    app.config["DELTA_STOCK_RECORDS"] = delta_stock_records
+    # product stocks below the threshold are refilled up to the target by the restock plan
+    app.config["RESTOCK_THRESHOLD"] = analytics.DEFAULT_RESTOCK_THRESHOLD
+    app.config["RESTOCK_TARGET"] = analytics.DEFAULT_RESTOCK_TARGET
+    # the stock records are saved every interval by one of the processes serving the database
+    app.config["SNAPSHOT_INTERVAL"] = snapshot_interval
+    # set to True to serve the slow query log, which contains the statements and their parameters, e.g. to
+    # the admins of a private deployment
+    app.config["SLOW_QUERIES_API"] = False
+    if snapshot_interval is not None:
+        snapshot_scheduler = SnapshotScheduler(
+            database_service, snapshot_interval, delta=app.config["DELTA_STOCK_RECORDS"]
+        )
+        snapshot_scheduler.start()
+        app.extensions["snapshot_scheduler"] = snapshot_scheduler
+
+    metrics = database_service.get_metrics()
+    metrics.describe(
+        "vmms_http_requests_total", COUNTER, "Number of requests by route and status"
+    )
+    metrics.describe(
+        "vmms_http_request_duration_seconds",
+        HISTOGRAM,
+        "Time spent handling requests by route, including streaming the response",
+    )
+
+    @app.before_request
+    def start_query_stats() -> None:
+        g.query_stats_token = database_service.get_query_stats().start()
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def add_server_timing(response: Response) -> Response:
+        g.response_status = response.status_code
+        stats = database_service.get_query_stats().get_current()
+        if stats is not None:
+            # the statements of a streamed response are only counted in the summary of its route
+            response.headers.add(
+                "Server-Timing",
+                f'db;dur={stats.duration * 1000:.3f};desc="statements: {stats.statements}"',
+            )
+        return response
+
+    @app.teardown_request
+    def stop_query_stats(exception: BaseException = None) -> None:
+        token = g.pop("query_stats_token", None)
+        if token is not None:
+            rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+            database_service.get_query_stats().stop(token, request.method, rule)
+
+    @app.teardown_request
+    def record_request_metrics(exception: BaseException = None) -> None:
+        start = g.pop("request_start", None)
+        if start is not None:
+            labels = {
+                "method": request.method,
+                "route": request.url_rule.rule if request.url_rule else "<unmatched>",
+            }
+            metrics.observe(
+                "vmms_http_request_duration_seconds",
+                time.perf_counter() - start,
+                labels,
+            )
+            status = g.pop("response_status", http.HTTPStatus.INTERNAL_SERVER_ERROR)
+            metrics.inc(
+                "vmms_http_requests_total", {**labels, "status": str(int(status))}
+            )
+        # the other processes read the metrics of this one from its file
+        metrics.flush(force=False)
+
+    @app.teardown_appcontext
+    def remove_session(exception: BaseException = None) -> None:
+        # the helpers called during a request share the sessions of its thread, which are closed here
+        database_service.remove_sessions()
+
+    def conditional(data_version_name: str, private: bool = False) -> Callable:
+        """Answer conditional GET requests of a view with the version of the data it depends on.
+
+        The version is read before the view runs, so a change made while the view is running only causes
+        the next request to be answered in full again. A request whose If-None-Match matches the current
+        version is answered with 304 Not Modified without running the view.
+
+        Args:
+            data_version_name (str): A name of the data version the response of the view depends on
+            private (bool): A flag to tell if the response can only be cached by the client, e.g. because it
+                contains a csrf token (default is False)
+
+        Returns:
+            Callable: A decorator of the view
+        """
+
+        def decorator(view: Callable) -> Callable:
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs) -> Response:
+                version = utils.get_data_version(database_service, data_version_name)
+                etag = f"{data_version_name}-{version}"
+                time_limit = app.config.get("WTF_CSRF_TIME_LIMIT", 3600)
+                if private and time_limit:
+                    # csrf tokens expire, so a page is not revalidated beyond the time limit of its tokens
+                    etag += f"-{int(time.time() // time_limit)}"
+                if request.if_none_match.contains_weak(etag):
+                    response = make_response("", http.HTTPStatus.NOT_MODIFIED)
+                    response.set_etag(etag)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code == http.HTTPStatus.OK:
+                        response.set_etag(etag)
+                response.cache_control.no_cache = True
+                response.cache_control.private = private or None
+                return response
+
+            return wrapper
+
+        return decorator
+
+    def render_vending_machines(
+        vending_machines: list[VendingMachine], csrf_token: str
+    ) -> list[Markup]:
+        fragment_cache = database_service.get_fragment_cache()
+        fragments = {
+            vending_machine.id: fragment_cache.get(
+                vending_machine.id, vending_machine.version
+            )
+            for vending_machine in vending_machines
+        }
+        missing_vending_machines = [
+            vending_machine
+            for vending_machine in vending_machines
+            if fragments[vending_machine.id] is None
+        ]
+        if missing_vending_machines:
+            for (
+                vending_machine,
+                product_choices,
+                stocks,
+            ) in utils.get_vending_machines_with_stocks(
+                database_service, missing_vending_machines
+            ):
+                fragment = render_template(
+                    "vending_machine.html",
+                    vm=vending_machine,
+                    product_choices=product_choices,
+                    stocks=stocks,
+                    csrf_token=lambda: CSRF_TOKEN_PLACEHOLDER,
+                )
+                fragment_cache.set(
+                    vending_machine.id, vending_machine.version, fragment
+                )
+                fragments[vending_machine.id] = fragment
+        return [
+            Markup(
+                fragments[vending_machine.id].replace(
+                    CSRF_TOKEN_PLACEHOLDER, csrf_token
+                )
+            )
+            for vending_machine in vending_machines
+        ]
+
+    def stream_vending_machines(page_args: dict, csrf_token: str) -> Iterator[Markup]:
+        next_cursor = page_args["after_id"]
+        while True:
+            vending_machines, next_cursor = utils.get_vending_machines_page(
+                database_service, **(page_args | {"after_id": next_cursor})
+            )
+            yield from render_vending_machines(vending_machines, csrf_token)
+            if next_cursor is None:
+                break
 
     @app.route("/")
-    def index() -> str:
-        vending_machines = utils.get_vending_machines(database_service)
+    @conditional(utils.VENDING_MACHINES_DATA, private=True)
+    def index() -> Union[str, Response]:
+        page_args = utils.create_vending_machine_page_args_from_request(request)
+        # the token is stored in the session before the response starts, as its cookie is sent with the headers
+        csrf_token = generate_csrf()
+        if utils.get_flag_from_request(request, "stream"):
+            # render the whole fleet page by page while the response is being sent
+            return Response(
+                stream_template(
+                    "index.html",
+                    fragments=stream_vending_machines(page_args, csrf_token),
+                    page_args=page_args,
+                    next_cursor=None,
+                )
+            )
+        vending_machines, next_cursor = utils.get_vending_machines_page(
+            database_service, **page_args
+        )
         return render_template(
             "index.html",
-            data=[
-                (
-                    vending_machine,
-                    utils.get_product_choices_by_vm_id(
-                        database_service, vending_machine.id
-                    ),
-                    utils.get_stocks_by_vm_id(database_service, vending_machine.id),
-                )
-                for vending_machine in vending_machines
-            ],
+            fragments=render_vending_machines(vending_machines, csrf_token),
+            page_args=page_args,
+            next_cursor=next_cursor,
         )
 
     @app.route("/vending_machines/add")
@@ -65,6 +274,37 @@ def create_app(database_service: DatabaseService) -> Flask:
         vending_machine = utils.get_vending_machine_by_id(database_service, vm_id)
         return render_template("update.html", vending_machine=vending_machine)
 
+    @app.route("/api/vending_machines", methods=["GET"])
+    def api_get_vending_machines() -> Response:
+        status_code = http.HTTPStatus.OK
+        try:
+            page_args = utils.create_vending_machine_page_args_from_request(request)
+            vending_machines, next_cursor = utils.get_vending_machines_page(
+                database_service, **page_args
+            )
+            response = {
+                "status": "success",
+                "data": {
+                    "get": list(
+                        map(
+                            lambda vending_machine: vending_machine.to_dict(),
+                            vending_machines,
+                        )
+                    ),
+                    "next": next_cursor,
+                },
+                "message": "vending machines are successfully retrieved",
+            }
+        except Exception as e:
+            print("api_get_vending_machines:", e)
+            status_code = http.HTTPStatus.BAD_REQUEST
+            response = {
+                "status": "error",
+                "data": {"get": [], "next": None},
+                "message": "unable to retrieve vending machines",
+            }
+        return make_response(jsonify(response), status_code)
+
     @app.route("/api/vending_machines/add", methods=["POST"])
     def api_add_vending_machine() -> Response:
         status_code = http.HTTPStatus.OK
@@ -184,11 +424,88 @@ def create_app(database_service: DatabaseService) -> Flask:
             }
         return make_response(jsonify(response), status_code)
 
+    @app.route("/api/product_stocks/restock_plan", methods=["GET"])
+    def api_get_restock_plan() -> Response:
+        status_code = http.HTTPStatus.OK
+        try:
+            restock_plan = analytics.get_restock_plan(
+                database_service,
+                threshold=int(
+                    request.args.get("threshold", app.config["RESTOCK_THRESHOLD"])
+                ),
+                target=int(request.args.get("target", app.config["RESTOCK_TARGET"])),
+                hours=float(request.args["hours"]) if "hours" in request.args else None,
+                location=request.args.get("location"),
+            )
+            response = {
+                "status": "success",
+                "data": {"get": restock_plan},
+                "message": "restock plan is successfully retrieved",
+            }
+        except Exception as e:
+            print("api_get_restock_plan:", e)
+            status_code = http.HTTPStatus.BAD_REQUEST
+            response = {
+                "status": "error",
+                "data": {"get": None},
+                "message": "unable to retrieve restock plan",
+            }
+        return make_response(jsonify(response), status_code)
+
+    def stream_stock_records_ndjson(page_args: dict) -> Iterator[str]:
+        try:
+            for stock_records in utils.iter_stock_record_batches(
+                database_service,
+                since=page_args["since"],
+                until=page_args["until"],
+                cursor=page_args["cursor"],
+            ):
+                yield "".join(
+                    f"{app.json.dumps(stock_record)}\n"
+                    for stock_record in stock_records
+                )
+        except Exception as e:
+            # the records streamed so far are valid lines, so the error is told by a last line
+            print("stream_stock_records_ndjson:", e)
+            yield f'{app.json.dumps({"error": "unable to retrieve stock records"})}\n'
+
+    def stream_stock_records_json(page_args: dict) -> Iterator[str]:
+        yield '{"status": "success", "data": {"get": ['
+        separator = ""
+        try:
+            for stock_records in utils.iter_stock_record_batches(
+                database_service,
+                since=page_args["since"],
+                until=page_args["until"],
+                cursor=page_args["cursor"],
+            ):
+                yield separator + ", ".join(map(app.json.dumps, stock_records))
+                separator = ", "
+        except Exception as e:
+            # the response is left unterminated, so the client cannot mistake it for a complete one
+            print("stream_stock_records_json:", e)
+            return
+        yield '], "next": null}, "message": "all stock records are successfully retrieved"}'
+
     @app.route("/api/stock_records/", methods=["GET"])
+    @conditional(utils.STOCK_RECORDS_DATA)
     def api_get_stock_records() -> Response:
         status_code = http.HTTPStatus.OK
         try:
-            stock_records = utils.get_stock_records(database_service)
+            page_args = utils.create_stock_record_page_args_from_request(request)
+            if request.args.get("format") == "ndjson":
+                return Response(
+                    stream_with_context(stream_stock_records_ndjson(page_args)),
+                    mimetype="application/x-ndjson",
+                )
+            if utils.get_flag_from_request(request, "stream"):
+                return Response(
+                    stream_with_context(stream_stock_records_json(page_args)),
+                    mimetype="application/json",
+                )
+            stock_records, next_cursor = utils.get_stock_records_page(
+                database_service, **page_args
+            )
             response = {
                 "status": "success",
                 "data": {
@@ -197,7 +514,8 @@ def create_app(database_service: DatabaseService) -> Flask:
                             lambda stock_record: stock_record.to_dict(),
                             stock_records,
                         )
-                    )
+                    ),
+                    "next": next_cursor,
                 },
                 "message": "all stock records are successfully retrieved",
             }
@@ -206,7 +524,7 @@ def create_app(database_service: DatabaseService) -> Flask:
             status_code = http.HTTPStatus.BAD_REQUEST
             response = {
                 "status": "error",
-                "data": {"get": []},
+                "data": {"get": [], "next": None},
                 "message": "unable to retrieve stock records",
             }
         return make_response(jsonify(response), status_code)
@@ -215,7 +533,12 @@ def create_app(database_service: DatabaseService) -> Flask:
     def api_save_stock_records() -> Response:
         status_code = http.HTTPStatus.OK
         try:
-            response = utils.save_stock_records(database_service)
+            response = utils.save_stock_records(
+                database_service,
+                delta=app.config["DELTA_STOCK_RECORDS"]
+                or utils.get_flag_from_request(request, "delta"),
+                echo=utils.get_flag_from_request(request, "echo"),
+            )
         except Exception as e:
             print("api_save_stock_records:", e)
             status_code = http.HTTPStatus.BAD_REQUEST
@@ -226,26 +549,198 @@ def create_app(database_service: DatabaseService) -> Flask:
             }
         return make_response(jsonify(response), status_code)
 
+    @app.route("/api/query_stats", methods=["GET"])
+    def api_get_query_stats() -> Response:
+        response = {
+            "status": "success",
+            "data": {"get": database_service.get_query_stats().get_summary()},
+            "message": "query stats are successfully retrieved",
+        }
+        return make_response(jsonify(response), http.HTTPStatus.OK)
+
+    @app.route("/api/slow_queries", methods=["GET"])
+    def api_get_slow_queries() -> Response:
+        if not app.config["SLOW_QUERIES_API"]:
+            abort(http.HTTPStatus.NOT_FOUND)
+        slow_query_log = database_service.get_slow_query_log()
+        response = {
+            "status": "success",
+            "data": {
+                "get": slow_query_log.get_entries(),
+                "threshold": slow_query_log.threshold,
+            },
+            "message": "slow queries are successfully retrieved",
+        }
+        return make_response(jsonify(response), http.HTTPStatus.OK)
+
+    @app.route("/api/slow_queries", methods=["DELETE"])
+    def api_delete_slow_queries() -> Response:
+        if not app.config["SLOW_QUERIES_API"]:
+            abort(http.HTTPStatus.NOT_FOUND)
+        database_service.get_slow_query_log().clear()
+        response = {
+            "status": "success",
+            "data": {"delete": []},
+            "message": "slow queries are successfully cleared",
+        }
+        return make_response(jsonify(response), http.HTTPStatus.OK)
+
+    @app.route("/metrics", methods=["GET"])
+    def get_metrics() -> Response:
+        response = make_response(metrics.render(), http.HTTPStatus.OK)
+        response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+        return response
+
+    @app.route("/api/stock_records/scheduler", methods=["GET"])
+    def api_get_snapshot_scheduler() -> Response:
+        snapshot_scheduler = app.extensions.get("snapshot_scheduler")
+        response = {
+            "status": "success",
+            "data": {
+                "get": snapshot_scheduler.get_status() if snapshot_scheduler else None
+            },
+            "message": "snapshot scheduler status is successfully retrieved",
+        }
+        return make_response(jsonify(response), http.HTTPStatus.OK)
+
+    @app.route("/api/stock_records/as_of", methods=["GET"])
+    @conditional(utils.STOCK_RECORDS_DATA)
+    def api_get_stock_records_as_of() -> Response:
+        status_code = http.HTTPStatus.OK
+        try:
+            time_stamp = datetime.utcnow()
+            if request.args.get("time_stamp"):
+                time_stamp = utils.parse_time_stamp(request.args["time_stamp"])
+            stock_records = utils.get_stock_records_at(
+                database_service,
+                time_stamp,
+                vm_id=request.args.get("vm_id", type=int),
+                prod_id=request.args.get("prod_id", type=int),
+            )
+            response = {
+                "status": "success",
+                "data": {
+                    "get": list(
+                        map(lambda stock_record: stock_record.to_dict(), stock_records)
+                    )
+                },
+                "message": f"stock records as of {time_stamp} are successfully retrieved",
+            }
+        except Exception as e:
+            print("api_get_stock_records_as_of:", e)
+            status_code = http.HTTPStatus.BAD_REQUEST
+            response = {
+                "status": "error",
+                "data": {"get": []},
+                "message": "unable to retrieve stock records",
+            }
+        return make_response(jsonify(response), status_code)
+
     @app.route(
-        "/api/stock_records/timeline/vending_machines/<int:vm_id>", methods=["GET"]
+        "/api/stock_records/rollups/<any(hourly, daily):period>", methods=["GET"]
     )
-    def api_get_timeline_vending_machine(vm_id: int) -> Response:
+    @conditional(utils.STOCK_RECORDS_DATA)
+    def api_get_stock_rollups(period: str) -> Response:
         status_code = http.HTTPStatus.OK
         try:
-            stock_records = utils.get_stock_records_by_vm_id(database_service, vm_id)
-            stock_timeline = sorted(
-                stock_records, key=lambda record: (record.prod_id, record.time_stamp)
+            page_args = utils.create_stock_record_page_args_from_request(request)
+            stock_rollups = utils.get_stock_rollups(
+                database_service,
+                utils.STOCK_ROLLUPS[period],
+                vm_id=request.args.get("vm_id", type=int),
+                prod_id=request.args.get("prod_id", type=int),
+                since=page_args["since"],
+                until=page_args["until"],
             )
             response = {
                 "status": "success",
                 "data": {
                     "get": list(
-                        map(
-                            lambda stock_record: stock_record.to_dict(),
-                            stock_timeline,
-                        )
+                        map(lambda stock_rollup: stock_rollup.to_dict(), stock_rollups)
                     )
                 },
+                "message": f"{period} stock rollups are successfully retrieved",
+            }
+        except Exception as e:
+            print("api_get_stock_rollups:", e)
+            status_code = http.HTTPStatus.BAD_REQUEST
+            response = {
+                "status": "error",
+                "data": {"get": []},
+                "message": f"unable to retrieve {period} stock rollups",
+            }
+        return make_response(jsonify(response), status_code)
+
+    @app.route("/api/stock_records/forecast", methods=["GET"])
+    @conditional(utils.STOCK_RECORDS_DATA)
+    def api_get_depletion_forecast() -> Response:
+        status_code = http.HTTPStatus.OK
+        try:
+            page_args = utils.create_stock_record_page_args_from_request(request)
+            forecast = analytics.get_depletion_forecast(
+                database_service,
+                vm_id=request.args.get("vm_id", type=int),
+                prod_id=request.args.get("prod_id", type=int),
+                since=page_args["since"],
+                until=page_args["until"],
+                columnar=request.args.get("format") == "columnar",
+            )
+            response = {
+                "status": "success",
+                "data": {"get": forecast},
+                "message": "depletion forecast is successfully retrieved",
+            }
+        except Exception as e:
+            print("api_get_depletion_forecast:", e)
+            status_code = http.HTTPStatus.BAD_REQUEST
+            response = {
+                "status": "error",
+                "data": {"get": []},
+                "message": "unable to retrieve depletion forecast",
+            }
+        return make_response(jsonify(response), status_code)
+
+    def get_timeline(page_args: dict, **timeline_args) -> dict:
+        columnar = request.args.get("format") == "columnar"
+        bucket = request.args.get("bucket")
+        if bucket:
+            # downsampled timelines are small enough not to be paged
+            buckets = utils.get_stock_record_buckets(
+                database_service,
+                utils.parse_bucket_width(bucket),
+                since=page_args["since"],
+                until=page_args["until"],
+                **timeline_args,
+            )
+            if columnar:
+                buckets = utils.to_columns(buckets, utils.STOCK_RECORD_BUCKET_KEYS)
+            return {"get": buckets, "next": None}
+        if columnar:
+            columns, next_cursor = utils.get_stock_record_columns_page(
+                database_service, **timeline_args, **page_args
+            )
+            return {"get": columns, "next": next_cursor}
+        stock_timeline, next_cursor = utils.get_stock_records_page(
+            database_service, **timeline_args, **page_args
+        )
+        return {
+            "get": list(
+                map(lambda stock_record: stock_record.to_dict(), stock_timeline)
+            ),
+            "next": next_cursor,
+        }
+
+    @app.route(
+        "/api/stock_records/timeline/vending_machines/<int:vm_id>", methods=["GET"]
+    )
+    @conditional(utils.STOCK_RECORDS_DATA)
+    def api_get_timeline_vending_machine(vm_id: int) -> Response:
+        status_code = http.HTTPStatus.OK
+        try:
+            page_args = utils.create_stock_record_page_args_from_request(request)
+            response = {
+                "status": "success",
+                "data": get_timeline(page_args, vm_id=vm_id),
                 "message": f"all stock records of vending machine {vm_id} are successfully retrieved",
             }
         except Exception as e:
@@ -253,31 +748,20 @@ def create_app(database_service: DatabaseService) -> Flask:
             status_code = http.HTTPStatus.BAD_REQUEST
             response = {
                 "status": "error",
-                "data": {"get": []},
+                "data": {"get": [], "next": None},
                 "message": f"unable to retrieve stock records of vending machine {vm_id}",
             }
         return make_response(jsonify(response), status_code)
 
     @app.route("/api/stock_records/timeline/products/<int:prod_id>", methods=["GET"])
+    @conditional(utils.STOCK_RECORDS_DATA)
     def api_get_timeline_product(prod_id: int) -> Response:
         status_code = http.HTTPStatus.OK
         try:
-            stock_records = utils.get_stock_records_by_prod_id(
-                database_service, prod_id
-            )
-            stock_timeline = sorted(
-                stock_records, key=lambda record: (record.vm_id, record.time_stamp)
-            )
+            page_args = utils.create_stock_record_page_args_from_request(request)
             response = {
                 "status": "success",
-                "data": {
-                    "get": list(
-                        map(
-                            lambda stock_record: stock_record.to_dict(),
-                            stock_timeline,
-                        )
-                    )
-                },
+                "data": get_timeline(page_args, prod_id=prod_id),
                 "message": f"all stock records of product {prod_id} are successfully retrieved",
             }
         except Exception as e:
@@ -285,7 +769,7 @@ def create_app(database_service: DatabaseService) -> Flask:
             status_code = http.HTTPStatus.BAD_REQUEST
             response = {
                 "status": "error",
-                "data": {"get": []},
+                "data": {"get": [], "next": None},
                 "message": f"unable to retrieve stock records of product {prod_id}",
             }
         return make_response(jsonify(response), status_code)
@@ -295,6 +779,18 @@ def create_app(database_service: DatabaseService) -> Flask:
 
 if __name__ == "__main__":
     database_path = utils.DATABASE_PATH
-    database_service = DatabaseService(database_path)
-    app = create_app(database_service)
+    database_service = DatabaseService(
+        database_path,
+        archive_path=utils.ARCHIVE_PATH,
+        read_uri=os.environ.get("READ_DATABASE_URI"),
+        metrics_dir=os.environ.get("METRICS_DIR"),
+        slow_query_threshold=float(os.environ.get("SLOW_QUERY_THRESHOLD", 0.1)),
+    )
+    snapshot_interval = os.environ.get("SNAPSHOT_INTERVAL")
+    app = create_app(
+        database_service,
+        snapshot_interval=float(snapshot_interval) if snapshot_interval else None,
+        delta_stock_records=os.environ.get("DELTA_STOCK_RECORDS") == "1",
+    )
+    app.config["SLOW_QUERIES_API"] = os.environ.get("SLOW_QUERIES_API") == "1"
     app.run(debug=True)
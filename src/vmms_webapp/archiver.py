@@ -0,0 +1,209 @@
+"""Archiver.
+
+This script moves the stock records before a cutoff from the database into the
+stock record archive, one file per month. The stock records are archived as
+they are read at every snapshot, so the archive does not depend on any
+snapshot left in the database, and the first snapshot after the cutoff is
+rebased into a full snapshot before the stock records it depended on are
+deleted.
+
+The archive is complete until the cutoff once it is written, and the stock
+record APIs read the stock records before the cutoff from the archive from
+then on, so they return the same stock records while the database is cleaned
+up in short transactions.
+
+This file can also be run as a script:
+
+    python -m vmms_webapp.archiver --days 90 --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from datetime import datetime, timedelta
+from typing import Iterator
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from vmms_webapp import retention
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.snapshot import Snapshot
+from vmms_webapp.models.stock_record import StockRecord
+from vmms_webapp.stock_record_archive import ARCHIVE_DTYPE
+
+
+def get_months(since: datetime, until: datetime) -> list[tuple[datetime, datetime]]:
+    """Split a time range into months.
+
+    Args:
+        since (datetime): The start of the time range
+        until (datetime): The end of the time range, excluded
+
+    Returns:
+        list: A list of the start and the end of each month, clipped to the time range
+    """
+    months = []
+    start = since
+    while start < until:
+        end = (start.replace(day=1) + timedelta(days=32)).replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        )
+        months.append((start, min(end, until)))
+        start = end
+    return months
+
+
+def iter_archive_batches(
+    session: Session, statement: Select, batch_size: int, report: dict
+) -> Iterator[np.ndarray]:
+    """Read the stock records selected by a statement in batches of the archive.
+
+    Args:
+        session (Session): The session reading the stock records
+        statement (Select): The statement selecting the time stamp, vm_id, prod_id and stock
+        batch_size (int): A number of stock records in each batch
+        report (dict): The report of which the number of archived stock records is increased
+
+    Yields:
+        np.ndarray: A structured array of a batch of stock records with ARCHIVE_DTYPE
+    """
+    statement = statement.execution_options(stream_results=True, yield_per=batch_size)
+    for rows in session.execute(statement).partitions():
+        report["archived_stock_records"] += len(rows)
+        yield np.array([tuple(row) for row in rows], dtype=ARCHIVE_DTYPE)
+
+
+def archive_stock_records(
+    database_service: DatabaseService,
+    before: datetime,
+    batch_size: int = retention.DEFAULT_BATCH_SIZE,
+    dry_run: bool = False,
+) -> dict:
+    """Move the stock records before a time stamp into the stock record archive.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        before (datetime): The time stamp before which stock records are archived
+        batch_size (int): A maximum number of rows archived at once or deleted in a transaction
+            (default is retention.DEFAULT_BATCH_SIZE)
+        dry_run (bool): A flag to tell if the rows are only counted instead of moved
+            (default is False)
+
+    Returns:
+        dict: A dictionary of the numbers of archived stock records and months, rebased snapshots and
+            deleted snapshots and stock records
+
+    Raises:
+        ValueError: If the database service has no stock record archive
+    """
+    archive = database_service.get_stock_record_archive()
+    if archive is None:
+        raise ValueError("the database service has no stock record archive")
+    session = database_service.get_session()()
+    snapshots = Snapshot.__table__
+    stock_records = StockRecord.__table__
+    report = {
+        "archived_stock_records": 0,
+        "archived_months": 0,
+        "rebased_snapshots": 0,
+        "deleted_snapshots": 0,
+        "deleted_stock_records": 0,
+    }
+    since = session.query(func.min(Snapshot.time_stamp)).scalar()
+    archive_until = archive.get_until()
+    if archive_until is not None:
+        before = max(before, archive_until)
+    series = utils.has_delta_snapshots(database_service)
+    for start, end in get_months(since or before, before):
+        statement = utils.select_stock_records(
+            StockRecord.time_stamp,
+            StockRecord.vm_id,
+            StockRecord.prod_id,
+            StockRecord.stock,
+            since=start,
+            until=end,
+            series=series,
+        )
+        if dry_run:
+            report["archived_stock_records"] += session.execute(
+                select(func.count()).select_from(statement.order_by(None).subquery())
+            ).scalar()
+            continue
+        report["archived_months"] += archive.add_batches(
+            iter_archive_batches(session, statement, batch_size, report)
+        )
+    first_time_stamp = (
+        session.query(func.min(Snapshot.time_stamp))
+        .filter(Snapshot.time_stamp >= before)
+        .scalar()
+    )
+    if dry_run:
+        report["rebased_snapshots"] = int(
+            first_time_stamp is not None
+            and session.get(Snapshot, first_time_stamp).delta
+        )
+        report["deleted_snapshots"] = retention.count_rows(
+            database_service, snapshots, snapshots.c.time_stamp < before
+        )
+        report["deleted_stock_records"] = retention.count_rows(
+            database_service, stock_records, stock_records.c.time_stamp < before
+        )
+        return report
+    # the first snapshot after the cutoff must not depend on the stock records before it
+    if first_time_stamp is not None:
+        report["rebased_snapshots"] = int(
+            retention.rebase_snapshot(
+                database_service, None, first_time_stamp, batch_size
+            )
+        )
+    archive.set_until(before)
+    report["deleted_snapshots"] = retention.delete_in_batches(
+        database_service,
+        snapshots,
+        snapshots.c.time_stamp < before,
+        batch_size=batch_size,
+    )
+    report["deleted_stock_records"] = retention.delete_in_batches(
+        database_service,
+        stock_records,
+        stock_records.c.time_stamp < before,
+        batch_size=batch_size,
+    )
+    with database_service.begin() as session:
+        utils.bump_data_version(session, utils.STOCK_RECORDS_DATA)
+    return report
+
+
+def main() -> None:
+    """Archive the stock records older than a number of days and print the report."""
+    parser = argparse.ArgumentParser(
+        description="Move old stock records into the stock record archive."
+    )
+    parser.add_argument("--database", default=utils.DATABASE_PATH)
+    parser.add_argument("--archive", default=utils.ARCHIVE_PATH)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--batch-size", type=int, default=retention.DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only count the rows that would be affected",
+    )
+    args = parser.parse_args()
+    report = archive_stock_records(
+        DatabaseService(
+            args.database, default_populate=False, archive_path=args.archive
+        ),
+        datetime.utcnow() - timedelta(days=args.days),
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+    )
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
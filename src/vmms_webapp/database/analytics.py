@@ -0,0 +1,351 @@
+"""Analytics.
+
+This script contains the analytics of the stock records, computed over all
+product stocks at once with NumPy instead of one product stock at a time.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from itertools import chain
+from operator import itemgetter
+from typing import TYPE_CHECKING
+
+import numpy as np
+from sqlalchemy import func, select
+
+from vmms_webapp.database import utils
+from vmms_webapp.models.product import Product
+from vmms_webapp.models.snapshot import Snapshot
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.stock_record import StockRecord
+from vmms_webapp.models.vending_machine import VendingMachine
+
+if TYPE_CHECKING:
+    from vmms_webapp.database.database_service import DatabaseService
+
+DEFAULT_FORECAST_WINDOW = timedelta(days=7)
+# the Julian day of the Unix epoch
+EPOCH_JULIAN_DAY = 2440587.5
+DEFAULT_RESTOCK_THRESHOLD = 10
+DEFAULT_RESTOCK_TARGET = 100
+DEPLETION_FORECAST_KEYS = [
+    "vm_id",
+    "prod_id",
+    "stock",
+    "consumed",
+    "rate",
+    "hours_to_empty",
+    "empty_at",
+]
+
+
+def load_stock_record_series(
+    database_service: DatabaseService,
+    vm_id: int = None,
+    prod_id: int = None,
+    since: datetime = None,
+    until: datetime = None,
+) -> dict[str, np.ndarray]:
+    """Load the stock records of every product stock into arrays with a single query.
+
+    The time stamps are converted to seconds since the Unix epoch by the database (with a precision of
+    about a tenth of a millisecond), so no datetime objects are created, and the archived stock records are
+    added from the archive.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        vm_id (int): An id of the interested vending machine
+            (default is None)
+        prod_id (int): An id of the interested product
+            (default is None)
+        since (datetime): The earliest time stamp to include
+            (default is None)
+        until (datetime): The time stamp before which stock records are included
+            (default is None)
+
+    Returns:
+        dict: A dictionary of the arrays of the time stamps (seconds since the Unix epoch), the vm_ids,
+            the prod_ids and the stocks, in no particular order
+    """
+    session = database_service.get_read_session()()
+    archive, live_since = utils.split_archived_stock_records(database_service, since)
+    rows = (
+        utils.select_stock_records(
+            StockRecord.time_stamp,
+            StockRecord.vm_id,
+            StockRecord.prod_id,
+            StockRecord.stock,
+            vm_id=vm_id,
+            prod_id=prod_id,
+            since=live_since,
+            until=until,
+            series=utils.has_delta_snapshots(database_service),
+        )
+        .order_by(None)
+        .subquery()
+    )
+    statement = select(
+        (func.julianday(rows.c.time_stamp) - EPOCH_JULIAN_DAY) * 24 * 60 * 60,
+        rows.c.vm_id,
+        rows.c.prod_id,
+        rows.c.stock,
+    ).filter(rows.c.stock.isnot(None))
+    # the rows are read by the connection straight into an array, without the overhead of the ORM
+    values = np.fromiter(
+        chain.from_iterable(session.connection().execute(statement)), dtype=np.float64
+    ).reshape(-1, 4)
+    series = {
+        "time_stamp": values[:, 0],
+        "vm_id": values[:, 1].astype(np.int64),
+        "prod_id": values[:, 2].astype(np.int64),
+        "stock": values[:, 3].astype(np.int64),
+    }
+    if archive is not None:
+        records = archive.select(vm_id, prod_id, since, until)
+        archived = {
+            "time_stamp": records["time_stamp"].astype(np.int64) / 1e6,
+            "vm_id": records["vm_id"].astype(np.int64),
+            "prod_id": records["prod_id"].astype(np.int64),
+            "stock": records["stock"],
+        }
+        series = {key: np.concatenate([archived[key], series[key]]) for key in series}
+    return series
+
+
+def forecast_depletion(series: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """Forecast when every product stock runs out from its stock records.
+
+    The consumption rate of a product stock is the number of units consumed between its first and last
+    stock record divided by the hours between them, where a stock that increases is a refill and does not
+    count as consumption. The product stock runs out when its last stock is consumed at that rate.
+
+    Args:
+        series (dict): A dictionary of the arrays of the time stamps (seconds since the Unix epoch), the vm_ids,
+            the prod_ids and the stocks, as loaded by load_stock_record_series
+
+    Returns:
+        dict: A dictionary of an array for each of DEPLETION_FORECAST_KEYS, one element for each product stock
+            ordered by vm_id and prod_id: the last stock, the consumed units, the units consumed per hour,
+            the hours until the stock runs out and when it runs out (seconds since the Unix epoch), which
+            are NaN if nothing was consumed
+    """
+    order = np.lexsort((series["time_stamp"], series["prod_id"], series["vm_id"]))
+    time_stamps = series["time_stamp"][order]
+    vm_ids = series["vm_id"][order]
+    prod_ids = series["prod_id"][order]
+    stocks = series["stock"][order]
+    if len(stocks) == 0:
+        float_keys = ("rate", "hours_to_empty", "empty_at")
+        return {
+            key: np.empty(0, dtype=np.float64 if key in float_keys else np.int64)
+            for key in DEPLETION_FORECAST_KEYS
+        }
+    # the first stock record of each product stock
+    firsts = np.concatenate(
+        [[True], (vm_ids[1:] != vm_ids[:-1]) | (prod_ids[1:] != prod_ids[:-1])]
+    )
+    starts = np.flatnonzero(firsts)
+    ends = np.append(starts[1:], len(stocks)) - 1
+    consumed = np.concatenate([[0], np.maximum(stocks[:-1] - stocks[1:], 0)])
+    consumed[firsts] = 0
+    consumed = np.add.reduceat(consumed, starts)
+    hours = (time_stamps[ends] - time_stamps[starts]) / (60 * 60)
+    rates = np.full(len(starts), np.nan)
+    np.divide(consumed, hours, out=rates, where=hours > 0)
+    last_stocks = stocks[ends]
+    hours_to_empty = np.full(len(starts), np.nan)
+    np.divide(last_stocks, rates, out=hours_to_empty, where=rates > 0)
+    return {
+        "vm_id": vm_ids[starts],
+        "prod_id": prod_ids[starts],
+        "stock": last_stocks,
+        "consumed": consumed,
+        "rate": rates,
+        "hours_to_empty": hours_to_empty,
+        "empty_at": time_stamps[ends] + hours_to_empty * 60 * 60,
+    }
+
+
+def get_default_forecast_since(
+    database_service: DatabaseService, until: datetime = None
+) -> datetime:
+    """Get the earliest time stamp of the stock records a forecast is made from by default.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        until (datetime): The time stamp before which stock records are included
+            (default is None)
+
+    Returns:
+        datetime: DEFAULT_FORECAST_WINDOW before the latest snapshot before until
+    """
+    session = database_service.get_read_session()()
+    latest = session.query(func.max(Snapshot.time_stamp))
+    if until is not None:
+        latest = latest.filter(Snapshot.time_stamp < until)
+    return (latest.scalar() or until or datetime.utcnow()) - DEFAULT_FORECAST_WINDOW
+
+
+def get_depletion_forecast(
+    database_service: DatabaseService,
+    vm_id: int = None,
+    prod_id: int = None,
+    since: datetime = None,
+    until: datetime = None,
+    columnar: bool = False,
+) -> list[dict] | dict:
+    """Get the consumption rate and the forecast depletion of every product stock.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        vm_id (int): An id of the interested vending machine
+            (default is None)
+        prod_id (int): An id of the interested product
+            (default is None)
+        since (datetime): The earliest time stamp of the stock records to include
+            (default is None, which means DEFAULT_FORECAST_WINDOW before the latest snapshot)
+        until (datetime): The time stamp before which stock records are included
+            (default is None)
+        columnar (bool): A flag to tell if the forecast is returned as one list for each key
+            with time stamps as epoch milliseconds (default is False)
+
+    Returns:
+        list | dict: A list of dictionaries of DEPLETION_FORECAST_KEYS, one for each product stock ordered by
+            vm_id and prod_id, or a dictionary of a list for each key, with None if nothing was consumed
+    """
+    if since is None:
+        since = get_default_forecast_since(database_service, until)
+    forecast = forecast_depletion(
+        load_stock_record_series(database_service, vm_id, prod_id, since, until)
+    )
+    columns = {
+        key: [None if np.isnan(value) else value for value in values.tolist()]
+        if values.dtype.kind == "f"
+        else values.tolist()
+        for key, values in forecast.items()
+    }
+    columns["empty_at"] = [
+        None if value is None else round(value * 1000) for value in columns["empty_at"]
+    ]
+    if columnar:
+        return columns
+    columns["empty_at"] = [
+        None if value is None else utils.EPOCH + timedelta(milliseconds=value)
+        for value in columns["empty_at"]
+    ]
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def get_restock_plan(
+    database_service: DatabaseService,
+    threshold: int = DEFAULT_RESTOCK_THRESHOLD,
+    target: int = DEFAULT_RESTOCK_TARGET,
+    hours: float = None,
+    location: str = None,
+) -> dict:
+    """Plan which product stocks of which vending machines to restock, grouped by location.
+
+    A product stock is restocked when its stock is below the threshold or, given a number of hours, when it
+    is forecast to be below the threshold by then at its consumption rate, and it is refilled up to the target.
+    A product stock forecast below the threshold but already at the target, e.g. one consumed quickly, has no
+    unit to load and is left out.
+    The product stocks of the whole fleet are read by a single query, which only returns the product stocks
+    that can be below the threshold by then even at the highest consumption rate of the fleet.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        threshold (int): The stock below which a product stock is restocked
+            (default is DEFAULT_RESTOCK_THRESHOLD)
+        target (int): The stock a product stock is refilled up to
+            (default is DEFAULT_RESTOCK_TARGET)
+        hours (float): A number of hours from now by which the product stocks are forecast to be below the
+            threshold (default is None, which means only the current stocks are compared)
+        location (str): The location of the interested vending machines
+            (default is None)
+
+    Returns:
+        dict: A dictionary of the locations (each with its vending machines, each with the product stocks to
+            restock and the units to load), the pick list of the units of each product and the total units
+
+    Raises:
+        ValueError: If the threshold is negative or more than the target, or the number of hours is negative
+    """
+    if not 0 <= threshold <= target:
+        raise ValueError(f"invalid threshold {threshold} and target {target}")
+    if hours is not None and hours < 0:
+        raise ValueError(f"invalid hours {hours}")
+    session = database_service.get_read_session()()
+    limit = threshold
+    if hours:
+        forecast = forecast_depletion(
+            load_stock_record_series(
+                database_service, since=get_default_forecast_since(database_service)
+            )
+        )
+        rates = np.nan_to_num(forecast["rate"])
+        # the forecast is ordered by vm_id and prod_id, so is this key
+        keys = forecast["vm_id"] << 32 | forecast["prod_id"]
+        limit = threshold + (rates.max(initial=0) * hours)
+    statement = (
+        select(
+            VendingMachine.location,
+            VendingMachine.id,
+            VendingMachine.name,
+            Stock.prod_id,
+            Product.name,
+            Stock.stock,
+        )
+        .join(VendingMachine, VendingMachine.id == Stock.vm_id)
+        .join(Product, Product.id == Stock.prod_id)
+        .filter(Stock.stock < limit)
+        .order_by(VendingMachine.location, VendingMachine.id, Stock.prod_id)
+    )
+    if location is not None:
+        statement = statement.filter(VendingMachine.location == location)
+    rows = session.connection().execute(statement).all()
+    if hours and rows:
+        row_keys = np.array([row[1] << 32 | row[3] for row in rows], dtype=np.int64)
+        indexes = np.minimum(np.searchsorted(keys, row_keys), max(len(keys) - 1, 0))
+        row_rates = np.zeros(len(rows))
+        if len(keys) > 0:
+            row_rates = np.where(keys[indexes] == row_keys, rates[indexes], 0)
+        stocks = np.array([row[5] for row in rows])
+        rows = [
+            row
+            for row, restock in zip(rows, stocks - row_rates * hours < threshold)
+            if restock
+        ]
+    locations = {}
+    pick_list = {}
+    for location, vm_id, vm_name, prod_id, prod_name, stock in rows:
+        units = max(target - stock, 0)
+        if units == 0:
+            continue
+        vending_machines = locations.setdefault(location, {})
+        vending_machine = vending_machines.setdefault(
+            vm_id, {"id": vm_id, "name": vm_name, "units": 0, "products": []}
+        )
+        vending_machine["units"] += units
+        vending_machine["products"].append(
+            {"prod_id": prod_id, "name": prod_name, "stock": stock, "units": units}
+        )
+        product = pick_list.setdefault(
+            prod_id, {"prod_id": prod_id, "name": prod_name, "units": 0}
+        )
+        product["units"] += units
+    return {
+        "locations": [
+            {
+                "location": location,
+                "units": sum(
+                    vending_machine["units"]
+                    for vending_machine in vending_machines.values()
+                ),
+                "vending_machines": list(vending_machines.values()),
+            }
+            for location, vending_machines in locations.items()
+        ],
+        "pick_list": sorted(pick_list.values(), key=itemgetter("prod_id")),
+        "units": sum(product["units"] for product in pick_list.values()),
+    }
@@ -4,11 +4,40 @@ This script allows the user to create and initialize database as well as
 interact with database.
 """
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import functools
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 from vmms_webapp.database import utils
+from vmms_webapp.fragment_cache import FragmentCache
+from vmms_webapp.metrics import COUNTER, GAUGE, MetricsRegistry
 from vmms_webapp.models.base import Base
+from vmms_webapp.query_stats import QueryStatsCollector
+from vmms_webapp.slow_query_log import SlowQueryLog
+from vmms_webapp.stock_record_archive import StockRecordArchive
+
+# sqlalchemy opens a new connection for every session of a database file by default, so its page cache and
+# memory map are lost between requests; the overflow is not limited as every thread serving a request
+# holds a connection until the end of the request
+DEFAULT_ENGINE_OPTIONS = {"poolclass": QueuePool, "pool_size": 5, "max_overflow": -1}
+# set on every new connection; in WAL mode readers do not wait for a writer, e.g. save_stock_records, and
+# commits only sync the log at checkpoints
+DEFAULT_SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    # a negative size is in KiB rather than in pages
+    "cache_size": -64 * 1024,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+# the pragmas of the primary which cannot be set by a read-only connection are left to the primary
+PRIMARY_SQLITE_PRAGMAS = ("journal_mode", "synchronous")
 
 
 class DatabaseService:
@@ -16,39 +45,245 @@ class DatabaseService:
 
     Attributes:
         uri (str): A path to database
-        session (sessionmaker): a session factory to create session for database connection
+        engine (Engine): the engine holding the database connection pool
+        session (scoped_session): a registry of the session of each thread, i.e. of each request
+        read_uri (str): A path to the database read by the get helpers, None if it is the database
+        read_engine (Engine): the engine holding the read-only connection pool, the engine if there is none
+        read_session (scoped_session): a registry of the read-only session of each thread, the session
+            registry if there is none
+        fragment_cache (FragmentCache): a cache of rendered fragments of vending machines
+        stock_record_archive (StockRecordArchive): an archive of old stock records, None if there is none
+        engine_options (dict): the keyword arguments of create_engine, None for the default ones
+        query_stats (QueryStatsCollector): a collector of the statements executed for each request
+        metrics (MetricsRegistry): a registry of the metrics of the app
+        slow_query_log (SlowQueryLog): a log of the statements slower than the slow query threshold
+        pragmas (dict): the pragmas set on every new connection of a SQLite database
     """
 
-    def __init__(self, uri: str, default_populate: bool = True) -> None:
+    def __init__(
+        self,
+        uri: str,
+        default_populate: bool = True,
+        fragment_cache_size: int = 1024,
+        archive_path: str = None,
+        engine_options: dict = None,
+        pragmas: dict = None,
+        read_uri: str = None,
+        metrics_dir: str = None,
+        slow_query_threshold: float = 0.1,
+        slow_query_log_size: int = 100,
+    ) -> None:
         """Initialize DatabaseService.
 
         Args:
             uri (str): A path to database
             default_populate (bool): A flag to tell if the database should be populate by the predefined data
                 (default is True)
+            fragment_cache_size (int): A maximum number of rendered fragments of vending machines to be cached
+                (default is 1024)
+            archive_path (str): A path to the directory of the archive of old stock records
+                (default is None, which means stock records are never archived)
+            engine_options (dict): The keyword arguments of create_engine, e.g. the pool size
+                (default is None, which means DEFAULT_ENGINE_OPTIONS for a database file)
+            pragmas (dict): The pragmas set on every new connection of a SQLite database
+                (default is None, which means DEFAULT_SQLITE_PRAGMAS)
+            read_uri (str): A path to a replica of the database or a read-only connection to it, e.g.
+                sqlite:///file:vending_machine.db?mode=ro&uri=true, read by the get helpers
+                (default is None, which means the get helpers read the database)
+            metrics_dir (str): A path to the directory in which the processes serving the database share
+                their metrics (default is None, which means the metrics of each process are its own)
+            slow_query_threshold (float): A minimum number of seconds for a statement to be logged with its
+                query plan (default is 0.1, None means no statement is logged)
+            slow_query_log_size (int): A maximum number of slow statements kept in the log
+                (default is 100)
         """
         self.uri = uri
+        self.engine = None
+        self.engine_options = engine_options
+        self.pragmas = DEFAULT_SQLITE_PRAGMAS if pragmas is None else pragmas
+        self.query_stats = QueryStatsCollector()
+        self.metrics = self.init_metrics(metrics_dir)
+        self.slow_query_log = SlowQueryLog(slow_query_threshold, slow_query_log_size)
+        self.fragment_cache = FragmentCache(fragment_cache_size)
+        self.stock_record_archive = None
+        if archive_path is not None:
+            self.stock_record_archive = StockRecordArchive(archive_path)
         self.session = self.init()
+        self.read_uri = read_uri
+        self.read_engine = self.engine
+        self.read_session = self.session
+        if read_uri is not None:
+            read_pragmas = {
+                name: value
+                for name, value in self.pragmas.items()
+                if name not in PRIMARY_SQLITE_PRAGMAS
+            }
+            self.read_engine = self.init_engine(
+                read_uri, {**read_pragmas, "query_only": "ON"}
+            )
+            self.read_session = scoped_session(sessionmaker(bind=self.read_engine))
+            # the objects read by a thread are refreshed once it commits, so it reads its own writes
+            event.listen(
+                self.session, "after_commit", lambda _: self.read_session.expire_all()
+            )
+        utils.populate_data_versions(self)
+        utils.populate_snapshots(self)
+        utils.populate_stock_rollups(self)
         if default_populate:
             utils.populate_products(self)
+        self.remove_sessions()
 
-    def init(self) -> sessionmaker:
-        """Initialize database and returns session factory.
+    def init(self) -> scoped_session:
+        """Initialize database and returns session registry.
 
         Returns:
-            sessionmaker: a session factory to create session for database connection
+            scoped_session: a registry of the session of each thread, i.e. of each request
         """
         try:
             # setup database
-            engine = create_engine(
-                self.get_uri(), connect_args={"check_same_thread": False}
-            )
+            self.engine = self.init_engine(self.get_uri(), self.pragmas)
             # create tables
-            Base.metadata.create_all(engine, checkfirst=True)
-            return sessionmaker(bind=engine)
+            Base.metadata.create_all(self.engine, checkfirst=True)
+            # add indexes and columns introduced after the tables of an existing database were created
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(self.engine, checkfirst=True)
+            columns = inspect(self.engine).get_columns("vending_machines")
+            if "version" not in [column["name"] for column in columns]:
+                with self.engine.begin() as connection:
+                    connection.execute(
+                        text(
+                            "ALTER TABLE vending_machines "
+                            "ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+                        )
+                    )
+            return scoped_session(sessionmaker(bind=self.engine))
         except Exception as e:
             print("init:", e)
 
+    def init_metrics(self, metrics_dir: str) -> MetricsRegistry:
+        """Create the registry of the metrics of the app and declare the metrics of the database.
+
+        Args:
+            metrics_dir (str): A path to the directory in which the processes share their metrics
+
+        Returns:
+            MetricsRegistry: a registry of the metrics of the app
+        """
+        metrics = MetricsRegistry(metrics_dir)
+        metrics.describe(
+            "vmms_db_pool_size", GAUGE, "Number of connections kept in the pool"
+        )
+        metrics.describe(
+            "vmms_db_pool_checked_out", GAUGE, "Number of connections in use"
+        )
+        metrics.describe(
+            "vmms_db_pool_overflow", GAUGE, "Number of connections above the pool size"
+        )
+        metrics.describe(
+            "vmms_fragment_cache_hits_total", COUNTER, "Fragment cache lookups found"
+        )
+        metrics.describe(
+            "vmms_fragment_cache_misses_total", COUNTER, "Fragment cache lookups missed"
+        )
+        metrics.describe(
+            "vmms_fragment_cache_evictions_total",
+            COUNTER,
+            "Fragments evicted from the full fragment cache",
+        )
+        metrics.describe(
+            "vmms_fragment_cache_size", GAUGE, "Number of cached fragments"
+        )
+        metrics.describe(
+            "vmms_snapshots_total", COUNTER, "Number of snapshots of the stocks saved"
+        )
+        metrics.describe(
+            "vmms_stock_records_saved_total",
+            COUNTER,
+            "Number of stock records written by the snapshots",
+        )
+        metrics.add_collector(self.collect_metrics)
+        return metrics
+
+    def collect_metrics(self) -> list:
+        """Read the current usage of the connection pools and of the fragment cache.
+
+        Returns:
+            list: The name, the labels and the value of each sample
+        """
+        samples = []
+        engines = {"primary": self.engine, "read": self.read_engine}
+        for name, engine in engines.items():
+            # only a queue pool keeps a number of connections, e.g. not the pool of an in-memory database
+            if engine is None or not isinstance(engine.pool, QueuePool):
+                continue
+            if name == "read" and engine is self.engine:
+                continue
+            labels = {"engine": name}
+            samples += [
+                ("vmms_db_pool_size", labels, engine.pool.size()),
+                ("vmms_db_pool_checked_out", labels, engine.pool.checkedout()),
+                ("vmms_db_pool_overflow", labels, max(engine.pool.overflow(), 0)),
+            ]
+        fragment_cache = self.fragment_cache
+        samples += [
+            ("vmms_fragment_cache_hits_total", {}, fragment_cache.hits),
+            ("vmms_fragment_cache_misses_total", {}, fragment_cache.misses),
+            ("vmms_fragment_cache_evictions_total", {}, fragment_cache.evictions),
+            ("vmms_fragment_cache_size", {}, len(fragment_cache.fragments)),
+        ]
+        return samples
+
+    def init_engine(self, uri: str, pragmas: dict) -> Engine:
+        """Create an engine with the engine options.
+
+        Args:
+            uri (str): A path to database
+            pragmas (dict): The pragmas set on every new connection of a SQLite database
+
+        Returns:
+            Engine: the engine holding the database connection pool
+        """
+        engine_options = self.engine_options
+        if engine_options is None:
+            # an in-memory database only lives as long as its connection, so its pool is left as it is
+            database = make_url(uri).database
+            engine_options = (
+                DEFAULT_ENGINE_OPTIONS if database and database != ":memory:" else {}
+            )
+        engine = create_engine(
+            uri,
+            **{
+                **engine_options,
+                "connect_args": {
+                    "check_same_thread": False,
+                    **engine_options.get("connect_args", {}),
+                },
+            },
+        )
+        if engine.dialect.name == "sqlite" and pragmas:
+            event.listen(
+                engine, "connect", functools.partial(self.set_pragmas, pragmas)
+            )
+        self.query_stats.instrument(engine)
+        self.slow_query_log.instrument(engine)
+        return engine
+
+    def set_pragmas(
+        self, pragmas: dict, dbapi_connection: object, connection_record: object
+    ) -> None:
+        """Set the pragmas on a new connection.
+
+        Args:
+            pragmas (dict): The pragmas to set
+            dbapi_connection (object): The connection of the database driver
+            connection_record (object): The record of the connection in the pool
+        """
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
     def get_uri(self) -> str:
         """Get the database uri.
 
@@ -57,10 +292,109 @@ class DatabaseService:
         """
         return self.uri
 
-    def get_session(self) -> sessionmaker:
-        """Get the database session maker.
+    def get_read_uri(self) -> str:
+        """Get the uri of the database read by the get helpers.
+
+        Returns:
+            str: The read-only database uri, None if the get helpers read the database
+        """
+        return self.read_uri
+
+    def get_engine(self) -> Engine:
+        """Get the database engine.
+
+        Returns:
+            Engine: the engine holding the database connection pool
+        """
+        return self.engine
+
+    def get_read_engine(self) -> Engine:
+        """Get the engine of the database read by the get helpers.
 
         Returns:
-            sessionmaker: a session factory to create session for database connection
+            Engine: the engine holding the read-only connection pool, the engine if there is none
+        """
+        return self.read_engine
+
+    def get_query_stats(self) -> QueryStatsCollector:
+        """Get the collector of the statements executed for each request.
+
+        Returns:
+            QueryStatsCollector: a collector of the statements executed for each request
+        """
+        return self.query_stats
+
+    def get_slow_query_log(self) -> SlowQueryLog:
+        """Get the log of the statements slower than the slow query threshold.
+
+        Returns:
+            SlowQueryLog: a log of the slow statements with their query plans
+        """
+        return self.slow_query_log
+
+    def get_metrics(self) -> MetricsRegistry:
+        """Get the registry of the metrics of the app.
+
+        Returns:
+            MetricsRegistry: a registry of the metrics of the app
+        """
+        return self.metrics
+
+    def get_fragment_cache(self) -> FragmentCache:
+        """Get the cache of rendered fragments of vending machines.
+
+        Returns:
+            FragmentCache: a cache of rendered fragments of vending machines
+        """
+        return self.fragment_cache
+
+    def get_stock_record_archive(self) -> StockRecordArchive:
+        """Get the archive of old stock records.
+
+        Returns:
+            StockRecordArchive: an archive of old stock records, None if there is none
+        """
+        return self.stock_record_archive
+
+    def get_session(self) -> scoped_session:
+        """Get the database session registry.
+
+        Calling the registry returns the session of the current thread, which is shared by every helper
+        until it is removed, e.g. at the end of a request.
+
+        Returns:
+            scoped_session: a registry of the session of each thread, i.e. of each request
         """
         return self.session
+
+    def get_read_session(self) -> scoped_session:
+        """Get the read-only session registry used by the get helpers.
+
+        Returns:
+            scoped_session: a registry of the read-only session of each thread, the session registry if there
+                is no read-only database
+        """
+        return self.read_session
+
+    def remove_sessions(self) -> None:
+        """Close the sessions of the current thread, e.g. at the end of a request."""
+        self.session.remove()
+        self.read_session.remove()
+
+    @contextmanager
+    def begin(self) -> Iterator[Session]:
+        """Run a block in the transaction of the session of the current thread.
+
+        The transaction is committed at the end of the block, including the changes made earlier in the
+        session, or rolled back if the block raises.
+
+        Yields:
+            Session: The session of the current thread
+        """
+        session = self.session()
+        try:
+            yield session
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
@@ -5,22 +5,107 @@ This script contains a collection of helper functions.
 
 from __future__ import annotations
 
+import base64
+import heapq
+import json
 import os
-from datetime import datetime
-from typing import TYPE_CHECKING
+import re
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from operator import attrgetter, itemgetter
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
 
 from flask import Request
+from sqlalchemy import (
+    INTEGER,
+    Column,
+    DateTime,
+    and_,
+    bindparam,
+    case,
+    cast,
+    delete,
+    false,
+    func,
+    insert,
+    literal,
+    null,
+    or_,
+    select,
+    true,
+    tuple_,
+)
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql import ColumnElement, Select, Subquery
 
+from vmms_webapp.models.data_version import DataVersion
+from vmms_webapp.models.last_stock_record import LastStockRecord
+from vmms_webapp.models.lease import Lease
 from vmms_webapp.models.product import Product
+from vmms_webapp.models.snapshot import Snapshot
 from vmms_webapp.models.stock import Stock
 from vmms_webapp.models.stock_record import StockRecord
+from vmms_webapp.models.stock_rollup import (
+    DailyStockRollup,
+    HourlyStockRollup,
+    StockRollup,
+)
 from vmms_webapp.models.vending_machine import VendingMachine
 
 if TYPE_CHECKING:
     from vmms_webapp.database.database_service import DatabaseService
+    from vmms_webapp.stock_record_archive import StockRecordArchive
 
 DATABASE_PATH = f"sqlite:///{str(os.path.join(os.path.abspath(os.path.dirname(__file__)), 'vending_machine.db'))}"
+ARCHIVE_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "archive")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_STOCK_RECORD_PAGE_SIZE = 10000
+STREAM_BATCH_SIZE = 1000
+# widths of the buckets of downsampled timelines, e.g. 5m, 1h or 1d
+BUCKET_PATTERN = re.compile(r"([1-9][0-9]*)([smhd])")
+BUCKET_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+STOCK_RECORD_KEYS = ["time_stamp", "vm_id", "prod_id", "stock"]
+STOCK_RECORD_BUCKET_KEYS = [
+    "time_stamp",
+    "vm_id",
+    "prod_id",
+    "count",
+    "min",
+    "max",
+    "first",
+    "last",
+    "avg",
+]
+EPOCH = datetime(1970, 1, 1)
+# names of the data versions, one for each group of tables that change together
+VENDING_MACHINES_DATA = "vending_machines"
+STOCK_RECORDS_DATA = "stock_records"
+# the vending machines are stamped with the version of their data, which is never reused unlike their ids
+VENDING_MACHINES_VERSION = (
+    select(DataVersion.version)
+    .where(DataVersion.name == VENDING_MACHINES_DATA)
+    .scalar_subquery()
+)
+# the rollups of stock records, by the name of their period
+STOCK_ROLLUPS = {"hourly": HourlyStockRollup, "daily": DailyStockRollup}
+# the statements of the lookups made by almost every request are built once with bound parameters, so a call
+# neither builds a query nor computes its cache key, and the compiled sql is found in the cache of the engine
+VENDING_MACHINE_BY_ID = (
+    select(VendingMachine).where(VendingMachine.id == bindparam("vm_id")).limit(1)
+)
+STOCK_BY_VM_ID_AND_PROD_ID = (
+    select(Stock)
+    .where(Stock.vm_id == bindparam("vm_id"), Stock.prod_id == bindparam("prod_id"))
+    .limit(1)
+)
+STOCKS_BY_VM_ID = (
+    select(Stock.prod_id, Product.name, Product.price, Stock.stock)
+    .join(Product, Product.id == Stock.prod_id, isouter=True)
+    .where(Stock.vm_id == bindparam("vm_id"))
+)
 
 
 def populate_products(database_service: DatabaseService) -> None:
@@ -30,19 +115,221 @@ def populate_products(database_service: DatabaseService) -> None:
         database_service (DatabaseService): The object used to interact with database
     """
     try:
-        with database_service.get_session().begin() as session:
+        with database_service.begin() as session:
             products = [
                 Product(id=1, name="taro", price=20.0),
                 Product(id=2, name="pringle", price=30.0),
                 Product(id=3, name="lay's", price=50.0),
             ]
             session.add_all(products)
+            bump_data_version(session, VENDING_MACHINES_DATA)
     except IntegrityError:
         pass
     except Exception as e:
         print("populate_products:", e)
 
 
+def populate_data_versions(database_service: DatabaseService) -> None:
+    """Populate database with the data versions that do not exist yet.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+    """
+    try:
+        with database_service.begin() as session:
+            existing_names = [name for name, in session.query(DataVersion.name).all()]
+            session.add_all(
+                [
+                    DataVersion(name)
+                    for name in (VENDING_MACHINES_DATA, STOCK_RECORDS_DATA)
+                    if name not in existing_names
+                ]
+            )
+    except IntegrityError:
+        pass
+    except Exception as e:
+        print("populate_data_versions:", e)
+
+
+def populate_snapshots(database_service: DatabaseService) -> None:
+    """Populate database with the snapshots of the stock records recorded before snapshots existed.
+
+    Every distinct time stamp of the stock records becomes a full snapshot and the stocks of the latest one
+    become the last stock records.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+    """
+    try:
+        with database_service.begin() as session:
+            if session.query(Snapshot.time_stamp).first() is not None:
+                return
+            session.execute(
+                insert(Snapshot).from_select(
+                    ["time_stamp", "base", "delta"],
+                    select(
+                        StockRecord.time_stamp,
+                        StockRecord.time_stamp.label("base"),
+                        false(),
+                    ).distinct(),
+                )
+            )
+            session.execute(
+                insert(LastStockRecord).from_select(
+                    ["vm_id", "prod_id", "stock"],
+                    select(
+                        StockRecord.vm_id, StockRecord.prod_id, StockRecord.stock
+                    ).filter(
+                        StockRecord.time_stamp
+                        == select(func.max(StockRecord.time_stamp)).scalar_subquery()
+                    ),
+                )
+            )
+    except Exception as e:
+        print("populate_snapshots:", e)
+
+
+def populate_stock_rollups(database_service: DatabaseService) -> None:
+    """Populate database with the rollups of the stock records recorded before rollups existed.
+
+    The stock records are replayed snapshot by snapshot as save_stock_records would have rolled them up.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+    """
+    try:
+        session = database_service.get_session()()
+        if session.query(Snapshot.time_stamp).first() is None or any(
+            session.query(model.time_stamp).first() is not None
+            for model in STOCK_ROLLUPS.values()
+        ):
+            return
+        rollups = {}
+        previous_stocks = {}
+        stocks = {}
+        time_stamp = None
+        for stock_records in iter_stock_record_batches(database_service):
+            for stock_record in stock_records:
+                if stock_record["time_stamp"] != time_stamp:
+                    previous_stocks, stocks = stocks, {}
+                    time_stamp = stock_record["time_stamp"]
+                key = (stock_record["vm_id"], stock_record["prod_id"])
+                stock = stocks[key] = stock_record["stock"]
+                consumed = get_consumed_units(previous_stocks.get(key), stock)
+                for model in STOCK_ROLLUPS.values():
+                    rollup_key = (model, model.truncate(time_stamp), *key)
+                    if rollup_key in rollups:
+                        rollups[rollup_key].add(stock, consumed)
+                    else:
+                        rollups[rollup_key] = model(*rollup_key[1:], stock, consumed)
+        with database_service.begin() as session:
+            session.add_all(rollups.values())
+    except Exception as e:
+        print("populate_stock_rollups:", e)
+
+
+def get_data_version(database_service: DatabaseService, name: str) -> int:
+    """Get the current version of a group of tables.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        name (str): A name of the group of tables, e.g. VENDING_MACHINES_DATA
+
+    Returns:
+        int: The version which is increased whenever the group of tables changes
+    """
+    session = database_service.get_read_session()()
+    return session.query(DataVersion.version).filter(DataVersion.name == name).scalar()
+
+
+def bump_data_version(session: Session, name: str) -> None:
+    """Increase the version of a group of tables.
+
+    The version is increased within the given session, so it is committed together with the change it marks.
+
+    Args:
+        session (Session): The session in which the group of tables is changed
+        name (str): A name of the group of tables, e.g. VENDING_MACHINES_DATA
+    """
+    session.query(DataVersion).filter(DataVersion.name == name).update(
+        {DataVersion.version: DataVersion.version + 1}, synchronize_session=False
+    )
+
+
+def acquire_lease(
+    database_service: DatabaseService,
+    name: str,
+    owner: str,
+    duration: timedelta,
+    now: datetime = None,
+) -> bool:
+    """Acquire the lease on a job unless it has not expired yet.
+
+    The lease is taken by a single conditional update, or by inserting it the first time, so only one of
+    the processes sharing the database acquires it until it expires again.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        name (str): A name of the job
+        owner (str): An identification of the process acquiring the lease
+        duration (timedelta): The time until the lease expires
+        now (datetime): The current time stamp
+            (default is None, which means datetime.utcnow())
+
+    Returns:
+        bool: True if the lease is acquired else False
+    """
+    now = now or datetime.utcnow()
+    try:
+        with database_service.begin() as session:
+            acquired = (
+                session.query(Lease)
+                .filter(Lease.name == name, Lease.expires_at <= now)
+                .update(
+                    {Lease.owner: owner, Lease.expires_at: now + duration},
+                    synchronize_session=False,
+                )
+            )
+            if acquired:
+                return True
+            if session.get(Lease, name) is not None:
+                return False
+            session.add(Lease(name, owner, now + duration))
+        return True
+    except IntegrityError:
+        # another process inserted the lease first
+        return False
+
+
+def renew_lease(
+    database_service: DatabaseService,
+    name: str,
+    owner: str,
+    duration: timedelta,
+    now: datetime = None,
+) -> bool:
+    """Extend the lease on a job held by an owner, e.g. while its run lasts longer than the lease.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        name (str): A name of the job
+        owner (str): An identification of the process holding the lease
+        duration (timedelta): The time from now until the lease expires
+        now (datetime): The current time stamp
+            (default is None, which means datetime.utcnow())
+
+    Returns:
+        bool: True if the lease is renewed, False if it is held by another owner
+    """
+    now = now or datetime.utcnow()
+    with database_service.begin() as session:
+        return bool(
+            session.query(Lease)
+            .filter(Lease.name == name, Lease.owner == owner)
+            .update({Lease.expires_at: now + duration}, synchronize_session=False)
+        )
+
+
 def get_vending_machines(database_service: DatabaseService) -> list[VendingMachine]:
     """Get all vending machines in vending_machines table.
 
@@ -52,10 +339,53 @@ def get_vending_machines(database_service: DatabaseService) -> list[VendingMachi
     Returns:
          list: A list of all vending machines in vending_machines table
     """
-    session = database_service.get_session()()
+    session = database_service.get_read_session()()
     return session.query(VendingMachine).all()
 
 
+def get_vending_machines_page(
+    database_service: DatabaseService,
+    after_id: int = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    name: str = None,
+    location: str = None,
+) -> tuple[list[VendingMachine], int]:
+    """Get a page of vending machines ordered by id.
+
+    The page starts right after the vending machine after_id, so the database walks the primary key index
+    instead of loading the whole vending_machines table.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        after_id (int): An id of the last vending machine of the previous page
+            (default is None, which means the first page)
+        limit (int): A maximum number of vending machines in the page
+            (default is DEFAULT_PAGE_SIZE)
+        name (str): A text that the names of the vending machines must contain
+            (default is None)
+        location (str): A text that the locations of the vending machines must contain
+            (default is None)
+
+    Returns:
+        tuple: A list of vending machines in the page and the cursor of the next page (None if it is the last page)
+    """
+    session = database_service.get_read_session()()
+    query = session.query(VendingMachine)
+    if after_id is not None:
+        query = query.filter(VendingMachine.id > after_id)
+    if name:
+        query = query.filter(VendingMachine.name.contains(name, autoescape=True))
+    if location:
+        query = query.filter(
+            VendingMachine.location.contains(location, autoescape=True)
+        )
+    vending_machines = query.order_by(VendingMachine.id).limit(limit + 1).all()
+    if len(vending_machines) > limit:
+        vending_machines = vending_machines[:limit]
+        return vending_machines, vending_machines[-1].id
+    return vending_machines, None
+
+
 def get_products(database_service: DatabaseService) -> list[Product]:
     """Get all products in products table.
 
@@ -65,7 +395,7 @@ def get_products(database_service: DatabaseService) -> list[Product]:
     Returns:
         list: A list of all products in products table
     """
-    session = database_service.get_session()()
+    session = database_service.get_read_session()()
     return session.query(Product).all()
 
 
@@ -78,10 +408,838 @@ def get_stock_records(database_service: DatabaseService) -> list[StockRecord]:
     Returns:
         list: A list of all stock records in stock_records table
     """
-    session = database_service.get_session()()
+    session = database_service.get_read_session()()
     return session.query(StockRecord).all()
 
 
+def get_stock_record_order(vm_id: int = None, prod_id: int = None) -> list[Column]:
+    """Get the columns by which stock records are ordered.
+
+    The stock records of a vending machine are ordered by product and time stamp, the ones of a product are
+    ordered by vending machine and time stamp, and all the other ones are ordered by time stamp.
+
+    Args:
+        vm_id (int): An id of the interested vending machine
+            (default is None)
+        prod_id (int): An id of the interested product
+            (default is None)
+
+    Returns:
+        list: A list of columns that uniquely identify a stock record in order
+    """
+    if vm_id is not None:
+        return [StockRecord.vm_id, StockRecord.prod_id, StockRecord.time_stamp]
+    if prod_id is not None:
+        return [StockRecord.prod_id, StockRecord.vm_id, StockRecord.time_stamp]
+    return [StockRecord.time_stamp, StockRecord.vm_id, StockRecord.prod_id]
+
+
+def has_delta_snapshots(database_service: DatabaseService) -> bool:
+    """Check if any stock records are recorded as a delta snapshot.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+
+    Returns:
+        bool: True if there is a delta snapshot else False
+    """
+    session = database_service.get_read_session()()
+    return session.query(Snapshot.time_stamp).filter(Snapshot.delta).first() is not None
+
+
+def select_stock_record_series(
+    vm_id: int = None,
+    prod_id: int = None,
+    since: datetime = None,
+    until: datetime = None,
+) -> Subquery:
+    """Create a subquery reconstructing the stock records at every snapshot.
+
+    The stock of a product in a vending machine at a snapshot is the latest stock record at or before the
+    snapshot and not before its base, which is null if there is none or if the product was removed.
+
+    Args:
+        vm_id (int): An id of the interested vending machine
+            (default is None)
+        prod_id (int): An id of the interested product
+            (default is None)
+        since (datetime): The earliest snapshot to include
+            (default is None)
+        until (datetime): The snapshot before which snapshots are included
+            (default is None)
+
+    Returns:
+        Subquery: A subquery of the time stamp, the vm_id, the prod_id and the stock at every snapshot
+    """
+    pairs = select(StockRecord.vm_id, StockRecord.prod_id).distinct()
+    if vm_id is not None:
+        pairs = pairs.filter(StockRecord.vm_id == vm_id)
+    if prod_id is not None:
+        pairs = pairs.filter(StockRecord.prod_id == prod_id)
+    # a product stock at a snapshot has a stock record between the base and the snapshot
+    if since is not None:
+        pairs = pairs.filter(
+            StockRecord.time_stamp
+            >= select(func.min(Snapshot.base))
+            .filter(Snapshot.time_stamp >= since)
+            .scalar_subquery()
+        )
+    if until is not None:
+        pairs = pairs.filter(StockRecord.time_stamp < until)
+    pairs = pairs.subquery("pairs")
+    stock_record = aliased(StockRecord, name="stock_record")
+    stock = (
+        select(stock_record.stock)
+        .filter(
+            stock_record.vm_id == pairs.c.vm_id,
+            stock_record.prod_id == pairs.c.prod_id,
+            stock_record.time_stamp <= Snapshot.time_stamp,
+            stock_record.time_stamp >= Snapshot.base,
+        )
+        .order_by(stock_record.time_stamp.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    # every product stock at every snapshot
+    statement = select(
+        Snapshot.time_stamp, pairs.c.vm_id, pairs.c.prod_id, stock.label("stock")
+    ).join(pairs, true())
+    if since is not None:
+        statement = statement.filter(Snapshot.time_stamp >= since)
+    if until is not None:
+        statement = statement.filter(Snapshot.time_stamp < until)
+    return statement.subquery("stock_record_series")
+
+
+def select_stock_records(
+    *entities: object,
+    vm_id: int = None,
+    prod_id: int = None,
+    since: datetime = None,
+    until: datetime = None,
+    cursor: dict = None,
+    series: bool = False,
+) -> Select:
+    """Create an ordered statement selecting stock records.
+
+    Args:
+        entities (object): The StockRecord entity or its columns to select
+        vm_id (int): An id of the interested vending machine
+            (default is None)
+        prod_id (int): An id of the interested product
+            (default is None)
+        since (datetime): The earliest time stamp to include
+            (default is None)
+        until (datetime): The time stamp before which stock records are included
+            (default is None)
+        cursor (dict): The key of the last stock record of the previous page as decoded by decode_stock_record_cursor
+            (default is None)
+        series (bool): A flag to tell if the stock records are reconstructed at every snapshot by
+            select_stock_record_series instead of read as recorded, which is needed once there are delta snapshots
+            (default is False)
+
+    Returns:
+        Select: A statement selecting the stock records in the order of get_stock_record_order
+    """
+    stock_record = StockRecord
+    if series:
+        stock_record = aliased(
+            StockRecord,
+            select_stock_record_series(vm_id, prod_id, since, until),
+            adapt_on_names=True,
+        )
+    entities = [
+        stock_record if entity is StockRecord else getattr(stock_record, entity.key)
+        for entity in entities
+    ]
+    order = [
+        getattr(stock_record, column.key)
+        for column in get_stock_record_order(vm_id, prod_id)
+    ]
+    statement = select(*entities).order_by(*order)
+    if series:
+        statement = statement.filter(stock_record.stock.isnot(None))
+    if vm_id is not None:
+        statement = statement.filter(stock_record.vm_id == vm_id)
+    if prod_id is not None:
+        statement = statement.filter(stock_record.prod_id == prod_id)
+    if since is not None:
+        statement = statement.filter(stock_record.time_stamp >= since)
+    if until is not None:
+        statement = statement.filter(stock_record.time_stamp < until)
+    if cursor is not None:
+        statement = statement.filter(
+            tuple_(*order) > tuple_(*[cursor[column.key] for column in order])
+        )
+    return statement
+
+
+def encode_stock_record_cursor(stock_record: StockRecord) -> str:
+    """Encode the key of a stock record into a cursor.
+
+    Args:
+        stock_record (StockRecord): The last stock record of a page, or a row with the same key columns
+
+    Returns:
+        str: An opaque cursor to get the next page
+    """
+    key = [
+        stock_record.time_stamp.isoformat(),
+        stock_record.vm_id,
+        stock_record.prod_id,
+    ]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_stock_record_cursor(cursor: str) -> dict:
+    """Decode a cursor created by encode_stock_record_cursor.
+
+    Args:
+        cursor (str): An opaque cursor to get the next page
+
+    Returns:
+        dict: A dictionary of the time stamp, the vm_id and the prod_id of the last stock record of a page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        time_stamp, vm_id, prod_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return {
+            "time_stamp": datetime.fromisoformat(time_stamp),
+            "vm_id": int(vm_id),
+            "prod_id": int(prod_id),
+        }
+    except Exception as e:
+        raise ValueError(f"invalid cursor {cursor}") from e
+
+
+def split_archived_stock_records(
+    database_service: DatabaseService, since: datetime = None
+) -> tuple[StockRecordArchive, datetime]:
+    """Split the stock records since a time stamp into the archived ones and the ones in the database.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        since (datetime): The earliest time stamp to include
+            (default is None)
+
+    Returns:
+        tuple: The archive of the stock records before the time stamp it is complete until (None if nothing is
+            archived) and the earliest time stamp of the stock records to read from the database
+    """
+    archive = database_service.get_stock_record_archive()
+    archive_until = None if archive is None else archive.get_until()
+    if archive_until is None:
+        return None, since
+    return archive, archive_until if since is None else max(since, archive_until)
+
+
+def to_stock_record(row: tuple) -> StockRecord:
+    """Convert a row of the time stamp, the vm_id, the prod_id and the stock into a stock record.
+
+    Args:
+        row (tuple): A row with the columns of STOCK_RECORD_KEYS
+
+    Returns:
+        StockRecord: A stock record which is not added to any session
+    """
+    time_stamp, vm_id, prod_id, stock = row
+    return StockRecord(vm_id, prod_id, stock, time_stamp)
+
+
+def merge_stock_records(
+    archived: Iterable, stock_records: Iterable, key: Callable, limit: int = None
+) -> list:
+    """Merge archived stock records with the ones in the database, both in the same order.
+
+    Args:
+        archived (Iterable): The archived stock records
+        stock_records (Iterable): The stock records in the database
+        key (Callable): A function returning the key by which both are ordered
+        limit (int): A maximum number of stock records
+            (default is None)
+
+    Returns:
+        list: A list of the first stock records of both in the order
+    """
+    return list(islice(heapq.merge(archived, stock_records, key=key), limit))
+
+
+def get_stock_records_page(
+    database_service: DatabaseService,
+    vm_id: int = None,
+    prod_id: int = None,
+    since: datetime = None,
+    until: datetime = None,
+    limit: int = None,
+    cursor: dict = None,
+) -> tuple[list[StockRecord], str]:
+    """Get a page of stock records.
+
+    The filters and the page are applied by the database, which walks the stock records in the order of
+    get_stock_record_order starting right after the cursor. The archived stock records are merged in.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        vm_id (int): An id of the interested vending machine
+            (default is None)
+        prod_id (int): An id of the interested product
+            (default is None)
+        since (datetime): The earliest time stamp to include
+            (default is None)
+        until (datetime): The time stamp before which stock records are included
+            (default is None)
+        limit (int): A maximum number of stock records in the page
+            (default is None, which means all stock records after the cursor)
+        cursor (dict): The key of the last stock record of the previous page as decoded by decode_stock_record_cursor
+            (default is None, which means the first page)
+
+    Returns:
+        tuple: A list of stock records in the page and the cursor of the next page (None if it is the last page)
+    """
+    session = database_service.get_read_session()()
+    archive, live_since = split_archived_stock_records(database_service, since)
+    statement = select_stock_records(
+        StockRecord,
+        vm_id=vm_id,
+        prod_id=prod_id,
+        since=live_since,
+        until=until,
+        cursor=cursor,
+        series=has_delta_snapshots(database_service),
+    )
+    size = None if limit is None else limit + 1
+    stock_records = session.execute(statement.limit(size)).scalars().all()
+    if archive is not None:
+        order = [column.key for column in get_stock_record_order(vm_id, prod_id)]
+        archived = archive.select(vm_id, prod_id, since, until, cursor, order, size)
+        stock_records = merge_stock_records(
+            map(to_stock_record, archived.tolist()),
+            stock_records,
+            attrgetter(*order),
+            size,
+        )
+    if limit is not None and len(stock_records) > limit:
+        stock_records = stock_records[:limit]
+        return stock_records, encode_stock_record_cursor(stock_records[-1])
+    return stock_records, None
+
+
+def to_epoch_milliseconds(time_stamp: datetime) -> int:
+    """Convert a time stamp in UTC to milliseconds since the Unix epoch.
+
+    Args:
+        time_stamp (datetime): A naive time stamp in UTC
+
+    Returns:
+        int: The number of milliseconds since the Unix epoch
+    """
+    return (time_stamp - EPOCH) // timedelta(milliseconds=1)
+
+
+def to_columns(rows: list[dict], keys: list[str]) -> dict:
+    """Convert rows into parallel arrays, one for each column.
+
+    Args:
+        rows (list): A list of dictionaries representing rows
+        keys (list): The keys of the columns
+
+    Returns:
+        dict: A dictionary of a list of values for each key, with time stamps as epoch milliseconds
+    """
+    columns = {key: [row[key] for row in rows] for key in keys}
+    if "time_stamp" in columns:
+        columns["time_stamp"] = list(map(to_epoch_milliseconds, columns["time_stamp"]))
+    return columns
+
+
+def get_stock_record_columns_page(
+    database_service: DatabaseService,
+    vm_id: int = None,
+    prod_id: int = None,
+    since: datetime = None,
+    until: datetime = None,
+    limit: int = None,
+    cursor: dict = None,
+) -> tuple[dict, str]:
+    """Get a page of stock records as parallel arrays, one for each column.
+
+    This is the columnar version of get_stock_records_page, the columns are built from the rows
+    without creating StockRecord objects.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        vm_id (int): An id of the interested vending machine
+            (default is None)
+        prod_id (int): An id of the interested product
+            (default is None)
+        since (datetime): The earliest time stamp to include
+            (default is None)
+        until (datetime): The time stamp before which stock records are included
+            (default is None)
+        limit (int): A maximum number of stock records in the page
+            (default is None, which means all stock records after the cursor)
+        cursor (dict): The key of the last stock record of the previous page as decoded by decode_stock_record_cursor
+            (default is None, which means the first page)
+
+    Returns:
+        tuple: A dictionary of the time stamps (as epoch milliseconds), the vm_ids, the prod_ids and the stocks
+            in the page, and the cursor of the next page (None if it is the last page)
+    """
+    session = database_service.get_read_session()()
+    archive, live_since = split_archived_stock_records(database_service, since)
+    statement = select_stock_records(
+        StockRecord.time_stamp,
+        StockRecord.vm_id,
+        StockRecord.prod_id,
+        StockRecord.stock,
+        vm_id=vm_id,
+        prod_id=prod_id,
+        since=live_since,
+        until=until,
+        cursor=cursor,
+        series=has_delta_snapshots(database_service),
+    )
+    size = None if limit is None else limit + 1
+    rows = session.execute(statement.limit(size)).all()
+    if archive is not None:
+        order = [column.key for column in get_stock_record_order(vm_id, prod_id)]
+        archived = archive.select(vm_id, prod_id, since, until, cursor, order, size)
+        rows = merge_stock_records(
+            archived.tolist(),
+            rows,
+            itemgetter(*map(STOCK_RECORD_KEYS.index, order)),
+            size,
+        )
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_stock_record_cursor(to_stock_record(rows[-1]))
+    time_stamps, vm_ids, prod_ids, stocks = zip(*rows) if rows else ((),) * 4
+    columns = {
+        "time_stamp": list(map(to_epoch_milliseconds, time_stamps)),
+        "vm_id": list(vm_ids),
+        "prod_id": list(prod_ids),
+        "stock": list(stocks),
+    }
+    return columns, next_cursor
+
+
+def iter_stock_record_batches(
+    database_service: DatabaseService,
+    batch_size: int = STREAM_BATCH_SIZE,
+    since: datetime = None,
+    until: datetime = None,
+    cursor: dict = None,
+) -> Iterator[list[dict]]:
+    """Iterate over all stock records in stock_records table in batches.
+
+    The rows are fetched from the database batch by batch without creating StockRecord objects,
+    so the memory used does not depend on the size of the table.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        batch_size (int): A number of stock records in each batch
+            (default is STREAM_BATCH_SIZE)
+        since (datetime): The earliest time stamp to include
+            (default is None)
+        until (datetime): The time stamp before which stock records are included
+            (default is None)
+        cursor (dict): The key of the last stock record already read as decoded by decode_stock_record_cursor
+            (default is None)
+
+    Yields:
+        list: A batch of dictionaries representing stock records, ordered by time stamp, vm_id and prod_id
+    """
+    session = database_service.get_read_session()()
+    archive, live_since = split_archived_stock_records(database_service, since)
+    statement = select_stock_records(
+        StockRecord.time_stamp,
+        StockRecord.vm_id,
+        StockRecord.prod_id,
+        StockRecord.stock,
+        since=live_since,
+        until=until,
+        cursor=cursor,
+        series=has_delta_snapshots(database_service),
+    ).execution_options(stream_results=True, yield_per=batch_size)
+    if archive is None:
+        for rows in session.execute(statement).partitions():
+            yield [dict(row._mapping) for row in rows]
+        return
+    # the archived stock records are read from the files month by month and batch by batch as well
+    rows = heapq.merge(
+        (
+            dict(zip(STOCK_RECORD_KEYS, row))
+            for records in archive.iter_batches(since, until, cursor, batch_size)
+            for row in records.tolist()
+        ),
+        (
+            dict(row._mapping)
+            for rows in session.execute(statement).partitions()
+            for row in rows
+        ),
+        key=itemgetter("time_stamp", "vm_id", "prod_id"),
+    )
+    yield from iter(lambda: list(islice(rows, batch_size)), [])
+
+
+def get_stock_records_at(
+    database_service: DatabaseService,
+    time_stamp: datetime,
+    vm_id: int = None,
+    prod_id: int = None,
+) -> list[StockRecord]:
+    """Get the stock records of the latest snapshot at or before a time stamp.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        time_stamp (datetime): The time stamp at which the stocks are interested
+        vm_id (int): An id of the interested vending machine
+            (default is None)
+        prod_id (int): An id of the interested product
+            (default is None)
+
+    Returns:
+        list: A list of stock records of every product stock at the snapshot, which is empty if there is none
+    """
+    session = database_service.get_read_session()()
+    archive, live_since = split_archived_stock_records(database_service)
+    snapshot_time_stamp = session.query(func.max(Snapshot.time_stamp)).filter(
+        Snapshot.time_stamp <= time_stamp
+    )
+    if live_since is not None:
+        snapshot_time_stamp = snapshot_time_stamp.filter(
+            Snapshot.time_stamp >= live_since
+        )
+    snapshot_time_stamp = snapshot_time_stamp.scalar()
+    if snapshot_time_stamp is None:
+        if archive is None:
+            return []
+        order = [column.key for column in get_stock_record_order(vm_id, prod_id)]
+        archived = archive.get_at(time_stamp, vm_id, prod_id, order)
+        return list(map(to_stock_record, archived.tolist()))
+    statement = select_stock_records(
+        StockRecord,
+        vm_id=vm_id,
+        prod_id=prod_id,
+        since=snapshot_time_stamp,
+        # time stamps have a resolution of a microsecond, so this is the only snapshot
+        until=snapshot_time_stamp + timedelta(microseconds=1),
+        series=True,
+    )
+    return session.execute(statement).scalars().all()
+
+
+def get_consumed_units(previous_stock: int, stock: int) -> int:
+    """Get the number of units consumed between two snapshots of a stock.
+
+    Args:
+        previous_stock (int): The stock at the previous snapshot, None if there was none
+        stock (int): The stock at the snapshot
+
+    Returns:
+        int: The decrease of the stock, which is 0 if the stock was refilled
+    """
+    if previous_stock is None:
+        return 0
+    return max(previous_stock - stock, 0)
+
+
+def is_stock_changed() -> ColumnElement:
+    """Build the condition under which a current stock differs from its last stock record.
+
+    It applies to the stocks outer joined with the last stock records, so a stock added since the previous
+    snapshot, which has no last stock record, is changed too.
+
+    Returns:
+        ColumnElement: The condition on the columns of the stocks and of the last stock records
+    """
+    stocks = Stock.__table__
+    last_stock_records = LastStockRecord.__table__
+    return or_(
+        last_stock_records.c.vm_id.is_(None),
+        last_stock_records.c.stock.is_distinct_from(stocks.c.stock),
+    )
+
+
+def update_stock_rollups(
+    session: Session, time_stamp: datetime, previous_time_stamp: datetime = None
+) -> None:
+    """Roll up the current stocks into the rollups of the periods containing a snapshot.
+
+    It runs before the last stock records are replaced by the current stocks, so the units consumed are
+    the decreases since the previous snapshot. The first snapshot of a period writes the rollup of every
+    stock, while a later one only selects the stocks that changed since the previous snapshot, so a
+    snapshot in which few stocks changed costs a few writes.
+
+    Args:
+        session (Session): The session in which the snapshot is recorded
+        time_stamp (datetime): A time stamp in which the stocks are recorded
+        previous_time_stamp (datetime): A time stamp of the previous snapshot
+            (default is None, which means every rollup is written)
+    """
+    stocks = Stock.__table__
+    last_stock_records = LastStockRecord.__table__
+    consumed = case(
+        (
+            last_stock_records.c.stock > stocks.c.stock,
+            last_stock_records.c.stock - stocks.c.stock,
+        ),
+        else_=0,
+    )
+    for model in STOCK_ROLLUPS.values():
+        rollups = model.__table__
+        selected = stocks.c.stock.is_not(None)
+        if previous_time_stamp is not None and model.truncate(
+            previous_time_stamp
+        ) == model.truncate(time_stamp):
+            # the rollups of the unchanged stocks already end with their stock
+            selected = and_(selected, is_stock_changed())
+        statement = sqlite.insert(rollups).from_select(
+            ["time_stamp", "vm_id", "prod_id", "min", "max", "last", "consumed"],
+            select(
+                literal(model.truncate(time_stamp), DateTime),
+                stocks.c.vm_id,
+                stocks.c.prod_id,
+                stocks.c.stock,
+                stocks.c.stock,
+                stocks.c.stock,
+                consumed,
+            )
+            .select_from(
+                stocks.outerjoin(
+                    last_stock_records,
+                    and_(
+                        last_stock_records.c.vm_id == stocks.c.vm_id,
+                        last_stock_records.c.prod_id == stocks.c.prod_id,
+                    ),
+                )
+            )
+            .where(selected),
+        )
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["time_stamp", "vm_id", "prod_id"],
+                set_={
+                    "min": func.min(rollups.c.min, statement.excluded.min),
+                    "max": func.max(rollups.c.max, statement.excluded.max),
+                    "last": statement.excluded.last,
+                    "consumed": rollups.c.consumed + statement.excluded.consumed,
+                },
+                where=rollups.c.last != statement.excluded.last,
+            )
+        )
+
+
+def get_stock_rollups(
+    database_service: DatabaseService,
+    model: type[StockRollup],
+    vm_id: int = None,
+    prod_id: int = None,
+    since: datetime = None,
+    until: datetime = None,
+) -> list[StockRollup]:
+    """Get the rollups of stock records.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        model (type): The rollup to get, e.g. HourlyStockRollup
+        vm_id (int): An id of the interested vending machine
+            (default is None)
+        prod_id (int): An id of the interested product
+            (default is None)
+        since (datetime): The earliest start of a period to include
+            (default is None)
+        until (datetime): The start of a period before which rollups are included
+            (default is None)
+
+    Returns:
+        list: A list of rollups in the order of get_stock_record_order
+    """
+    session = database_service.get_read_session()()
+    query = session.query(model).order_by(
+        *[
+            getattr(model, column.key)
+            for column in get_stock_record_order(vm_id, prod_id)
+        ]
+    )
+    if vm_id is not None:
+        query = query.filter(model.vm_id == vm_id)
+    if prod_id is not None:
+        query = query.filter(model.prod_id == prod_id)
+    if since is not None:
+        query = query.filter(model.time_stamp >= since)
+    if until is not None:
+        query = query.filter(model.time_stamp < until)
+    return query.all()
+
+
+def parse_bucket_width(bucket: str) -> int:
+    """Parse the width of a bucket such as 5m, 1h or 1d.
+
+    Args:
+        bucket (str): A positive number followed by s, m, h or d
+
+    Returns:
+        int: The width of the bucket in seconds
+
+    Raises:
+        ValueError: If the width is malformed
+    """
+    match = BUCKET_PATTERN.fullmatch(bucket.strip())
+    if match is None:
+        raise ValueError(f"invalid bucket {bucket}")
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+
+
+def get_stock_record_buckets(
+    database_service: DatabaseService,
+    width: int,
+    vm_id: int = None,
+    prod_id: int = None,
+    since: datetime = None,
+    until: datetime = None,
+) -> list[dict]:
+    """Get the stock records downsampled into buckets of time.
+
+    The time stamps are truncated to the start of their bucket (counted from the Unix epoch in UTC) and
+    the stock records are aggregated per vending machine, product and bucket by the database, so the
+    number of rows returned depends on the width of the buckets instead of the number of stock records.
+    The archived stock records are aggregated by the archive and merged in.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        width (int): The width of a bucket in seconds
+        vm_id (int): An id of the interested vending machine
+            (default is None)
+        prod_id (int): An id of the interested product
+            (default is None)
+        since (datetime): The earliest time stamp to include
+            (default is None)
+        until (datetime): The time stamp before which stock records are included
+            (default is None)
+
+    Returns:
+        list: A list of dictionaries of the start of the bucket, the vm_id, the prod_id, the number of stock
+            records and the min, max, first, last and avg stock, in the order of get_stock_record_order
+    """
+    session = database_service.get_read_session()()
+    archive, live_since = split_archived_stock_records(database_service, since)
+    rows = (
+        select_stock_records(
+            StockRecord.time_stamp,
+            StockRecord.vm_id,
+            StockRecord.prod_id,
+            StockRecord.stock,
+            vm_id=vm_id,
+            prod_id=prod_id,
+            since=live_since,
+            until=until,
+            series=has_delta_snapshots(database_service),
+        )
+        .order_by(None)
+        .subquery()
+    )
+    epoch = cast(func.strftime("%s", rows.c.time_stamp), INTEGER)
+    bucket = (epoch / width * width).label("bucket")
+    partition = [rows.c.vm_id, rows.c.prod_id, bucket]
+    records = select(
+        rows.c.vm_id,
+        rows.c.prod_id,
+        bucket,
+        rows.c.stock,
+        func.first_value(rows.c.stock)
+        .over(partition_by=partition, order_by=rows.c.time_stamp)
+        .label("first"),
+        func.first_value(rows.c.stock)
+        .over(partition_by=partition, order_by=rows.c.time_stamp.desc())
+        .label("last"),
+    ).subquery()
+    group = [records.c.vm_id, records.c.prod_id, records.c.bucket]
+    order = [
+        records.c.bucket if column.key == "time_stamp" else records.c[column.key]
+        for column in get_stock_record_order(vm_id, prod_id)
+    ]
+    statement = (
+        select(
+            *group,
+            func.count().label("count"),
+            func.min(records.c.stock).label("min"),
+            func.max(records.c.stock).label("max"),
+            func.min(records.c.first).label("first"),
+            func.min(records.c.last).label("last"),
+            func.avg(records.c.stock).label("avg"),
+        )
+        .group_by(*group)
+        .order_by(*order)
+    )
+    buckets = [
+        {
+            "time_stamp": datetime.fromtimestamp(row.bucket, timezone.utc).replace(
+                tzinfo=None
+            ),
+            "vm_id": row.vm_id,
+            "prod_id": row.prod_id,
+            "count": row.count,
+            "min": row.min,
+            "max": row.max,
+            "first": row.first,
+            "last": row.last,
+            "avg": row.avg,
+        }
+        for row in session.execute(statement)
+    ]
+    if archive is None:
+        return buckets
+    return merge_stock_record_buckets(
+        archive.get_buckets(width, vm_id, prod_id, since, until),
+        buckets,
+        [column.key for column in get_stock_record_order(vm_id, prod_id)],
+    )
+
+
+def merge_stock_record_buckets(
+    archived: list[dict], buckets: list[dict], order: list[str]
+) -> list[dict]:
+    """Merge buckets of archived stock records with the buckets of the stock records in the database.
+
+    A bucket with both archived stock records and stock records in the database is aggregated again,
+    the archived stock records being the earlier ones.
+
+    Args:
+        archived (list): A list of dictionaries representing the buckets of the archived stock records
+        buckets (list): A list of dictionaries representing the buckets of the stock records in the database
+        order (list): The keys by which the buckets are ordered
+
+    Returns:
+        list: A list of dictionaries representing the buckets of both in the order
+    """
+    merged = {
+        (bucket["time_stamp"], bucket["vm_id"], bucket["prod_id"]): bucket
+        for bucket in archived
+    }
+    for bucket in buckets:
+        key = (bucket["time_stamp"], bucket["vm_id"], bucket["prod_id"])
+        earlier = merged.get(key)
+        if earlier is not None:
+            count = earlier["count"] + bucket["count"]
+            bucket = {
+                **bucket,
+                "count": count,
+                "min": min(earlier["min"], bucket["min"]),
+                "max": max(earlier["max"], bucket["max"]),
+                "first": earlier["first"],
+                "avg": (
+                    earlier["avg"] * earlier["count"] + bucket["avg"] * bucket["count"]
+                )
+                / count,
+            }
+        merged[key] = bucket
+    return sorted(merged.values(), key=itemgetter(*order))
+
+
 def get_vending_machine_by_id(
     database_service: DatabaseService, vm_id: int
 ) -> VendingMachine:
@@ -94,8 +1252,8 @@ def get_vending_machine_by_id(
     Returns:
         VendingMachine: A vending machine with the specified id of vm_id
     """
-    session = database_service.get_session()()
-    return session.query(VendingMachine).filter(VendingMachine.id == vm_id).first()
+    session = database_service.get_read_session()()
+    return session.execute(VENDING_MACHINE_BY_ID, {"vm_id": vm_id}).scalar()
 
 
 def get_product_by_id(database_service: DatabaseService, prod_id: int) -> Product:
@@ -108,7 +1266,7 @@ def get_product_by_id(database_service: DatabaseService, prod_id: int) -> Produc
     Returns:
         Product: A product with the specified id of prod_id
     """
-    session = database_service.get_session()()
+    session = database_service.get_read_session()()
     return session.query(Product).filter(Product.id == prod_id).first()
 
 
@@ -122,10 +1280,10 @@ def get_stock_records_by_vm_id(
         vm_id (int): An id of the interested vending machine
 
     Returns:
-        list: A stock record list with the specified vm_id
+        list: A stock record list with the specified vm_id ordered by prod_id and time stamp
     """
-    session = database_service.get_session()()
-    return session.query(StockRecord).filter(StockRecord.vm_id == vm_id).all()
+    stock_records, _ = get_stock_records_page(database_service, vm_id=vm_id)
+    return stock_records
 
 
 def get_stock_records_by_prod_id(
@@ -138,10 +1296,10 @@ def get_stock_records_by_prod_id(
         prod_id (int): An id of the interested product
 
     Returns:
-        list: A stock record list with the specified prod_id
+        list: A stock record list with the specified prod_id ordered by vm_id and time stamp
     """
-    session = database_service.get_session()()
-    return session.query(StockRecord).filter(StockRecord.prod_id == prod_id).all()
+    stock_records, _ = get_stock_records_page(database_service, prod_id=prod_id)
+    return stock_records
 
 
 def get_stock_by_vm_id_and_prod_id(
@@ -157,12 +1315,10 @@ def get_stock_by_vm_id_and_prod_id(
     Returns:
         Stock: A vending machine with the specified ids of vm_id and prod_id.
     """
-    session = database_service.get_session()()
-    return (
-        session.query(Stock)
-        .filter(Stock.vm_id == vm_id, Stock.prod_id == prod_id)
-        .first()
-    )
+    session = database_service.get_read_session()()
+    return session.execute(
+        STOCK_BY_VM_ID_AND_PROD_ID, {"vm_id": vm_id, "prod_id": prod_id}
+    ).scalar()
 
 
 def get_product_choices_by_vm_id(
@@ -200,21 +1356,138 @@ def get_stocks_by_vm_id(
     Returns:
         dict: A dictionary mapping a product to its stock representing product stocks of the vending machine vm_id
     """
-    session = database_service.get_session()()
-    results = (
-        session.query(
-            Stock.vm_id, Stock.prod_id, Product.name, Product.price, Stock.stock
+    session = database_service.get_read_session()()
+    results = session.execute(STOCKS_BY_VM_ID, {"vm_id": vm_id})
+    return {
+        Product(prod_id, name, price): stock for prod_id, name, price, stock in results
+    }
+
+
+def get_vending_machines_with_stocks(
+    database_service: DatabaseService, vending_machines: list[VendingMachine] = None
+) -> list[tuple[VendingMachine, list[Product], dict[Product, int]]]:
+    """Get vending machines together with their product choices and product stocks.
+
+    The vending machines, the product stocks and the products are each fetched with a single query,
+    so the number of queries does not grow with the number of vending machines.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        vending_machines (list): The interested vending machines, e.g. a page of get_vending_machines_page
+            (default is None, which means all vending machines)
+
+    Returns:
+        list: A list of (vending machine, product choices, product stocks) tuples where the product choices
+            and the product stocks are the same as the ones of get_product_choices_by_vm_id and get_stocks_by_vm_id
+    """
+    session = database_service.get_read_session()()
+    query = session.query(
+        Stock.vm_id, Stock.prod_id, Product.name, Product.price, Stock.stock
+    ).join(Product, Product.id == Stock.prod_id, isouter=True)
+    if vending_machines is None:
+        vending_machines = (
+            session.query(VendingMachine).order_by(VendingMachine.id).all()
         )
-        .join(VendingMachine, VendingMachine.id == Stock.vm_id, isouter=True)
-        .join(Product, Product.id == Stock.prod_id, isouter=True)
-        .filter(Stock.vm_id == vm_id)
-        .all()
-    )
-    stocks = {}
+    else:
+        query = query.filter(
+            Stock.vm_id.in_(
+                [vending_machine.id for vending_machine in vending_machines]
+            )
+        )
+    all_products = session.query(Product).all()
+    results = query.order_by(Stock.vm_id, Stock.prod_id).all()
+    stocks_by_vm_id = {}
     for result in results:
-        _, prod_id, name, price, stock = result
-        stocks[Product(prod_id, name, price)] = stock
-    return stocks
+        vm_id, prod_id, name, price, stock = result
+        stocks_by_vm_id.setdefault(vm_id, {})[Product(prod_id, name, price)] = stock
+    vending_machines_with_stocks = []
+    for vending_machine in vending_machines:
+        stocks = stocks_by_vm_id.get(vending_machine.id, {})
+        product_choices = list(
+            filter(lambda product: product not in stocks, all_products)
+        )
+        vending_machines_with_stocks.append((vending_machine, product_choices, stocks))
+    return vending_machines_with_stocks
+
+
+def create_vending_machine_page_args_from_request(request: Request) -> dict:
+    """Create the keyword arguments of get_vending_machines_page from the query string of request.
+
+    Args:
+        request (Request): A request that from the client
+
+    Returns:
+        dict: A dictionary of after_id, limit, name and location
+    """
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    return {
+        "after_id": request.args.get("after", type=int),
+        "limit": min(max(limit, 1), MAX_PAGE_SIZE),
+        "name": request.args.get("name", "").strip(),
+        "location": request.args.get("location", "").strip(),
+    }
+
+
+def parse_time_stamp(time_stamp: str) -> datetime:
+    """Parse a time stamp in ISO 8601 format; a time stamp with a time zone is converted to UTC.
+
+    Args:
+        time_stamp (str): A time stamp in ISO 8601 format
+
+    Returns:
+        datetime: A naive time stamp in UTC
+
+    Raises:
+        ValueError: If the time stamp is malformed
+    """
+    parsed_time_stamp = datetime.fromisoformat(
+        time_stamp.strip().replace("Z", "+00:00")
+    )
+    if parsed_time_stamp.tzinfo is not None:
+        parsed_time_stamp = parsed_time_stamp.astimezone(timezone.utc).replace(
+            tzinfo=None
+        )
+    return parsed_time_stamp
+
+
+def create_stock_record_page_args_from_request(request: Request) -> dict:
+    """Create the keyword arguments of get_stock_records_page from the query string of request.
+
+    The time stamps since and until are in ISO 8601 format; time stamps with a time zone are converted to UTC.
+
+    Args:
+        request (Request): A request that from the client
+
+    Returns:
+        dict: A dictionary of since, until, limit and cursor
+
+    Raises:
+        ValueError: If a time stamp, the limit or the cursor is malformed
+    """
+    page_args = {"since": None, "until": None, "limit": None, "cursor": None}
+    for name in ("since", "until"):
+        if request.args.get(name):
+            page_args[name] = parse_time_stamp(request.args[name])
+    if request.args.get("limit"):
+        page_args["limit"] = min(
+            max(int(request.args["limit"]), 1), MAX_STOCK_RECORD_PAGE_SIZE
+        )
+    if request.args.get("cursor"):
+        page_args["cursor"] = decode_stock_record_cursor(request.args["cursor"])
+    return page_args
+
+
+def get_flag_from_request(request: Request, name: str) -> bool:
+    """Get a boolean flag from the query string of request.
+
+    Args:
+        request (Request): A request that from the client
+        name (str): A name of the flag
+
+    Returns:
+        bool: True if the flag is set to 1, true, yes or on else False
+    """
+    return request.args.get(name, "").strip().lower() in ("1", "true", "yes", "on")
 
 
 def create_vending_machine_from_request(request: Request) -> VendingMachine:
@@ -229,6 +1502,29 @@ def create_vending_machine_from_request(request: Request) -> VendingMachine:
     return VendingMachine(request.form["name"], request.form["location"])
 
 
+def invalidate_vending_machine(
+    database_service: DatabaseService, session: Session, vm_id: int
+) -> None:
+    """Increase the version of a vending machine and drop its cached fragment.
+
+    The version of the vending machines is increased and stamped on the vending machine within the given
+    session, so it is committed together with the change it marks. A vending machine added with the id of a
+    deleted one, which sqlite reuses, never has a version of the deleted one, so its fragment cached by another
+    process is never served.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        session (Session): The session in which the vending machine or its product stocks are changed
+        vm_id (int): An id of the interested vending machine
+    """
+    bump_data_version(session, VENDING_MACHINES_DATA)
+    session.query(VendingMachine).filter(VendingMachine.id == vm_id).update(
+        {VendingMachine.version: VENDING_MACHINES_VERSION},
+        synchronize_session=False,
+    )
+    database_service.get_fragment_cache().invalidate(vm_id)
+
+
 def add_vending_machine(
     database_service: DatabaseService, vending_machine: VendingMachine
 ) -> dict:
@@ -242,6 +1538,8 @@ def add_vending_machine(
         dict: A dictionary representing the response
     """
     session = database_service.get_session()()
+    bump_data_version(session, VENDING_MACHINES_DATA)
+    vending_machine.version = VENDING_MACHINES_VERSION
     session.add(vending_machine)
     session.commit()
     return {
@@ -270,6 +1568,7 @@ def update_vending_machine(
     )
     vending_machine.name = new_vending_machine.name
     vending_machine.location = new_vending_machine.location
+    invalidate_vending_machine(database_service, session, vm_id)
     session.commit()
     return {
         "status": "success",
@@ -294,6 +1593,8 @@ def delete_vending_machine(database_service: DatabaseService, vm_id: int) -> dic
     )
     session.delete(vending_machine)
     session.query(Stock).filter(Stock.vm_id == vending_machine.id).delete()
+    database_service.get_fragment_cache().invalidate(vm_id)
+    bump_data_version(session, VENDING_MACHINES_DATA)
     session.commit()
     return {
         "status": "success",
@@ -332,6 +1633,7 @@ def add_product_stock(database_service: DatabaseService, product_stock: Stock) -
     """
     session = database_service.get_session()()
     session.add(product_stock)
+    invalidate_vending_machine(database_service, session, product_stock.vm_id)
     session.commit()
     return {
         "status": "success",
@@ -362,6 +1664,7 @@ def update_product_stock(
         .first()
     )
     product_stock.stock = new_product_stock.stock
+    invalidate_vending_machine(database_service, session, product_stock.vm_id)
     session.commit()
     return {
         "status": "success",
@@ -391,6 +1694,7 @@ def delete_product_stock(
         .first()
     )
     session.delete(product_stock)
+    invalidate_vending_machine(database_service, session, vm_id)
     session.commit()
     return {
         "status": "success",
@@ -400,33 +1704,141 @@ def delete_product_stock(
     }
 
 
-def save_stock_records(database_service: DatabaseService) -> dict:
+def save_stock_records(
+    database_service: DatabaseService,
+    delta: bool = False,
+    time_stamp: datetime = None,
+    echo: bool = False,
+) -> dict:
     """Record current stocks.
 
+    The stocks are copied into the stock records by INSERT ... SELECT statements, so none of them is loaded
+    into the app unless they are echoed.
+
+    A delta snapshot only records the stocks that changed since the previous snapshot, with a null stock
+    for a product stock that was removed; it falls back to a full snapshot if there is no previous snapshot.
+
     Args:
         database_service (DatabaseService): The object used to interact with database
+        delta (bool): A flag to tell if only the changed stocks are recorded
+            (default is False)
+        time_stamp (datetime): A time stamp in which the stocks are recorded, after the previous snapshot
+            (default is None, which means datetime.utcnow())
+        echo (bool): A flag to tell if the recorded stock records are returned
+            (default is False, which means only their number is returned)
 
     Returns:
         dict: A dictionary representing the response
     """
-    session = database_service.get_session()()
-    stocks = session.query(Stock).all()
-    time_stamp = datetime.utcnow()
-    stock_records = [
-        StockRecord(stock.vm_id, stock.prod_id, stock.stock, time_stamp)
-        for stock in stocks
-    ]
-    session.add_all(stock_records)
-    session.commit()
-    return {
-        "status": "success",
-        "data": {
-            "post": list(
-                map(
-                    lambda stock_record: stock_record.to_dict(),
-                    stock_records,
+    time_stamp = time_stamp or datetime.utcnow()
+    stocks = Stock.__table__
+    last_stock_records = LastStockRecord.__table__
+    columns = ["time_stamp", "vm_id", "prod_id", "stock"]
+    recorded_at = literal(time_stamp, DateTime)
+    with database_service.begin() as session:
+        last_snapshot = (
+            session.query(Snapshot).order_by(Snapshot.time_stamp.desc()).first()
+        )
+        update_stock_rollups(
+            session,
+            time_stamp,
+            last_snapshot.time_stamp if last_snapshot is not None else None,
+        )
+        if delta and last_snapshot is not None:
+            changed_stocks = select(
+                recorded_at, stocks.c.vm_id, stocks.c.prod_id, stocks.c.stock
+            ).select_from(
+                stocks.outerjoin(
+                    last_stock_records,
+                    and_(
+                        last_stock_records.c.vm_id == stocks.c.vm_id,
+                        last_stock_records.c.prod_id == stocks.c.prod_id,
+                    ),
+                )
+            )
+            removed_stocks = select(
+                recorded_at,
+                last_stock_records.c.vm_id,
+                last_stock_records.c.prod_id,
+                null(),
+            ).where(
+                ~select(stocks.c.vm_id)
+                .where(
+                    stocks.c.vm_id == last_stock_records.c.vm_id,
+                    stocks.c.prod_id == last_stock_records.c.prod_id,
                 )
+                .exists()
             )
-        },
+            count = (
+                session.execute(
+                    insert(StockRecord).from_select(
+                        columns,
+                        changed_stocks.where(is_stock_changed()),
+                    )
+                ).rowcount
+                + session.execute(
+                    insert(StockRecord).from_select(columns, removed_stocks)
+                ).rowcount
+            )
+            snapshot = Snapshot(time_stamp, last_snapshot.base, delta=True)
+        else:
+            count = session.execute(
+                insert(StockRecord).from_select(
+                    columns,
+                    select(
+                        recorded_at, stocks.c.vm_id, stocks.c.prod_id, stocks.c.stock
+                    ),
+                )
+            ).rowcount
+            snapshot = Snapshot(time_stamp)
+        # the last stock records become the current stocks after either snapshot, by writing only the
+        # stocks that changed and deleting the ones that were removed
+        statement = sqlite.insert(LastStockRecord).from_select(
+            ["vm_id", "prod_id", "stock"],
+            select(stocks.c.vm_id, stocks.c.prod_id, stocks.c.stock)
+            .select_from(
+                stocks.outerjoin(
+                    last_stock_records,
+                    and_(
+                        last_stock_records.c.vm_id == stocks.c.vm_id,
+                        last_stock_records.c.prod_id == stocks.c.prod_id,
+                    ),
+                )
+            )
+            .where(is_stock_changed()),
+        )
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["vm_id", "prod_id"],
+                set_={"stock": statement.excluded.stock},
+            )
+        )
+        session.execute(
+            delete(last_stock_records).where(
+                ~select(stocks.c.vm_id)
+                .where(
+                    stocks.c.vm_id == last_stock_records.c.vm_id,
+                    stocks.c.prod_id == last_stock_records.c.prod_id,
+                )
+                .exists()
+            )
+        )
+        session.add(snapshot)
+        bump_data_version(session, STOCK_RECORDS_DATA)
+        data = {"time_stamp": time_stamp, "count": count}
+        if echo:
+            data["post"] = [
+                stock_record.to_dict()
+                for stock_record in session.query(StockRecord)
+                .filter(StockRecord.time_stamp == time_stamp)
+                .order_by(StockRecord.vm_id, StockRecord.prod_id)
+            ]
+    # the snapshot is expired by the commit, so its flag is not read from it
+    labels = {"mode": "delta" if delta and last_snapshot is not None else "full"}
+    database_service.get_metrics().inc("vmms_snapshots_total", labels)
+    database_service.get_metrics().inc("vmms_stock_records_saved_total", labels, count)
+    return {
+        "status": "success",
+        "data": data,
         "message": "current stocks are successfully recorded",
     }
@@ -0,0 +1,100 @@
+"""Fragment Cache.
+
+This script contains a cache of rendered HTML fragments of vending machines.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """A class used to cache rendered fragments of vending machines with LRU eviction.
+
+    A fragment is stored together with the version of the vending machine it was rendered from,
+    so a fragment of an older version is never returned.
+
+    Attributes:
+        max_size (int): A maximum number of fragments kept in the cache
+        hits (int): A number of lookups that found a fragment
+        misses (int): A number of lookups that did not find a fragment
+        evictions (int): A number of fragments evicted because the cache was full
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        """Initialize FragmentCache.
+
+        Args:
+            max_size (int): A maximum number of fragments kept in the cache
+                (default is 1024)
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fragments = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, vm_id: int, version: int) -> str:
+        """Get the fragment of a vending machine.
+
+        Args:
+            vm_id (int): An id of the interested vending machine
+            version (int): The current version of the vending machine
+
+        Returns:
+            str: The cached fragment, or None if there is no fragment of that version
+        """
+        with self.lock:
+            entry = self.fragments.get(vm_id)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.fragments.move_to_end(vm_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, vm_id: int, version: int, fragment: str) -> None:
+        """Store the fragment of a vending machine, evicting the least recently used one if the cache is full.
+
+        Args:
+            vm_id (int): An id of the interested vending machine
+            version (int): The version of the vending machine the fragment was rendered from
+            fragment (str): The rendered fragment
+        """
+        with self.lock:
+            self.fragments[vm_id] = (version, fragment)
+            self.fragments.move_to_end(vm_id)
+            while len(self.fragments) > self.max_size:
+                self.fragments.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, vm_id: int) -> None:
+        """Remove the fragment of a vending machine.
+
+        Args:
+            vm_id (int): An id of the interested vending machine
+        """
+        with self.lock:
+            self.fragments.pop(vm_id, None)
+
+    def clear(self) -> None:
+        """Remove all fragments."""
+        with self.lock:
+            self.fragments.clear()
+
+    def stats(self) -> dict:
+        """Get the statistics of the cache.
+
+        Returns:
+            dict: A dictionary of the size, the maximum size, the hits, the misses, the evictions and the hit ratio
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.fragments),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,369 @@
+"""Metrics.
+
+This script contains a registry of counters, gauges and histograms exposed in
+the Prometheus text format, which aggregates the metrics of every process
+serving the app, e.g. of every gunicorn worker, through a shared directory.
+"""
+
+from __future__ import annotations
+
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+import weakref
+from typing import Callable
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# in seconds, from a cached fragment to a snapshot of a large fleet
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+    """A class used to record metrics and render them in the Prometheus text format.
+
+    Every thread records its counters and histograms in its own shard without taking a lock, which is
+    only taken to add the shard of a new thread. The shards of the threads that finished, e.g. of the
+    requests served by a threaded server, are added to the retired samples and dropped whenever a shard
+    is added or the metrics are collected. The gauges, and the counters kept by other objects, are read
+    from the collectors when the metrics are rendered.
+
+    With a directory, every process writes its metrics into its own file of the directory at most every
+    flush interval and when it exits, and the metrics of every file are added up when they are rendered.
+    The file is named after the id and the start time of the process, so a process reusing the id of one
+    that exited never overwrites its file. The counters and histograms of a process that exited are kept,
+    but not its gauges.
+
+    Attributes:
+        directory (str): A path to the directory shared by the processes, None if there is only one
+        flush_interval (float): A minimum number of seconds between two writes of the file of the process
+        families (dict): The type, the help and the buckets of each metric by its name
+        shards (list): The weak reference to each running thread and the counters and histograms it recorded
+        retired (dict): The counters and histograms recorded by the threads that finished
+        collectors (list): The functions returning the current gauges and counters kept by other objects
+        local (threading.local): The shard of the current thread
+        lock (threading.Lock): A lock of the shards and of the file of the process
+        last_flush (float): The time the file of the process was last written
+        pid (int): The id of the process writing the file
+        started (int): The time in nanoseconds since the epoch at which the process started recording
+    """
+
+    def __init__(self, directory: str = None, flush_interval: float = 1.0) -> None:
+        """Initialize MetricsRegistry.
+
+        Args:
+            directory (str): A path to the directory shared by the processes serving the app
+                (default is None, which means only the metrics of this process are rendered)
+            flush_interval (float): A minimum number of seconds between two writes of the file of the process
+                (default is 1.0)
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.families = {}
+        self.shards = []
+        self.retired = {}
+        self.collectors = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.last_flush = 0.0
+        self.pid = os.getpid()
+        self.started = time.time_ns()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            # the metrics recorded since the last write are written when the process exits
+            atexit.register(flush_at_exit, weakref.ref(self))
+
+    def describe(
+        self,
+        name: str,
+        metric_type: str,
+        description: str,
+        buckets: tuple = DEFAULT_BUCKETS,
+    ) -> None:
+        """Declare a metric.
+
+        Args:
+            name (str): A name of the metric
+            metric_type (str): A type of the metric, i.e. COUNTER, GAUGE or HISTOGRAM
+            description (str): A description of the metric
+            buckets (tuple): The upper bounds of the buckets of a histogram
+                (default is DEFAULT_BUCKETS)
+        """
+        self.families[name] = {
+            "type": metric_type,
+            "help": description,
+            "buckets": buckets,
+        }
+
+    def add_collector(self, collector: Callable[[], list]) -> None:
+        """Add a function returning current samples, i.e. (name, labels, value) tuples, of declared metrics.
+
+        Args:
+            collector (Callable): The function called whenever the metrics are rendered or written
+        """
+        self.collectors.append(collector)
+
+    def get_shard(self) -> dict:
+        """Get the shard of the current thread.
+
+        Returns:
+            dict: The value of each sample recorded by the current thread by its name, suffix and labels
+        """
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = {}
+            with self.lock:
+                self.retire_shards()
+                self.shards.append((weakref.ref(threading.current_thread()), shard))
+        return shard
+
+    def retire_shards(self) -> None:
+        """Add the shards of the threads that finished to the retired samples and drop them.
+
+        The lock must be held by the caller.
+        """
+        running = []
+        for reference, shard in self.shards:
+            thread = reference()
+            if thread is not None and thread.is_alive():
+                running.append((reference, shard))
+                continue
+            # the thread finished, so its shard is not changed anymore
+            for key, value in shard.items():
+                self.retired[key] = self.retired.get(key, 0) + value
+        self.shards = running
+
+    def inc(self, name: str, labels: dict = None, value: float = 1) -> None:
+        """Increase a counter.
+
+        Args:
+            name (str): A name of the counter
+            labels (dict): The labels of the sample
+                (default is None, which means no label)
+            value (float): An amount to add
+                (default is 1)
+        """
+        shard = self.get_shard()
+        key = (name, "", tuple(sorted((labels or {}).items())))
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict = None) -> None:
+        """Record an observation of a histogram.
+
+        Args:
+            name (str): A name of the histogram
+            value (float): The observed value
+            labels (dict): The labels of the sample
+                (default is None, which means no label)
+        """
+        shard = self.get_shard()
+        labels = tuple(sorted((labels or {}).items()))
+        buckets = self.families[name]["buckets"]
+        # the buckets are cumulative, so the observation is counted in every bucket it fits in
+        for bound in buckets[bisect.bisect_left(buckets, value) :]:
+            key = (name, "_bucket", labels + (("le", repr(float(bound))),))
+            shard[key] = shard.get(key, 0) + 1
+        for suffix, amount in [("_bucket", 1), ("_sum", value), ("_count", 1)]:
+            key = (
+                name,
+                suffix,
+                labels + ((("le", "+Inf"),) if suffix == "_bucket" else ()),
+            )
+            shard[key] = shard.get(key, 0) + amount
+
+    def collect(self) -> tuple[dict, dict]:
+        """Add up the samples of every thread of the process and read the collectors.
+
+        Returns:
+            tuple: The counters and histograms, and the gauges, of the process, by name, suffix and labels
+        """
+        with self.lock:
+            self.retire_shards()
+            shards = [shard for _, shard in self.shards]
+            samples = dict(self.retired)
+        for shard in shards:
+            # a dict is copied without running python code, so a thread recording meanwhile is not seen
+            # halfway through
+            for key, value in shard.copy().items():
+                samples[key] = samples.get(key, 0) + value
+        gauges = {}
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                key = (name, "", tuple(sorted(labels.items())))
+                if self.families[name]["type"] == GAUGE:
+                    gauges[key] = value
+                else:
+                    samples[key] = value
+        return samples, gauges
+
+    def get_path(self) -> str:
+        """Get the path to the file of the process.
+
+        Returns:
+            str: The path to the file in the directory, named after the id and the start time of the process
+        """
+        if os.getpid() != self.pid:
+            # a forked worker writes its own file
+            self.pid = os.getpid()
+            self.started = time.time_ns()
+        return os.path.join(self.directory, f"metrics_{self.pid}_{self.started}.json")
+
+    def flush(self, force: bool = True) -> None:
+        """Write the metrics of the process into its file of the directory.
+
+        Args:
+            force (bool): A flag to tell if the file is written even if it was written less than the flush
+                interval ago (default is True)
+        """
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_flush < self.flush_interval:
+            return
+        self.last_flush = now
+        samples, gauges = self.collect()
+        path = self.get_path()
+        with self.lock:
+            # the file is replaced at once, so a process reading it never sees it half written
+            with open(f"{path}.tmp", "w") as file:
+                json.dump(
+                    {
+                        "pid": self.pid,
+                        "started": self.started,
+                        "samples": [[*key, value] for key, value in samples.items()],
+                        "gauges": [[*key, value] for key, value in gauges.items()],
+                    },
+                    file,
+                )
+            os.replace(f"{path}.tmp", path)
+
+    def aggregate(self) -> dict:
+        """Add up the metrics of every process.
+
+        Returns:
+            dict: The value of each sample by its name, suffix and labels
+        """
+        samples, gauges = self.collect()
+        if self.directory is None:
+            return {**samples, **gauges}
+        self.flush()
+        files = []
+        for file_name in sorted(os.listdir(self.directory)):
+            if not (file_name.startswith("metrics_") and file_name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name)) as file:
+                    files.append(json.load(file))
+            except (OSError, ValueError) as e:
+                print("aggregate:", e)
+        # only the latest process with an id can still be running
+        latest = {}
+        for metrics in files:
+            latest[metrics["pid"]] = max(
+                latest.get(metrics["pid"], 0), metrics.get("started", 0)
+            )
+        samples = {}
+        for metrics in files:
+            entries = metrics["samples"]
+            if metrics.get("started", 0) == latest[metrics["pid"]] and is_alive(
+                metrics["pid"]
+            ):
+                entries = entries + metrics["gauges"]
+            for name, suffix, labels, value in entries:
+                key = (name, suffix, tuple(tuple(label) for label in labels))
+                samples[key] = samples.get(key, 0) + value
+        return samples
+
+    def render(self) -> str:
+        """Render the metrics of every process in the Prometheus text format.
+
+        Returns:
+            str: The metrics, one family after the other
+        """
+        samples = self.aggregate()
+        lines = []
+        for name, family in self.families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for (sample_name, suffix, labels), value in sorted(
+                samples.items(), key=lambda item: sort_key(item[0])
+            ):
+                if sample_name == name:
+                    lines.append(f"{name}{suffix}{format_labels(labels)} {value!r}")
+        return "\n".join(lines) + "\n"
+
+
+def flush_at_exit(reference: weakref.ref) -> None:
+    """Write the metrics of a registry which still exists when the process exits.
+
+    Args:
+        reference (weakref.ref): The weak reference to the registry
+    """
+    metrics = reference()
+    if metrics is None:
+        return
+    try:
+        metrics.flush()
+    except OSError as e:
+        print("flush_at_exit:", e)
+
+
+def sort_key(key: tuple) -> tuple:
+    """Order the samples of a histogram by their labels, then by their suffix and bucket.
+
+    Args:
+        key (tuple): The name, the suffix and the labels of a sample
+
+    Returns:
+        tuple: A key sorting the buckets of a histogram by their upper bound
+    """
+    name, suffix, labels = key
+    other_labels = tuple(label for label in labels if label[0] != "le")
+    bound = [float(value) for label, value in labels if label == "le"]
+    return (name, other_labels, suffix, bound)
+
+
+def format_labels(labels: tuple) -> str:
+    """Format the labels of a sample.
+
+    Args:
+        labels (tuple): The name and the value of each label
+
+    Returns:
+        str: The labels in braces, or an empty string if there is none
+    """
+    if not labels:
+        return ""
+    escaped = [
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def is_alive(pid: int) -> bool:
+    """Tell if a process is still running.
+
+    Args:
+        pid (int): An id of the process
+
+    Returns:
+        bool: True if the process is running, False otherwise
+    """
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,57 @@
+"""Data Version."""
+
+from sqlalchemy import INTEGER, VARCHAR, Column
+
+from vmms_webapp.models.base import Base
+
+
+class DataVersion(Base):
+    """
+    A class used to represent a version of a group of tables.
+
+    Attributes:
+        name (str): A name of the group of tables
+        version (int): A counter increased whenever the group of tables changes
+    """
+
+    __tablename__ = "data_versions"
+
+    name = Column(VARCHAR(50), primary_key=True)
+    version = Column(INTEGER, nullable=False, default=0)
+
+    def __init__(self, name: str, version: int = 0) -> None:
+        """Initialize DataVersion.
+
+        Args:
+            name (str): A name of the group of tables
+            version (int): A counter increased whenever the group of tables changes
+                (default is 0)
+        """
+        self.name = name
+        self.version = version
+
+    def __repr__(self) -> str:
+        """Return a string as a representation of the object.
+
+        Returns:
+            str: A string representation of the object
+        """
+        return f"<DataVersion {self.name}: {self.version}>"
+
+    def __eq__(self, other: object) -> bool:
+        """Check equality of both instances.
+
+        Returns:
+            bool: True if the both instances are equal else False
+        """
+        if isinstance(other, DataVersion):
+            return self.name == other.name
+        return False
+
+    def to_dict(self) -> dict:
+        """Convert the object to dictionary.
+
+        Returns:
+            dict: A dictionary representing the object
+        """
+        return {"name": self.name, "version": self.version}
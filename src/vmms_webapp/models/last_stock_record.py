@@ -0,0 +1,60 @@
+"""Last Stock Record."""
+
+from sqlalchemy import INTEGER, Column
+
+from vmms_webapp.models.base import Base
+
+
+class LastStockRecord(Base):
+    """
+    A class used to represent the stock of a product in a vending machine at the latest snapshot.
+
+    Attributes:
+        vm_id (int): A vending machine identification
+        prod_id (int): A product identification
+        stock (int): A product stock inside the vending machine at the latest snapshot
+    """
+
+    __tablename__ = "last_stock_records"
+
+    vm_id = Column(INTEGER, primary_key=True)
+    prod_id = Column(INTEGER, primary_key=True)
+    stock = Column(INTEGER)
+
+    def __init__(self, vm_id: int, prod_id: int, stock: int) -> None:
+        """Initialize LastStockRecord.
+
+        Args:
+            vm_id (int): A vending machine identification
+            prod_id (int): A product identification
+            stock (int): A product stock inside the vending machine at the latest snapshot
+        """
+        self.vm_id = vm_id
+        self.prod_id = prod_id
+        self.stock = stock
+
+    def __repr__(self) -> str:
+        """Return a string as a representation of the object.
+
+        Returns:
+            str: A string representation of the object
+        """
+        return f"<LastStockRecord {(self.vm_id, self.prod_id)}: {self.stock}>"
+
+    def __eq__(self, other: object) -> bool:
+        """Check equality of both instances.
+
+        Returns:
+            bool: True if the both instances are equal else False
+        """
+        if isinstance(other, LastStockRecord):
+            return self.vm_id == other.vm_id and self.prod_id == other.prod_id
+        return False
+
+    def to_dict(self) -> dict:
+        """Convert the object to dictionary.
+
+        Returns:
+            dict: A dictionary representing the object
+        """
+        return {"vm_id": self.vm_id, "prod_id": self.prod_id, "stock": self.stock}
@@ -0,0 +1,62 @@
+"""Lease."""
+
+from datetime import datetime
+
+from sqlalchemy import VARCHAR, Column, DateTime
+
+from vmms_webapp.models.base import Base
+
+
+class Lease(Base):
+    """
+    A class used to represent a lease on a job shared by every process using the database.
+
+    Attributes:
+        name (str): A name of the job
+        owner (str): An identification of the process that acquired the lease last
+        expires_at (DateTime): A time stamp after which the lease can be acquired again
+    """
+
+    __tablename__ = "leases"
+
+    name = Column(VARCHAR(50), primary_key=True)
+    owner = Column(VARCHAR(255), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    def __init__(self, name: str, owner: str, expires_at: datetime) -> None:
+        """Initialize Lease.
+
+        Args:
+            name (str): A name of the job
+            owner (str): An identification of the process that acquired the lease last
+            expires_at (datetime): A time stamp after which the lease can be acquired again
+        """
+        self.name = name
+        self.owner = owner
+        self.expires_at = expires_at
+
+    def __repr__(self) -> str:
+        """Return a string as a representation of the object.
+
+        Returns:
+            str: A string representation of the object
+        """
+        return f"<Lease {self.name}: {self.owner} until {self.expires_at}>"
+
+    def __eq__(self, other: object) -> bool:
+        """Check equality of both instances.
+
+        Returns:
+            bool: True if the both instances are equal else False
+        """
+        if isinstance(other, Lease):
+            return self.name == other.name
+        return False
+
+    def to_dict(self) -> dict:
+        """Convert the object to dictionary.
+
+        Returns:
+            dict: A dictionary representing the object
+        """
+        return {"name": self.name, "owner": self.owner, "expires_at": self.expires_at}
@@ -0,0 +1,71 @@
+"""Snapshot."""
+
+from datetime import datetime
+
+from sqlalchemy import BOOLEAN, Column, DateTime, Index
+
+from vmms_webapp.models.base import Base
+
+
+class Snapshot(Base):
+    """
+    A class used to represent a snapshot of the stocks recorded in stock_records.
+
+    A full snapshot records the stocks of every product in every vending machine, while a delta snapshot
+    only records the stocks that changed since the previous snapshot (with a null stock for a removed one).
+    The stocks at a delta snapshot are the latest stock records at or before it, back to its base.
+
+    Attributes:
+        time_stamp (DateTime): A time stamp in which the stocks are recorded
+        base (DateTime): A time stamp of the last full snapshot at or before this snapshot
+        delta (bool): A flag to tell if only the changed stocks are recorded
+    """
+
+    __tablename__ = "snapshots"
+    __table_args__ = (Index("ix_snapshots_delta", "delta"),)
+
+    time_stamp = Column(DateTime, primary_key=True)
+    base = Column(DateTime, nullable=False)
+    delta = Column(BOOLEAN, nullable=False, default=False)
+
+    def __init__(
+        self, time_stamp: datetime, base: datetime = None, delta: bool = False
+    ) -> None:
+        """Initialize Snapshot.
+
+        Args:
+            time_stamp (datetime): A time stamp in which the stocks are recorded
+            base (datetime): A time stamp of the last full snapshot at or before this snapshot
+                (default is None, which means the snapshot itself)
+            delta (bool): A flag to tell if only the changed stocks are recorded
+                (default is False)
+        """
+        self.time_stamp = time_stamp
+        self.base = base or time_stamp
+        self.delta = delta
+
+    def __repr__(self) -> str:
+        """Return a string as a representation of the object.
+
+        Returns:
+            str: A string representation of the object
+        """
+        return f"<Snapshot {self.time_stamp}: {'delta' if self.delta else 'full'}>"
+
+    def __eq__(self, other: object) -> bool:
+        """Check equality of both instances.
+
+        Returns:
+            bool: True if the both instances are equal else False
+        """
+        if isinstance(other, Snapshot):
+            return self.time_stamp == other.time_stamp
+        return False
+
+    def to_dict(self) -> dict:
+        """Convert the object to dictionary.
+
+        Returns:
+            dict: A dictionary representing the object
+        """
+        return {"time_stamp": self.time_stamp, "base": self.base, "delta": self.delta}
@@ -2,7 +2,7 @@
 
 from datetime import datetime
 
-from sqlalchemy import INTEGER, Column, DateTime, ForeignKey
+from sqlalchemy import INTEGER, Column, DateTime, ForeignKey, Index
 
 from vmms_webapp.models.base import Base
 
@@ -19,6 +19,21 @@ class StockRecord(Base):
     """
 
     __tablename__ = "stock_records"
+    __table_args__ = (
+        # the timelines of a vending machine and of a product are range scans of these indexes
+        Index(
+            "ix_stock_records_vm_id_prod_id_time_stamp",
+            "vm_id",
+            "prod_id",
+            "time_stamp",
+        ),
+        Index(
+            "ix_stock_records_prod_id_vm_id_time_stamp",
+            "prod_id",
+            "vm_id",
+            "time_stamp",
+        ),
+    )
 
     time_stamp = Column(DateTime, default=datetime.utcnow(), primary_key=True)
     vm_id = Column(INTEGER, ForeignKey("vending_machines.id"), primary_key=True)
@@ -0,0 +1,157 @@
+"""Stock Rollup."""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import INTEGER, Column, DateTime, Index
+
+from vmms_webapp.models.base import Base
+
+
+class StockRollup(Base):
+    """
+    A base class used to represent the stocks of a product in a vending machine rolled up over a period.
+
+    Attributes:
+        time_stamp (DateTime): A time stamp in which the period starts
+        vm_id (int): A vending machine identification
+        prod_id (int): A product identification
+        min (int): The minimum stock recorded in the period
+        max (int): The maximum stock recorded in the period
+        last (int): The last stock recorded in the period
+        consumed (int): A number of units consumed in the period, i.e. the sum of the decreases of the stock
+            since the previous snapshot
+    """
+
+    __abstract__ = True
+    # the width of the period, set by the subclasses
+    period = None
+
+    time_stamp = Column(DateTime, primary_key=True)
+    vm_id = Column(INTEGER, primary_key=True)
+    prod_id = Column(INTEGER, primary_key=True)
+    min = Column(INTEGER, nullable=False)
+    max = Column(INTEGER, nullable=False)
+    last = Column(INTEGER, nullable=False)
+    consumed = Column(INTEGER, nullable=False, default=0)
+
+    def __init__(
+        self,
+        time_stamp: datetime,
+        vm_id: int,
+        prod_id: int,
+        stock: int,
+        consumed: int = 0,
+    ) -> None:
+        """Initialize a rollup of a single stock.
+
+        Args:
+            time_stamp (datetime): A time stamp in which the period starts
+            vm_id (int): A vending machine identification
+            prod_id (int): A product identification
+            stock (int): The first stock recorded in the period
+            consumed (int): A number of units consumed since the previous snapshot
+                (default is 0)
+        """
+        self.time_stamp = time_stamp
+        self.vm_id = vm_id
+        self.prod_id = prod_id
+        self.min = stock
+        self.max = stock
+        self.last = stock
+        self.consumed = consumed
+
+    @classmethod
+    def truncate(cls, time_stamp: datetime) -> datetime:
+        """Truncate a time stamp to the start of its period.
+
+        Args:
+            time_stamp (datetime): A naive time stamp in UTC
+
+        Returns:
+            datetime: The time stamp in which the period starts
+        """
+        return datetime.min + (time_stamp - datetime.min) // cls.period * cls.period
+
+    def add(self, stock: int, consumed: int = 0) -> None:
+        """Add a stock recorded after the ones already in the rollup.
+
+        Args:
+            stock (int): The stock recorded
+            consumed (int): A number of units consumed since the previous snapshot
+                (default is 0)
+        """
+        self.min = min(self.min, stock)
+        self.max = max(self.max, stock)
+        self.last = stock
+        self.consumed += consumed
+
+    def __repr__(self) -> str:
+        """Return a string as a representation of the object.
+
+        Returns:
+            str: A string representation of the object
+        """
+        return (
+            f"<{type(self).__name__} {(self.time_stamp, self.vm_id, self.prod_id)}: "
+            f"{self.last}>"
+        )
+
+    def __eq__(self, other: object) -> bool:
+        """Check equality of both instances.
+
+        Returns:
+            bool: True if the both instances are equal else False
+        """
+        if isinstance(other, type(self)):
+            return (
+                self.time_stamp == other.time_stamp
+                and self.vm_id == other.vm_id
+                and self.prod_id == other.prod_id
+            )
+        return False
+
+    def to_dict(self) -> dict:
+        """Convert the object to dictionary.
+
+        Returns:
+            dict: A dictionary representing the object
+        """
+        return {
+            "time_stamp": self.time_stamp,
+            "vm_id": self.vm_id,
+            "prod_id": self.prod_id,
+            "min": self.min,
+            "max": self.max,
+            "last": self.last,
+            "consumed": self.consumed,
+        }
+
+
+class HourlyStockRollup(StockRollup):
+    """A class used to represent the stocks of a product in a vending machine rolled up over an hour."""
+
+    __tablename__ = "hourly_stock_rollups"
+    __table_args__ = (
+        Index(
+            "ix_hourly_stock_rollups_vm_id_prod_id_time_stamp",
+            "vm_id",
+            "prod_id",
+            "time_stamp",
+        ),
+    )
+    period = timedelta(hours=1)
+
+
+class DailyStockRollup(StockRollup):
+    """A class used to represent the stocks of a product in a vending machine rolled up over a day (in UTC)."""
+
+    __tablename__ = "daily_stock_rollups"
+    __table_args__ = (
+        Index(
+            "ix_daily_stock_rollups_vm_id_prod_id_time_stamp",
+            "vm_id",
+            "prod_id",
+            "time_stamp",
+        ),
+    )
+    period = timedelta(days=1)
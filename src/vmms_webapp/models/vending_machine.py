@@ -12,6 +12,8 @@ class VendingMachine(Base):
     Attributes:
         name (str): A vending machine name
         location (str): A vending machine location
+        version (int): The version of the vending machines when the vending machine or its product stocks
+            last changed, so it is never the version of a deleted vending machine with the same id
     """
 
     __tablename__ = "vending_machines"
@@ -19,6 +21,7 @@ class VendingMachine(Base):
     id = Column(INTEGER, primary_key=True, autoincrement=True)
     name = Column(VARCHAR(50))
     location = Column(VARCHAR(100))
+    version = Column(INTEGER, nullable=False, default=0, server_default="0")
 
     def __init__(self, name: str, location: str) -> None:
         """Initialize VendingMachine.
@@ -0,0 +1,157 @@
+"""Query Stats.
+
+This script contains a collector of the number and the duration of the SQL
+statements executed for each request, aggregated by route.
+"""
+
+import threading
+import time
+from contextvars import ContextVar, Token
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryStats:
+    """A class used to count the SQL statements executed for a request.
+
+    Attributes:
+        statements (int): A number of statements executed
+        duration (float): The time spent executing them in seconds
+    """
+
+    def __init__(self) -> None:
+        """Initialize QueryStats."""
+        self.statements = 0
+        self.duration = 0.0
+
+
+class QueryStatsCollector:
+    """A class used to collect the SQL statements executed for each request, aggregated by route.
+
+    The statements are counted by the events of the engines, in the stats of the request being handled by
+    the current thread, so the statements executed outside of a request are not counted.
+
+    Attributes:
+        current (ContextVar): The stats of the request being handled, None if there is none
+        routes (dict): The number of requests and the number, the maximum number and the duration of the
+            statements by the method and the rule of the route
+        lock (threading.Lock): A lock of the routes
+    """
+
+    def __init__(self) -> None:
+        """Initialize QueryStatsCollector."""
+        self.current = ContextVar(f"query_stats_{id(self)}", default=None)
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def instrument(self, engine: Engine) -> None:
+        """Count the statements executed by an engine.
+
+        Args:
+            engine (Engine): The engine to instrument
+        """
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(engine, "handle_error", self.handle_error)
+
+    def before_cursor_execute(self, connection: object, *args: object) -> None:
+        """Record when a statement starts.
+
+        Args:
+            connection (object): The connection executing the statement
+            args: The cursor, the statement, the parameters, the context and the executemany flag
+        """
+        connection.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, connection: object, *args: object) -> None:
+        """Count a statement that finished in the stats of the current request.
+
+        Args:
+            connection (object): The connection executing the statement
+            args: The cursor, the statement, the parameters, the context and the executemany flag
+        """
+        start = connection.info["query_start"].pop()
+        stats = self.current.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.duration += time.perf_counter() - start
+
+    def handle_error(self, exception_context: object) -> None:
+        """Forget when a statement that failed started.
+
+        Args:
+            exception_context (object): The context of the exception raised by the statement
+        """
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+    def start(self) -> Token:
+        """Start counting the statements of the request handled by the current thread.
+
+        Returns:
+            Token: A token to pass to stop
+        """
+        return self.current.set(QueryStats())
+
+    def get_current(self) -> QueryStats:
+        """Get the stats of the request being handled.
+
+        Returns:
+            QueryStats: The stats of the request, None if there is none
+        """
+        return self.current.get()
+
+    def stop(self, token: Token, method: str, rule: str) -> QueryStats:
+        """Stop counting the statements of the request and add them to the stats of its route.
+
+        Args:
+            token (Token): The token returned by start
+            method (str): The method of the request
+            rule (str): The rule of the route of the request
+
+        Returns:
+            QueryStats: The stats of the request
+        """
+        stats = self.current.get()
+        self.current.reset(token)
+        with self.lock:
+            route = self.routes.setdefault(
+                (method, rule),
+                {"requests": 0, "statements": 0, "max_statements": 0, "duration": 0.0},
+            )
+            route["requests"] += 1
+            route["statements"] += stats.statements
+            route["max_statements"] = max(route["max_statements"], stats.statements)
+            route["duration"] += stats.duration
+        return stats
+
+    def get_summary(self) -> list[dict]:
+        """Get the stats of every route.
+
+        Returns:
+            list: A list of the number of requests and the number and the duration (in milliseconds) of
+                the statements of each route, in total and per request, the slowest routes first
+        """
+        with self.lock:
+            routes = [(key, dict(route)) for key, route in self.routes.items()]
+        summary = [
+            {
+                "method": method,
+                "route": rule,
+                "requests": route["requests"],
+                "statements": route["statements"],
+                "avg_statements": route["statements"] / route["requests"],
+                "max_statements": route["max_statements"],
+                "duration": route["duration"] * 1000,
+                "avg_duration": route["duration"] * 1000 / route["requests"],
+            }
+            for (method, rule), route in routes
+        ]
+        return sorted(summary, key=lambda route: route["duration"], reverse=True)
+
+    def reset(self) -> None:
+        """Forget the stats of every route."""
+        with self.lock:
+            self.routes.clear()
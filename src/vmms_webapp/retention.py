@@ -0,0 +1,427 @@
+"""Retention.
+
+This script applies a retention policy to the stock records: every snapshot is
+kept for a number of days, then only the last snapshot of each hour, then only
+the last snapshot of each day, until the snapshots are dropped. It also removes
+the stock records and the rollups of deleted vending machines.
+
+Every change is made in short transactions of a bounded number of rows, so the
+database is never locked for long. A delta snapshot that is kept but depends on
+a dropped one is rebased first, so the stocks read at every kept snapshot never
+change.
+
+This file can also be run as a script:
+
+    python -m vmms_webapp.retention --raw-days 7 --hourly-days 30 --drop-days 365 --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import Table, func, literal_column, select
+from sqlalchemy.dialects.sqlite import insert
+
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.snapshot import Snapshot
+from vmms_webapp.models.stock_record import StockRecord
+from vmms_webapp.models.stock_rollup import DailyStockRollup, HourlyStockRollup
+from vmms_webapp.models.vending_machine import VendingMachine
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class RetentionPolicy:
+    """A class used to represent how long the snapshots of stock records are kept.
+
+    Attributes:
+        raw_days (int): A number of days every snapshot is kept
+        hourly_days (int): A number of days the last snapshot of each hour is kept
+        drop_days (int): A number of days the last snapshot of each day is kept, after which it is dropped
+    """
+
+    def __init__(
+        self, raw_days: int = 7, hourly_days: int = 30, drop_days: int = 365
+    ) -> None:
+        """Initialize RetentionPolicy.
+
+        Args:
+            raw_days (int): A number of days every snapshot is kept
+                (default is 7)
+            hourly_days (int): A number of days the last snapshot of each hour is kept
+                (default is 30)
+            drop_days (int): A number of days the last snapshot of each day is kept, after which it is dropped
+                (default is 365)
+
+        Raises:
+            ValueError: If the numbers of days are negative or not in increasing order
+        """
+        if not 0 <= raw_days <= hourly_days <= drop_days:
+            raise ValueError(
+                "the numbers of days must satisfy 0 <= raw_days <= hourly_days <= drop_days"
+            )
+        self.raw_days = raw_days
+        self.hourly_days = hourly_days
+        self.drop_days = drop_days
+
+    def get_period(self, time_stamp: datetime, now: datetime) -> timedelta:
+        """Get the period of which the last snapshot is kept at the age of a time stamp.
+
+        Args:
+            time_stamp (datetime): A time stamp of a snapshot
+            now (datetime): The current time stamp
+
+        Returns:
+            timedelta: An hour or a day, None if every snapshot is kept and timedelta.max if it is dropped
+        """
+        age = now - time_stamp
+        if age < timedelta(days=self.raw_days):
+            return None
+        if age < timedelta(days=self.hourly_days):
+            return HourlyStockRollup.period
+        if age < timedelta(days=self.drop_days):
+            return DailyStockRollup.period
+        return timedelta.max
+
+
+def get_retention_plan(
+    database_service: DatabaseService, policy: RetentionPolicy, now: datetime
+) -> list[tuple[datetime, datetime, int]]:
+    """Get the snapshots to drop.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        policy (RetentionPolicy): The retention policy to apply
+        now (datetime): The current time stamp
+
+    Returns:
+        list: A list of tuples of the kept snapshot before a run of snapshots to drop (None if there is none),
+            the kept snapshot after it (None if there is none) and the number of snapshots to drop
+    """
+    session = database_service.get_session()()
+    raw_cutoff = now - timedelta(days=policy.raw_days)
+    time_stamps = [
+        time_stamp
+        for time_stamp, in session.query(Snapshot.time_stamp)
+        .filter(Snapshot.time_stamp < raw_cutoff)
+        .order_by(Snapshot.time_stamp)
+    ]
+    kept_time_stamps = {}
+    for time_stamp in time_stamps:
+        period = policy.get_period(time_stamp, now)
+        if period != timedelta.max:
+            # the snapshots are in order, so the last one of each period is kept
+            bucket = datetime.min + (time_stamp - datetime.min) // period * period
+            kept_time_stamps[(period, bucket)] = time_stamp
+    kept_time_stamps = set(kept_time_stamps.values())
+    first_raw_time_stamp = (
+        session.query(func.min(Snapshot.time_stamp))
+        .filter(Snapshot.time_stamp >= raw_cutoff)
+        .scalar()
+    )
+    if first_raw_time_stamp is not None:
+        time_stamps.append(first_raw_time_stamp)
+        kept_time_stamps.add(first_raw_time_stamp)
+    plan = []
+    previous_time_stamp = None
+    dropped = 0
+    for time_stamp in time_stamps:
+        if time_stamp not in kept_time_stamps:
+            dropped += 1
+            continue
+        if dropped:
+            plan.append((previous_time_stamp, time_stamp, dropped))
+        previous_time_stamp = time_stamp
+        dropped = 0
+    if dropped:
+        plan.append((previous_time_stamp, None, dropped))
+    return plan
+
+
+def get_stocks_at(database_service: DatabaseService, time_stamp: datetime) -> dict:
+    """Get the stocks at a snapshot.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        time_stamp (datetime): A time stamp of a snapshot
+
+    Returns:
+        dict: The stocks by the vm_id and the prod_id
+    """
+    if time_stamp is None:
+        return {}
+    return {
+        (stock_record.vm_id, stock_record.prod_id): stock_record.stock
+        for stock_record in utils.get_stock_records_at(database_service, time_stamp)
+    }
+
+
+def rebase_snapshot(
+    database_service: DatabaseService,
+    previous_time_stamp: datetime,
+    time_stamp: datetime,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> bool:
+    """Rewrite a delta snapshot so that it only depends on the kept snapshot before it.
+
+    The stocks that differ from the ones at the previous kept snapshot are recorded at the snapshot, which
+    becomes a full snapshot if there is no previous kept snapshot. The snapshots after it that depended on
+    the snapshots before it depend on its base instead.
+
+    The stock records are written in transactions of at most batch_size rows before the snapshot is
+    rebased. They record the stocks read at the snapshot, so the stocks read at it never change meanwhile.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        previous_time_stamp (datetime): A time stamp of the kept snapshot before it, None if there is none
+        time_stamp (datetime): A time stamp of the snapshot
+        batch_size (int): A maximum number of stock records written in a transaction
+            (default is DEFAULT_BATCH_SIZE)
+
+    Returns:
+        bool: True if the snapshot was a delta snapshot that is rewritten else False
+    """
+    session = database_service.get_session()()
+    snapshot = session.get(Snapshot, time_stamp)
+    if not snapshot.delta:
+        base = time_stamp
+        rebased = False
+    else:
+        previous_stocks = get_stocks_at(database_service, previous_time_stamp)
+        stocks = get_stocks_at(database_service, time_stamp)
+        changed_stocks = [
+            {
+                "time_stamp": time_stamp,
+                "vm_id": vm_id,
+                "prod_id": prod_id,
+                "stock": stock,
+            }
+            for (vm_id, prod_id), stock in stocks.items()
+            if previous_stocks.get((vm_id, prod_id)) != stock
+        ] + [
+            # tombstones of the product stocks removed since the previous kept snapshot
+            {
+                "time_stamp": time_stamp,
+                "vm_id": vm_id,
+                "prod_id": prod_id,
+                "stock": None,
+            }
+            for vm_id, prod_id in previous_stocks.keys() - stocks.keys()
+        ]
+        # a statement binds 4 variables per stock record, so a fleet is never written at once
+        for start in range(0, len(changed_stocks), batch_size):
+            statement = insert(StockRecord).values(
+                changed_stocks[start : start + batch_size]
+            )
+            with database_service.begin() as session:
+                session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["time_stamp", "vm_id", "prod_id"],
+                        set_={"stock": statement.excluded.stock},
+                    )
+                )
+        snapshot = session.get(Snapshot, time_stamp)
+        if previous_time_stamp is None:
+            base = time_stamp
+            session.query(StockRecord).filter(
+                StockRecord.time_stamp == time_stamp, StockRecord.stock.is_(None)
+            ).delete()
+        else:
+            previous_snapshot = session.get(Snapshot, previous_time_stamp)
+            base = previous_snapshot.base
+        snapshot.base = base
+        snapshot.delta = base != time_stamp
+        rebased = True
+    session.query(Snapshot).filter(
+        Snapshot.time_stamp > time_stamp, Snapshot.base < time_stamp
+    ).update({Snapshot.base: base}, synchronize_session=False)
+    utils.bump_data_version(session, utils.STOCK_RECORDS_DATA)
+    session.commit()
+    return rebased
+
+
+def delete_in_batches(
+    database_service: DatabaseService,
+    table: Table,
+    *conditions: object,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """Delete the rows of a table in transactions of at most batch_size rows, oldest first.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        table (Table): The table to delete the rows from
+        conditions (object): The conditions of the rows to delete
+        batch_size (int): A maximum number of rows deleted in a transaction
+            (default is DEFAULT_BATCH_SIZE)
+
+    Returns:
+        int: The number of deleted rows
+    """
+    rowid = literal_column("rowid")
+    batch = (
+        select(rowid)
+        .select_from(table)
+        .filter(*conditions)
+        .order_by(table.c.time_stamp)
+        .limit(batch_size)
+    )
+    deleted = 0
+    while True:
+        with database_service.get_engine().begin() as connection:
+            count = connection.execute(table.delete().where(rowid.in_(batch))).rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def count_rows(
+    database_service: DatabaseService, table: Table, *conditions: object
+) -> int:
+    """Count the rows of a table.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        table (Table): The table to count the rows of
+        conditions (object): The conditions of the rows to count
+
+    Returns:
+        int: The number of rows
+    """
+    session = database_service.get_session()()
+    return session.execute(
+        select(func.count()).select_from(table).filter(*conditions)
+    ).scalar()
+
+
+def between(table: Table, since: datetime, until: datetime) -> list:
+    """Create the conditions of the rows of a table between two time stamps, both excluded.
+
+    Args:
+        table (Table): The table with a time_stamp column
+        since (datetime): The time stamp after which rows are included, None if there is none
+        until (datetime): The time stamp before which rows are included, None if there is none
+
+    Returns:
+        list: A list of conditions
+    """
+    conditions = []
+    if since is not None:
+        conditions.append(table.c.time_stamp > since)
+    if until is not None:
+        conditions.append(table.c.time_stamp < until)
+    return conditions
+
+
+def apply_retention(
+    database_service: DatabaseService,
+    policy: RetentionPolicy,
+    now: datetime = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dry_run: bool = False,
+) -> dict:
+    """Apply a retention policy to the stock records and remove the ones of deleted vending machines.
+
+    Args:
+        database_service (DatabaseService): The object used to interact with database
+        policy (RetentionPolicy): The retention policy to apply
+        now (datetime): The current time stamp
+            (default is None, which means datetime.utcnow())
+        batch_size (int): A maximum number of rows written or deleted in a transaction
+            (default is DEFAULT_BATCH_SIZE)
+        dry_run (bool): A flag to tell if the rows are only counted instead of changed
+            (default is False)
+
+    Returns:
+        dict: A dictionary of the numbers of dropped snapshots, rebased snapshots, deleted stock records and
+            deleted stock records and rollups of deleted vending machines
+    """
+    now = now or datetime.utcnow()
+    raw_cutoff = now - timedelta(days=policy.raw_days)
+    snapshots = Snapshot.__table__
+    stock_records = StockRecord.__table__
+    report = {
+        "dropped_snapshots": 0,
+        "rebased_snapshots": 0,
+        "deleted_stock_records": 0,
+        "deleted_orphan_stock_records": 0,
+        "deleted_orphan_stock_rollups": 0,
+    }
+    for previous_time_stamp, time_stamp, dropped in get_retention_plan(
+        database_service, policy, now
+    ):
+        report["dropped_snapshots"] += dropped
+        # the stock records after the last kept snapshot are never newer than the raw cutoff
+        until = time_stamp or raw_cutoff
+        conditions = between(stock_records, previous_time_stamp, until)
+        if dry_run:
+            session = database_service.get_session()()
+            report["rebased_snapshots"] += bool(
+                time_stamp is not None and session.get(Snapshot, time_stamp).delta
+            )
+            report["deleted_stock_records"] += count_rows(
+                database_service, stock_records, *conditions
+            )
+            continue
+        if time_stamp is not None:
+            report["rebased_snapshots"] += rebase_snapshot(
+                database_service, previous_time_stamp, time_stamp, batch_size
+            )
+        delete_in_batches(
+            database_service,
+            snapshots,
+            *between(snapshots, previous_time_stamp, until),
+            batch_size=batch_size,
+        )
+        report["deleted_stock_records"] += delete_in_batches(
+            database_service, stock_records, *conditions, batch_size=batch_size
+        )
+    vending_machine_ids = select(VendingMachine.id)
+    for table, name in [
+        (stock_records, "deleted_orphan_stock_records"),
+        (HourlyStockRollup.__table__, "deleted_orphan_stock_rollups"),
+        (DailyStockRollup.__table__, "deleted_orphan_stock_rollups"),
+    ]:
+        condition = table.c.vm_id.notin_(vending_machine_ids)
+        if dry_run:
+            report[name] += count_rows(database_service, table, condition)
+        else:
+            report[name] += delete_in_batches(
+                database_service, table, condition, batch_size=batch_size
+            )
+    if not dry_run and any(report.values()):
+        with database_service.begin() as session:
+            utils.bump_data_version(session, utils.STOCK_RECORDS_DATA)
+    return report
+
+
+def main() -> None:
+    """Apply a retention policy from the command line and print the report."""
+    parser = argparse.ArgumentParser(
+        description="Apply a retention policy to the stock records."
+    )
+    parser.add_argument("--database", default=utils.DATABASE_PATH)
+    parser.add_argument("--raw-days", type=int, default=7)
+    parser.add_argument("--hourly-days", type=int, default=30)
+    parser.add_argument("--drop-days", type=int, default=365)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only count the rows that would be affected",
+    )
+    args = parser.parse_args()
+    report = apply_retention(
+        DatabaseService(args.database, default_populate=False),
+        RetentionPolicy(args.raw_days, args.hourly_days, args.drop_days),
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+    )
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
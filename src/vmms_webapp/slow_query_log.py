@@ -0,0 +1,179 @@
+"""Slow Query Log.
+
+This script contains a log of the SQL statements slower than a threshold,
+together with their SQLite query plans, kept in a bounded ring buffer.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# the statements of which sqlite can explain the query plan
+EXPLAINABLE_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+# the rows of an executemany kept in an entry
+MAX_LOGGED_ROWS = 10
+
+
+class SlowQueryLog:
+    """A class used to log the statements slower than a threshold with their query plans.
+
+    Only the latest entries are kept, so the log never grows past its size. The query plan of a slow
+    statement is explained on the connection that executed it, right after it, so it is the plan used.
+
+    Attributes:
+        threshold (float): A minimum number of seconds for a statement to be logged, None to log none
+        entries (deque): The latest slow statements, the oldest first
+        lock (threading.Lock): A lock of the entries
+    """
+
+    def __init__(self, threshold: float = 0.1, size: int = 100) -> None:
+        """Initialize SlowQueryLog.
+
+        Args:
+            threshold (float): A minimum number of seconds for a statement to be logged
+                (default is 0.1, None means no statement is logged)
+            size (int): A maximum number of entries kept in the log
+                (default is 100)
+        """
+        self.threshold = threshold
+        self.entries = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def instrument(self, engine: Engine) -> None:
+        """Log the slow statements executed by an engine.
+
+        Args:
+            engine (Engine): The engine to instrument
+        """
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(engine, "handle_error", self.handle_error)
+
+    def before_cursor_execute(self, connection: object, *args: object) -> None:
+        """Record when a statement starts.
+
+        Args:
+            connection (object): The connection executing the statement
+            args: The cursor, the statement, the parameters, the context and the executemany flag
+        """
+        connection.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(
+        self,
+        connection: object,
+        cursor: object,
+        statement: str,
+        parameters: object,
+        context: object,
+        executemany: bool,
+    ) -> None:
+        """Log a statement that finished if it was slower than the threshold.
+
+        Args:
+            connection (object): The connection executing the statement
+            cursor (object): The cursor of the database driver
+            statement (str): The statement
+            parameters (object): The parameters of the statement, a list of them for an executemany
+            context (object): The execution context
+            executemany (bool): A flag to tell if the statement was executed for many parameters
+        """
+        duration = time.perf_counter() - connection.info["slow_query_start"].pop()
+        if self.threshold is None or duration < self.threshold:
+            return
+        plan = self.explain(
+            connection, statement, parameters[0] if executemany else parameters
+        )
+        entry = {
+            "time_stamp": datetime.utcnow(),
+            "duration": duration * 1000,
+            "statement": statement,
+            "parameters": (
+                [parameters_to_list(row) for row in parameters[:MAX_LOGGED_ROWS]]
+                if executemany
+                else parameters_to_list(parameters)
+            ),
+            "executemany": executemany,
+            "plan": plan,
+        }
+        with self.lock:
+            self.entries.append(entry)
+
+    def handle_error(self, exception_context: object) -> None:
+        """Forget when a statement that failed started.
+
+        Args:
+            exception_context (object): The context of the exception raised by the statement
+        """
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("slow_query_start"):
+            connection.info["slow_query_start"].pop()
+
+    def explain(self, connection: object, statement: str, parameters: object) -> list:
+        """Explain the query plan of a statement.
+
+        Args:
+            connection (object): The connection which executed the statement
+            statement (str): The statement
+            parameters (object): The parameters of the statement
+
+        Returns:
+            list: The steps of the query plan, indented by their depth, or an empty list if the statement
+                cannot be explained
+        """
+        if (
+            connection.dialect.name != "sqlite"
+            or not statement.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS)
+        ):
+            return []
+        try:
+            cursor = connection.connection.cursor()
+            try:
+                rows = cursor.execute(
+                    f"EXPLAIN QUERY PLAN {statement}", parameters or ()
+                ).fetchall()
+            finally:
+                cursor.close()
+        except Exception as e:
+            print("explain:", e)
+            return []
+        depths = {0: -1}
+        plan = []
+        for node_id, parent_id, _, detail in rows:
+            depths[node_id] = depths.get(parent_id, -1) + 1
+            plan.append("  " * depths[node_id] + detail)
+        return plan
+
+    def get_entries(self) -> list[dict]:
+        """Get the slow statements logged.
+
+        Returns:
+            list: The time stamp, the duration in milliseconds, the statement, the parameters and the query
+                plan of each slow statement, the latest first
+        """
+        with self.lock:
+            return list(reversed(self.entries))
+
+    def clear(self) -> None:
+        """Forget every slow statement logged."""
+        with self.lock:
+            self.entries.clear()
+
+
+def parameters_to_list(parameters: object) -> object:
+    """Copy the parameters of a statement into a json serializable object.
+
+    Args:
+        parameters (object): The positional or named parameters of the statement
+
+    Returns:
+        object: A list of positional parameters, or a dictionary of named parameters
+    """
+    if isinstance(parameters, dict):
+        return dict(parameters)
+    return list(parameters or ())
@@ -0,0 +1,186 @@
+"""Snapshot Scheduler.
+
+This script contains a scheduler saving the stock records periodically in a
+background thread, so a time series is recorded without anyone pressing the
+"Save Stock Records" button.
+"""
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+
+DEFAULT_LEASE_NAME = "snapshot_scheduler"
+
+
+class SnapshotScheduler:
+    """A class used to save stock records at a regular interval.
+
+    Every process running a scheduler on the same database competes for a lease that expires after the
+    interval, so the stock records are saved once per interval however many processes there are. The
+    lease is renewed every half interval while a run lasts, so a run slower than the interval keeps it
+    until it commits. A run is skipped while the previous one of the same scheduler is still running.
+
+    Attributes:
+        database_service (DatabaseService): The object used to interact with database
+        interval (float): A number of seconds between two runs
+        delta (bool): A flag to tell if only the changed stocks are recorded
+        lease_name (str): A name of the lease shared by the schedulers of the database
+        owner (str): An identification of the scheduler holding the lease
+        runs (int): A number of runs that saved stock records
+        skipped (int): A number of runs skipped because of another run
+        last_run (dict): The time stamp, the duration in seconds, the number of stock records and the error
+            of the last run, None if there is none
+    """
+
+    def __init__(
+        self,
+        database_service: DatabaseService,
+        interval: float,
+        delta: bool = False,
+        lease_name: str = DEFAULT_LEASE_NAME,
+    ) -> None:
+        """Initialize SnapshotScheduler.
+
+        Args:
+            database_service (DatabaseService): The object used to interact with database
+            interval (float): A number of seconds between two runs
+            delta (bool): A flag to tell if only the changed stocks are recorded
+                (default is False)
+            lease_name (str): A name of the lease shared by the schedulers of the database
+                (default is DEFAULT_LEASE_NAME)
+
+        Raises:
+            ValueError: If the interval is not positive
+        """
+        if interval <= 0:
+            raise ValueError(f"invalid interval {interval}")
+        self.database_service = database_service
+        self.interval = interval
+        self.delta = delta
+        self.lease_name = lease_name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{id(self)}"
+        self.runs = 0
+        self.skipped = 0
+        self.last_run = None
+        self.running = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self) -> None:
+        """Start running in a background thread, the first run being after an interval."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.loop, name="snapshot-scheduler", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """Stop running and wait for the current run to finish.
+
+        Args:
+            timeout (float): A maximum number of seconds to wait
+                (default is None, which means no limit)
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def loop(self) -> None:
+        """Run once every interval until stopped."""
+        while not self.stopped.wait(self.interval):
+            self.run_once()
+
+    def run_once(self) -> bool:
+        """Save the stock records unless another run is due to another scheduler or still running.
+
+        Returns:
+            bool: True if the stock records are saved else False
+        """
+        if not self.running.acquire(blocking=False):
+            self.skipped += 1
+            return False
+        try:
+            if not utils.acquire_lease(
+                self.database_service,
+                self.lease_name,
+                self.owner,
+                timedelta(seconds=self.interval),
+            ):
+                self.skipped += 1
+                return False
+            time_stamp = datetime.utcnow()
+            start = time.perf_counter()
+            rows, error = 0, None
+            finished = threading.Event()
+            renewer = threading.Thread(
+                target=self.renew_lease,
+                args=(finished,),
+                name="snapshot-scheduler-lease",
+                daemon=True,
+            )
+            renewer.start()
+            try:
+                response = utils.save_stock_records(
+                    self.database_service, delta=self.delta
+                )
+                rows = response["data"]["count"]
+            except Exception as e:
+                print("SnapshotScheduler.run_once:", e)
+                error = str(e)
+            finally:
+                finished.set()
+                renewer.join()
+            self.last_run = {
+                "time_stamp": time_stamp,
+                "duration": time.perf_counter() - start,
+                "rows": rows,
+                "error": error,
+            }
+            self.runs += error is None
+            return error is None
+        finally:
+            self.database_service.remove_sessions()
+            self.running.release()
+
+    def renew_lease(self, finished: threading.Event) -> None:
+        """Renew the lease every half interval until a run finishes.
+
+        Args:
+            finished (threading.Event): The event set when the run finishes
+        """
+        try:
+            while not finished.wait(self.interval / 2):
+                try:
+                    utils.renew_lease(
+                        self.database_service,
+                        self.lease_name,
+                        self.owner,
+                        timedelta(seconds=self.interval),
+                    )
+                except Exception as e:
+                    print("SnapshotScheduler.renew_lease:", e)
+        finally:
+            self.database_service.remove_sessions()
+
+    def get_status(self) -> dict:
+        """Get the status of the scheduler.
+
+        Returns:
+            dict: A dictionary of the state, the interval, the numbers of runs and skipped runs and the last run
+        """
+        return {
+            "running": self.thread is not None and self.thread.is_alive(),
+            "interval": self.interval,
+            "delta": self.delta,
+            "owner": self.owner,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "last_run": self.last_run,
+        }
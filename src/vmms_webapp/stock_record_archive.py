@@ -0,0 +1,477 @@
+"""Stock Record Archive.
+
+This script contains an archive of old stock records stored outside of the
+database, in one NumPy file per month. The files are memory-mapped when they
+are read, so a query scans the columns it needs without parsing any rows.
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator
+
+import numpy as np
+
+ARCHIVE_DTYPE = np.dtype(
+    [
+        ("time_stamp", "datetime64[us]"),
+        ("vm_id", "<i4"),
+        ("prod_id", "<i4"),
+        ("stock", "<i8"),
+    ]
+)
+ARCHIVE_FILE_PATTERN = re.compile(r"stock_records-([0-9]{4}-[0-9]{2})\.npy")
+ARCHIVE_UNTIL_FILE = "stock_records.json"
+DEFAULT_ORDER = ("time_stamp", "vm_id", "prod_id")
+# the stock records read or written at once, so a month is never held in memory as a whole
+DEFAULT_BATCH_SIZE = 100000
+
+
+def to_datetime64(time_stamp: datetime) -> np.datetime64:
+    """Convert a naive time stamp in UTC to the time stamps of the archive.
+
+    Args:
+        time_stamp (datetime): A naive time stamp in UTC
+
+    Returns:
+        np.datetime64: The time stamp with a resolution of a microsecond
+    """
+    return np.datetime64(time_stamp, "us")
+
+
+class StockRecordArchive:
+    """A class used to archive stock records in memory-mapped files.
+
+    The stock records of a month are stored in a single file as a structured array of their time stamps
+    (microseconds since the Unix epoch), vm_ids, prod_ids and stocks, sorted by vm_id, prod_id and time stamp.
+    Every stock record before the time stamp the archive is complete until is read from the archive, so
+    they can be deleted from the database once they are archived.
+
+    Attributes:
+        directory (str): A path to the directory of the files
+    """
+
+    def __init__(self, directory: str) -> None:
+        """Initialize StockRecordArchive.
+
+        Args:
+            directory (str): A path to the directory of the files
+        """
+        self.directory = directory
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def get_path(self, month: np.datetime64) -> str:
+        """Get the path to the file of a month.
+
+        Args:
+            month (np.datetime64): The month of the stock records
+
+        Returns:
+            str: The path to the file of the month
+        """
+        return os.path.join(self.directory, f"stock_records-{month}.npy")
+
+    def get_months(self) -> list[np.datetime64]:
+        """Get the months of which the stock records are archived.
+
+        Returns:
+            list: A list of the months in ascending order
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            np.datetime64(match.group(1), "M")
+            for match in map(ARCHIVE_FILE_PATTERN.fullmatch, os.listdir(self.directory))
+            if match is not None
+        )
+
+    def get_until(self) -> datetime:
+        """Get the time stamp before which every stock record is archived.
+
+        Returns:
+            datetime: The time stamp, None if nothing is archived
+        """
+        try:
+            with open(os.path.join(self.directory, ARCHIVE_UNTIL_FILE)) as file:
+                return datetime.fromisoformat(json.load(file)["until"])
+        except FileNotFoundError:
+            return None
+
+    def set_until(self, until: datetime) -> None:
+        """Set the time stamp before which every stock record is archived.
+
+        Args:
+            until (datetime): The time stamp
+        """
+        path = os.path.join(self.directory, ARCHIVE_UNTIL_FILE)
+        with open(f"{path}.tmp", "w") as file:
+            json.dump({"until": until.isoformat()}, file)
+        os.replace(f"{path}.tmp", path)
+
+    def load(self, month: np.datetime64) -> np.ndarray:
+        """Load the stock records of a month.
+
+        The memory map of a file is reused until the file is replaced.
+
+        Args:
+            month (np.datetime64): The month of the stock records
+
+        Returns:
+            np.ndarray: A read-only structured array memory-mapped to the file of the month
+        """
+        path = self.get_path(month)
+        stat = os.stat(path)
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            cached = self.files.get(path)
+            if cached is None or cached[0] != key:
+                cached = self.files[path] = (key, np.load(path, mmap_mode="r"))
+        return cached[1]
+
+    def add(self, records: np.ndarray) -> int:
+        """Add stock records to the archive.
+
+        Args:
+            records (np.ndarray): A structured array of stock records with ARCHIVE_DTYPE
+
+        Returns:
+            int: The number of months written
+        """
+        return self.add_batches([records])
+
+    def add_batches(
+        self, batches: Iterable[np.ndarray], batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> int:
+        """Add batches of stock records to the archive.
+
+        The batches are appended to a file per month before the file of each month is rewritten, so only one
+        batch is held in memory. A stock record that is already archived is replaced, so the same stock records
+        can be added again.
+
+        Args:
+            batches (Iterable): The structured arrays of stock records with ARCHIVE_DTYPE
+            batch_size (int): A number of stock records written at once
+                (default is DEFAULT_BATCH_SIZE)
+
+        Returns:
+            int: The number of months written
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        added = {}
+        try:
+            for records in batches:
+                months = records["time_stamp"].astype("datetime64[M]")
+                for month in np.unique(months):
+                    if month not in added:
+                        added[month] = open(f"{self.get_path(month)}.added", "wb")
+                    records[months == month].tofile(added[month])
+            for month, file in added.items():
+                file.close()
+                self.write_month(month, file.name, batch_size)
+        finally:
+            for file in added.values():
+                file.close()
+                if os.path.exists(file.name):
+                    os.remove(file.name)
+        return len(added)
+
+    def write_month(
+        self, month: np.datetime64, added_path: str, batch_size: int
+    ) -> None:
+        """Merge the stock records added to a month into its file.
+
+        Only the keys of the month are sorted in memory, the stock records are copied in batches. The file
+        is written next to the previous one and moved in place, so a reader never sees a partially written
+        file.
+
+        Args:
+            month (np.datetime64): The month of the stock records
+            added_path (str): A path to the raw file of the stock records added to the month
+            batch_size (int): A number of stock records written at once
+        """
+        path = self.get_path(month)
+        added = np.memmap(added_path, dtype=ARCHIVE_DTYPE, mode="r")
+        existing = (
+            np.load(path, mmap_mode="r")
+            if os.path.exists(path)
+            else np.empty(0, dtype=ARCHIVE_DTYPE)
+        )
+
+        def column(key: str) -> np.ndarray:
+            return np.concatenate([added[key], existing[key]])
+
+        # lexsort is stable, so the added stock record comes first among the ones with the same key
+        order = np.lexsort([column(key) for key in ("time_stamp", "prod_id", "vm_id")])
+        duplicate = np.ones(len(order) - 1, dtype=bool)
+        for key in DEFAULT_ORDER:
+            values = column(key)[order]
+            duplicate &= values[1:] == values[:-1]
+        order = order[np.concatenate([[True], ~duplicate])]
+        month_records = np.lib.format.open_memmap(
+            f"{path}.tmp", mode="w+", dtype=ARCHIVE_DTYPE, shape=(len(order),)
+        )
+        for start in range(0, len(order), batch_size):
+            indices = order[start : start + batch_size]
+            is_added = indices < len(added)
+            batch = np.empty(len(indices), dtype=ARCHIVE_DTYPE)
+            batch[is_added] = added[indices[is_added]]
+            batch[~is_added] = existing[indices[~is_added] - len(added)]
+            month_records[start : start + len(indices)] = batch
+        month_records.flush()
+        os.replace(f"{path}.tmp", path)
+
+    def iter_months(
+        self,
+        vm_id: int = None,
+        prod_id: int = None,
+        since: datetime = None,
+        until: datetime = None,
+        cursor: dict = None,
+        order: tuple = DEFAULT_ORDER,
+    ) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        """Iterate over the months with archived stock records in a time range.
+
+        Only the files of the months overlapping the time range are read, and the stock records of a
+        vending machine are found by a binary search as the files are sorted by vm_id.
+
+        Args:
+            vm_id (int): An id of the interested vending machine
+                (default is None)
+            prod_id (int): An id of the interested product
+                (default is None)
+            since (datetime): The earliest time stamp to include
+                (default is None)
+            until (datetime): The time stamp before which stock records are included
+                (default is None)
+            cursor (dict): The key of the last stock record already read, only stock records after it
+                in the order are included (default is None)
+            order (tuple): The keys by which the cursor is compared
+                (default is DEFAULT_ORDER)
+
+        Yields:
+            tuple: The memory-mapped stock records of a month, in ascending order of months, and the mask of
+                the selected ones
+        """
+        archive_until = self.get_until()
+        if archive_until is None:
+            return
+        until = to_datetime64(
+            archive_until if until is None else min(until, archive_until)
+        )
+        since = None if since is None else to_datetime64(since)
+        for month in self.get_months():
+            start, end = month.astype("datetime64[us]"), (month + 1).astype(
+                "datetime64[us]"
+            )
+            if until <= start or (since is not None and end <= since):
+                continue
+            records = self.load(month)
+            if vm_id is not None:
+                records = records[
+                    bisect.bisect_left(records["vm_id"], vm_id) : bisect.bisect_right(
+                        records["vm_id"], vm_id
+                    )
+                ]
+            mask = records["time_stamp"] < until
+            if since is not None:
+                mask &= records["time_stamp"] >= since
+            if prod_id is not None:
+                mask &= records["prod_id"] == prod_id
+            if cursor is not None:
+                after = np.zeros(len(records), dtype=bool)
+                equal = np.ones(len(records), dtype=bool)
+                for key in order:
+                    value = cursor[key]
+                    if key == "time_stamp":
+                        value = to_datetime64(value)
+                    after |= equal & (records[key] > value)
+                    equal &= records[key] == value
+                mask &= after
+            yield records, mask
+
+    def iter_batches(
+        self,
+        since: datetime = None,
+        until: datetime = None,
+        cursor: dict = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Iterator[np.ndarray]:
+        """Iterate over archived stock records in batches ordered by time stamp, vm_id and prod_id.
+
+        The months do not overlap, so the stock records are only sorted within each month and one batch is
+        copied out of the files at a time.
+
+        Args:
+            since (datetime): The earliest time stamp to include
+                (default is None)
+            until (datetime): The time stamp before which stock records are included
+                (default is None)
+            cursor (dict): The key of the last stock record already read, only stock records after it
+                are included (default is None)
+            batch_size (int): A number of stock records in each batch
+                (default is DEFAULT_BATCH_SIZE)
+
+        Yields:
+            np.ndarray: A structured array of a batch of stock records
+        """
+        for records, mask in self.iter_months(since=since, until=until, cursor=cursor):
+            indices = np.flatnonzero(mask)
+            indices = indices[
+                np.lexsort([records[key][indices] for key in reversed(DEFAULT_ORDER)])
+            ]
+            for start in range(0, len(indices), batch_size):
+                yield records[indices[start : start + batch_size]]
+
+    def select(
+        self,
+        vm_id: int = None,
+        prod_id: int = None,
+        since: datetime = None,
+        until: datetime = None,
+        cursor: dict = None,
+        order: tuple = DEFAULT_ORDER,
+        limit: int = None,
+    ) -> np.ndarray:
+        """Select archived stock records.
+
+        Only the files of the months overlapping the time range are read, and the stock records of a
+        vending machine are found by a binary search as the files are sorted by vm_id.
+
+        Args:
+            vm_id (int): An id of the interested vending machine
+                (default is None)
+            prod_id (int): An id of the interested product
+                (default is None)
+            since (datetime): The earliest time stamp to include
+                (default is None)
+            until (datetime): The time stamp before which stock records are included
+                (default is None)
+            cursor (dict): The key of the last stock record already read, only stock records after it
+                in the order are included (default is None)
+            order (tuple): The keys by which the stock records are ordered
+                (default is DEFAULT_ORDER)
+            limit (int): A maximum number of stock records
+                (default is None)
+
+        Returns:
+            np.ndarray: A structured array of the stock records in the order
+        """
+        selected = [
+            records[mask]
+            for records, mask in self.iter_months(
+                vm_id, prod_id, since, until, cursor, order
+            )
+        ]
+        if not selected:
+            return np.empty(0, dtype=ARCHIVE_DTYPE)
+        records = np.concatenate(selected)
+        records = records[np.lexsort([records[key] for key in reversed(order)])]
+        return records[:limit]
+
+    def get_at(
+        self,
+        time_stamp: datetime,
+        vm_id: int = None,
+        prod_id: int = None,
+        order: tuple = DEFAULT_ORDER,
+    ) -> np.ndarray:
+        """Get the archived stock records of the latest snapshot at or before a time stamp.
+
+        Args:
+            time_stamp (datetime): The time stamp at which the stocks are interested
+            vm_id (int): An id of the interested vending machine
+                (default is None)
+            prod_id (int): An id of the interested product
+                (default is None)
+            order (tuple): The keys by which the stock records are ordered
+                (default is DEFAULT_ORDER)
+
+        Returns:
+            np.ndarray: A structured array of the stock records in the order, which is empty if there is none
+        """
+        archive_until = self.get_until()
+        if archive_until is None:
+            return np.empty(0, dtype=ARCHIVE_DTYPE)
+        time_stamp = to_datetime64(time_stamp)
+        for month in reversed(self.get_months()):
+            if time_stamp < month.astype("datetime64[us]"):
+                continue
+            time_stamps = self.load(month)["time_stamp"]
+            time_stamps = time_stamps[
+                (time_stamps <= time_stamp)
+                & (time_stamps < to_datetime64(archive_until))
+            ]
+            if len(time_stamps) > 0:
+                latest = time_stamps.max().astype(datetime)
+                return self.select(
+                    vm_id,
+                    prod_id,
+                    since=latest,
+                    until=latest + timedelta(microseconds=1),
+                    order=order,
+                )
+        return np.empty(0, dtype=ARCHIVE_DTYPE)
+
+    def get_buckets(
+        self,
+        width: int,
+        vm_id: int = None,
+        prod_id: int = None,
+        since: datetime = None,
+        until: datetime = None,
+    ) -> list[dict]:
+        """Get the archived stock records downsampled into buckets of time.
+
+        Args:
+            width (int): The width of a bucket in seconds
+            vm_id (int): An id of the interested vending machine
+                (default is None)
+            prod_id (int): An id of the interested product
+                (default is None)
+            since (datetime): The earliest time stamp to include
+                (default is None)
+            until (datetime): The time stamp before which stock records are included
+                (default is None)
+
+        Returns:
+            list: A list of dictionaries of the start of the bucket, the vm_id, the prod_id, the number of stock
+                records and the min, max, first, last and avg stock, ordered by vm_id, prod_id and bucket
+        """
+        records = self.select(
+            vm_id, prod_id, since, until, order=("vm_id", "prod_id", "time_stamp")
+        )
+        if len(records) == 0:
+            return []
+        seconds = records["time_stamp"].astype("datetime64[s]").astype(np.int64)
+        buckets = seconds // width * width
+        # the stock records of a bucket are contiguous as the buckets are ordered like the time stamps
+        boundaries = (
+            (records["vm_id"][1:] != records["vm_id"][:-1])
+            | (records["prod_id"][1:] != records["prod_id"][:-1])
+            | (buckets[1:] != buckets[:-1])
+        )
+        starts = np.flatnonzero(np.concatenate([[True], boundaries]))
+        ends = np.append(starts[1:], len(records))
+        stocks = records["stock"]
+        counts = ends - starts
+        columns = {
+            "time_stamp": buckets[starts]
+            .astype("datetime64[s]")
+            .astype("datetime64[us]")
+            .tolist(),
+            "vm_id": records["vm_id"][starts].tolist(),
+            "prod_id": records["prod_id"][starts].tolist(),
+            "count": counts.tolist(),
+            "min": np.minimum.reduceat(stocks, starts).tolist(),
+            "max": np.maximum.reduceat(stocks, starts).tolist(),
+            "first": stocks[starts].tolist(),
+            "last": stocks[ends - 1].tolist(),
+            "avg": (np.add.reduceat(stocks, starts) / counts).tolist(),
+        }
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
@@ -0,0 +1,54 @@
+"""Test: Get Depletion Forecast API."""
+from datetime import datetime, timedelta
+
+import pytest
+from flask.testing import FlaskClient
+
+from vmms_webapp.app import create_app
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
+END_POINT = "/api/stock_records/forecast"
+
+
+def test_get_depletion_forecast_status(client: FlaskClient):
+    response = client.get(END_POINT)
+    assert response.status_code == 200
+
+
+def test_get_depletion_forecast_response_success():
+    database_service = DatabaseService("sqlite://")
+    for name in ("vm_001", "vm_002"):
+        utils.add_vending_machine(
+            database_service, VendingMachine(name=name, location="loc_001")
+        )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(2, 1, 100))
+    start = datetime(2023, 1, 1)
+    utils.save_stock_records(database_service, time_stamp=start)
+    utils.update_product_stock(database_service, Stock(1, 1, 70))
+    utils.save_stock_records(database_service, time_stamp=start + timedelta(hours=3))
+    client = create_app(database_service).test_client()
+    response = client.get(f"{END_POINT}?prod_id=1")
+    response_json = response.get_json()
+    assert response_json["status"] == "success"
+    assert response_json["message"] == "depletion forecast is successfully retrieved"
+    forecast = response_json["data"]["get"]
+    assert [row["vm_id"] for row in forecast] == [1, 2]
+    assert [row["rate"] for row in forecast] == [pytest.approx(10.0), 0.0]
+    assert forecast[0]["hours_to_empty"] == pytest.approx(7.0)
+    assert forecast[1]["empty_at"] is None
+    response = client.get(f"{END_POINT}?vm_id=1&format=columnar")
+    assert response.get_json()["data"]["get"]["empty_at"] == [
+        utils.to_epoch_milliseconds(start + timedelta(hours=10))
+    ]
+
+
+def test_get_depletion_forecast_response_fail(client: FlaskClient):
+    response = client.get(f"{END_POINT}?since=yesterday")
+    response_json = response.get_json()
+    assert response.status_code == 400
+    assert response_json["status"] == "error"
+    assert response_json["message"] == "unable to retrieve depletion forecast"
@@ -0,0 +1,53 @@
+"""Test: Get Metrics API."""
+
+from pathlib import Path
+
+from flask.testing import FlaskClient
+
+from vmms_webapp.app import create_app
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
+END_POINT = "/metrics"
+
+
+def test_get_metrics_status(client: FlaskClient):
+    response = client.get(END_POINT)
+    assert response.status_code == 200
+    assert (
+        response.headers["Content-Type"] == "text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def test_get_metrics_response_success(tmp_path: Path):
+    database_service = DatabaseService(
+        f"sqlite:///{tmp_path / 'vending_machine.db'}",
+        metrics_dir=str(tmp_path / "metrics"),
+    )
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 10))
+    utils.save_stock_records(database_service)
+    utils.save_stock_records(database_service, delta=True)
+    app = create_app(database_service)
+    client = app.test_client()
+    client.get("/")
+    client.get("/")
+    client.get("/missing")
+    lines = client.get(END_POINT).get_data(as_text=True).splitlines()
+    assert 'vmms_http_requests_total{method="GET",route="/",status="200"} 2' in lines
+    assert (
+        'vmms_http_requests_total{method="GET",route="<unmatched>",status="404"} 1'
+        in lines
+    )
+    assert 'vmms_http_request_duration_seconds_count{method="GET",route="/"} 2' in lines
+    assert "vmms_fragment_cache_hits_total 1" in lines
+    assert "vmms_fragment_cache_misses_total 1" in lines
+    assert 'vmms_db_pool_size{engine="primary"} 5' in lines
+    assert 'vmms_snapshots_total{mode="full"} 1' in lines
+    assert 'vmms_snapshots_total{mode="delta"} 1' in lines
+    assert 'vmms_stock_records_saved_total{mode="full"} 1' in lines
+    assert 'vmms_stock_records_saved_total{mode="delta"} 0' in lines
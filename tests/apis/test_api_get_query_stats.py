@@ -0,0 +1,57 @@
+"""Test: Get Query Stats API."""
+
+import re
+
+from flask.testing import FlaskClient
+
+from vmms_webapp.app import create_app
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
+END_POINT = "/api/query_stats"
+
+
+def test_get_query_stats_status(client: FlaskClient):
+    response = client.get(END_POINT)
+    assert response.status_code == 200
+
+
+def test_get_query_stats_server_timing(client: FlaskClient):
+    response = client.get("/api/vending_machines")
+    assert re.fullmatch(
+        r'db;dur=\d+\.\d{3};desc="statements: [1-9]\d*"',
+        response.headers["Server-Timing"],
+    )
+
+
+def test_get_query_stats_response_success():
+    database_service = DatabaseService("sqlite://")
+    for vm_id in (1, 2):
+        utils.add_vending_machine(
+            database_service, VendingMachine(name=f"vm_00{vm_id}", location="loc_001")
+        )
+        utils.add_product_stock(database_service, Stock(vm_id, 1, 10))
+    utils.save_stock_records(database_service)
+    app = create_app(database_service)
+    client = app.test_client()
+    client.get("/")
+    client.get("/")
+    client.get("/api/stock_records/?stream=1").get_data()
+    client.get("/missing")
+    response = client.get(END_POINT)
+    response_json = response.get_json()
+    assert response_json["status"] == "success"
+    assert response_json["message"] == "query stats are successfully retrieved"
+    routes = {
+        (route["method"], route["route"]): route
+        for route in response_json["data"]["get"]
+    }
+    assert routes[("GET", "/")]["requests"] == 2
+    assert routes[("GET", "/")]["statements"] > 0
+    # the statements of a streamed response are counted once it is sent
+    assert routes[("GET", "/api/stock_records/")]["statements"] > 0
+    assert routes[("GET", "<unmatched>")]["statements"] == 0
+    durations = [route["duration"] for route in response_json["data"]["get"]]
+    assert durations == sorted(durations, reverse=True)
@@ -0,0 +1,48 @@
+"""Test: Get Restock Plan API."""
+
+from flask.testing import FlaskClient
+
+from vmms_webapp.app import create_app
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
+END_POINT = "/api/product_stocks/restock_plan"
+
+
+def test_get_restock_plan_status(client: FlaskClient):
+    response = client.get(END_POINT)
+    assert response.status_code == 200
+
+
+def test_get_restock_plan_response_success():
+    database_service = DatabaseService("sqlite://")
+    for name in ("vm_001", "vm_002"):
+        utils.add_vending_machine(
+            database_service, VendingMachine(name=name, location="loc_001")
+        )
+    utils.add_product_stock(database_service, Stock(1, 1, 5))
+    utils.add_product_stock(database_service, Stock(2, 1, 15))
+    app = create_app(database_service)
+    app.config["RESTOCK_TARGET"] = 50
+    client = app.test_client()
+    response = client.get(END_POINT)
+    response_json = response.get_json()
+    assert response_json["status"] == "success"
+    assert response_json["message"] == "restock plan is successfully retrieved"
+    assert response_json["data"]["get"]["pick_list"] == [
+        {"prod_id": 1, "name": "taro", "units": 45}
+    ]
+    response = client.get(f"{END_POINT}?threshold=20&target=30&hours=1")
+    assert response.get_json()["data"]["get"]["units"] == 40
+    response = client.get(f"{END_POINT}?location=loc_002")
+    assert response.get_json()["data"]["get"]["locations"] == []
+
+
+def test_get_restock_plan_response_fail(client: FlaskClient):
+    response = client.get(f"{END_POINT}?threshold=many")
+    response_json = response.get_json()
+    assert response.status_code == 400
+    assert response_json["status"] == "error"
+    assert response_json["message"] == "unable to retrieve restock plan"
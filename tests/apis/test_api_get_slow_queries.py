@@ -0,0 +1,38 @@
+"""Test: Get Slow Queries API."""
+
+from flask.testing import FlaskClient
+
+from vmms_webapp.app import create_app
+from vmms_webapp.database.database_service import DatabaseService
+
+END_POINT = "/api/slow_queries"
+
+
+def test_get_slow_queries_disabled(client: FlaskClient):
+    # the statements and their parameters are not served unless enabled
+    assert client.get(END_POINT).status_code == 404
+    assert client.delete(END_POINT).status_code == 404
+
+
+def test_get_slow_queries_response_success():
+    database_service = DatabaseService("sqlite://", slow_query_threshold=0)
+    app = create_app(database_service)
+    app.config.update(
+        {"TESTING": True, "WTF_CSRF_ENABLED": False, "SLOW_QUERIES_API": True}
+    )
+    client = app.test_client()
+    client.get("/api/vending_machines")
+    response_json = client.get(END_POINT).get_json()
+    assert response_json["status"] == "success"
+    assert response_json["message"] == "slow queries are successfully retrieved"
+    assert response_json["data"]["threshold"] == 0
+    entry = next(
+        entry
+        for entry in response_json["data"]["get"]
+        if "FROM vending_machines" in entry["statement"]
+    )
+    assert entry["plan"] == ["SCAN vending_machines"]
+    response = client.delete(END_POINT)
+    assert response.status_code == 200
+    assert response.get_json()["message"] == "slow queries are successfully cleared"
+    assert database_service.get_slow_query_log().get_entries() == []
@@ -0,0 +1,54 @@
+"""Test: Get Snapshot Scheduler API."""
+
+from flask.testing import FlaskClient
+
+from vmms_webapp.app import create_app
+from vmms_webapp.database.database_service import DatabaseService
+
+END_POINT = "/api/stock_records/scheduler"
+
+
+def test_get_snapshot_scheduler_status(client: FlaskClient):
+    response = client.get(END_POINT)
+    assert response.status_code == 200
+
+
+def test_get_snapshot_scheduler_response_disabled(client: FlaskClient):
+    response = client.get(END_POINT)
+    response_json = response.get_json()
+    assert response_json["status"] == "success"
+    assert response_json["data"]["get"] is None
+
+
+def test_get_snapshot_scheduler_response_success():
+    app = create_app(DatabaseService("sqlite://"), snapshot_interval=3600)
+    snapshot_scheduler = app.extensions["snapshot_scheduler"]
+    try:
+        assert snapshot_scheduler.run_once()
+        response = app.test_client().get(END_POINT)
+        response_json = response.get_json()
+        assert response_json["status"] == "success"
+        assert (
+            response_json["message"]
+            == "snapshot scheduler status is successfully retrieved"
+        )
+        status = response_json["data"]["get"]
+        assert status["running"]
+        assert status["interval"] == 3600
+        assert status["runs"] == 1
+        assert status["last_run"]["rows"] == 0
+        assert status["last_run"]["error"] is None
+    finally:
+        snapshot_scheduler.stop()
+
+
+def test_get_snapshot_scheduler_response_delta():
+    app = create_app(
+        DatabaseService("sqlite://"), snapshot_interval=3600, delta_stock_records=True
+    )
+    snapshot_scheduler = app.extensions["snapshot_scheduler"]
+    try:
+        response = app.test_client().get(END_POINT)
+        assert response.get_json()["data"]["get"]["delta"]
+    finally:
+        snapshot_scheduler.stop()
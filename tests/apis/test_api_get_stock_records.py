@@ -1,8 +1,13 @@
 """Test: Get Stock Records API."""
 
+import json
+from typing import Iterator
+
 import pytest
 from flask.testing import FlaskClient
 
+from vmms_webapp.database import utils
+
 END_POINT = "/api/stock_records/"
 
 
@@ -50,6 +55,98 @@ def test_get_stock_records_response_success(client: FlaskClient):
     assert response_json["message"] == "all stock records are successfully retrieved"
 
 
+def test_get_stock_records_not_modified(client: FlaskClient):
+    response = client.get(END_POINT)
+    etag = response.headers["ETag"]
+    response = client.get(END_POINT, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.data == b""
+    client.post("/api/stock_records/save")
+    response = client.get(END_POINT, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_get_stock_records_stream(client: FlaskClient):
+    response = client.get(f"{END_POINT}?stream=1")
+    assert response.is_streamed
+    assert response.mimetype == "application/json"
+    assert response.get_json() == client.get(END_POINT).get_json()
+
+
+def test_get_stock_records_ndjson(client: FlaskClient):
+    response = client.get(f"{END_POINT}?format=ndjson")
+    assert response.is_streamed
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == client.get(END_POINT).get_json()[
+        "data"
+    ]["get"]
+
+
+def test_get_stock_records_ndjson_error(
+    client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+):
+    iter_stock_record_batches = utils.iter_stock_record_batches
+
+    def failing_iter_stock_record_batches(*args, **kwargs) -> Iterator[list]:
+        yield next(iter_stock_record_batches(*args, **kwargs))
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(
+        utils, "iter_stock_record_batches", failing_iter_stock_record_batches
+    )
+    response = client.get(f"{END_POINT}?format=ndjson")
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0]["vm_id"] == 1
+    assert lines[-1] == {"error": "unable to retrieve stock records"}
+
+
+def test_get_stock_records_pagination(client: FlaskClient):
+    stock_records = client.get(END_POINT).get_json()["data"]["get"]
+    paged_stock_records = []
+    response_data = client.get(f"{END_POINT}?limit=2").get_json()["data"]
+    paged_stock_records += response_data["get"]
+    while response_data["next"]:
+        assert len(response_data["get"]) == 2
+        response_data = client.get(
+            f"{END_POINT}?limit=2&cursor={response_data['next']}"
+        ).get_json()["data"]
+        paged_stock_records += response_data["get"]
+    assert paged_stock_records == stock_records
+
+
+@pytest.mark.parametrize(
+    "query, length",
+    [
+        ("since=2000-01-01T00:00:00", None),
+        ("until=2000-01-01T00:00:00", 0),
+        ("since=2999-01-01T00:00:00Z", 0),
+        ("until=2999-01-01T00:00:00%2B07:00&limit=1", 1),
+    ],
+)
+def test_get_stock_records_time_range(client: FlaskClient, query: str, length: int):
+    stock_records = client.get(END_POINT).get_json()["data"]["get"]
+    response = client.get(f"{END_POINT}?{query}")
+    assert response.status_code == 200
+    assert len(response.get_json()["data"]["get"]) == (
+        len(stock_records) if length is None else length
+    )
+
+
+@pytest.mark.parametrize(
+    "query", ["since=yesterday", "limit=many", "cursor=not-a-cursor"]
+)
+def test_get_stock_records_response_fail(client: FlaskClient, query: str):
+    response = client.get(f"{END_POINT}?{query}")
+    response_json = response.get_json()
+    assert response.status_code == 400
+    assert response_json["data"] == {"get": [], "next": None}
+    assert response_json["status"] == "error"
+    assert response_json["message"] == "unable to retrieve stock records"
+
+
 @pytest.mark.parametrize("vending_machine", [{"id": 1}, {"id": 2}, {"id": 3}])
 def test_tear_down(client: FlaskClient, vending_machine: dict):
     response = client.post(f"/api/vending_machines/delete/{vending_machine['id']}")
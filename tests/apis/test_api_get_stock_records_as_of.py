@@ -0,0 +1,52 @@
+"""Test: Get Stock Records As Of API."""
+
+from flask.testing import FlaskClient
+
+from vmms_webapp.app import create_app
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
+END_POINT = "/api/stock_records/as_of"
+
+
+def test_get_stock_records_as_of_status(client: FlaskClient):
+    response = client.get(END_POINT)
+    assert response.status_code == 200
+
+
+def test_get_stock_records_as_of_response_success():
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(1, 2, 200))
+    client = create_app(database_service).test_client()
+    assert client.get(END_POINT).get_json()["data"]["get"] == []
+    utils.save_stock_records(database_service)
+    utils.update_product_stock(database_service, Stock(1, 1, 90))
+    utils.save_stock_records(database_service, delta=True)
+    response = client.get(END_POINT)
+    response_json = response.get_json()
+    assert response_json["status"] == "success"
+    assert [
+        (stock_record["prod_id"], stock_record["stock"])
+        for stock_record in response_json["data"]["get"]
+    ] == [(1, 90), (2, 200)]
+    response = client.get(f"{END_POINT}?time_stamp=2000-01-01T00:00:00Z")
+    assert response.get_json()["data"]["get"] == []
+    response = client.get(f"{END_POINT}?prod_id=2")
+    assert [
+        (stock_record["prod_id"], stock_record["stock"])
+        for stock_record in response.get_json()["data"]["get"]
+    ] == [(2, 200)]
+
+
+def test_get_stock_records_as_of_response_fail(client: FlaskClient):
+    response = client.get(f"{END_POINT}?time_stamp=yesterday")
+    response_json = response.get_json()
+    assert response.status_code == 400
+    assert response_json["status"] == "error"
+    assert response_json["message"] == "unable to retrieve stock records"
@@ -0,0 +1,60 @@
+"""Test: Get Stock Rollups API."""
+
+import pytest
+from flask.testing import FlaskClient
+
+from vmms_webapp.app import create_app
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
+END_POINT = "/api/stock_records/rollups"
+
+
+@pytest.mark.parametrize("period", ["hourly", "daily"])
+def test_get_stock_rollups_status(client: FlaskClient, period: str):
+    response = client.get(f"{END_POINT}/{period}")
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("period", ["hourly", "daily"])
+def test_get_stock_rollups_response_success(period: str):
+    database_service = DatabaseService("sqlite://")
+    for name in ("vm_001", "vm_002"):
+        utils.add_vending_machine(
+            database_service, VendingMachine(name=name, location="loc_001")
+        )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(2, 1, 100))
+    utils.save_stock_records(database_service)
+    utils.update_product_stock(database_service, Stock(1, 1, 70))
+    utils.save_stock_records(database_service)
+    client = create_app(database_service).test_client()
+    response = client.get(f"{END_POINT}/{period}?vm_id=1")
+    response_json = response.get_json()
+    assert response_json["status"] == "success"
+    assert (
+        response_json["message"] == f"{period} stock rollups are successfully retrieved"
+    )
+    assert (
+        sum(stock_rollup["consumed"] for stock_rollup in response_json["data"]["get"])
+        == 30
+    )
+    assert {stock_rollup["vm_id"] for stock_rollup in response_json["data"]["get"]} == {
+        1
+    }
+    response = client.get(f"{END_POINT}/{period}?prod_id=1")
+    assert {
+        stock_rollup["vm_id"] for stock_rollup in response.get_json()["data"]["get"]
+    } == {1, 2}
+
+
+def test_get_stock_rollups_response_fail(client: FlaskClient):
+    response = client.get(f"{END_POINT}/daily?since=yesterday")
+    response_json = response.get_json()
+    assert response.status_code == 400
+    assert response_json["status"] == "error"
+    assert response_json["message"] == "unable to retrieve daily stock rollups"
+    response = client.get(f"{END_POINT}/weekly")
+    assert response.status_code == 404
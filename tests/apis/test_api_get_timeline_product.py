@@ -31,3 +31,80 @@ def test_get_timeline_vending_machine_response_success(
         response_json["message"]
         == f"all stock records of product {product['id']} are successfully retrieved"
     )
+
+
+def test_get_timeline_product_not_modified(client: FlaskClient):
+    response = client.get(f"{END_POINT}/1")
+    etag = response.headers["ETag"]
+    response = client.get(f"{END_POINT}/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    response = client.get(f"{END_POINT}/2", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    response = client.get(f"{END_POINT}/1", headers={"If-None-Match": "stale"})
+    assert response.status_code == 200
+
+
+def test_get_timeline_product_pagination(client: FlaskClient):
+    stock_timeline = client.get(f"{END_POINT}/1").get_json()["data"]["get"]
+    assert len(stock_timeline) > 1
+    assert [stock_record["vm_id"] for stock_record in stock_timeline] == sorted(
+        stock_record["vm_id"] for stock_record in stock_timeline
+    )
+    paged_stock_timeline = []
+    next_cursor = ""
+    while next_cursor is not None:
+        response_data = client.get(
+            f"{END_POINT}/1?limit=1&cursor={next_cursor}"
+        ).get_json()["data"]
+        paged_stock_timeline += response_data["get"]
+        next_cursor = response_data["next"]
+    assert paged_stock_timeline == stock_timeline
+
+
+def test_get_timeline_product_bucket(client: FlaskClient):
+    stock_timeline = client.get(f"{END_POINT}/1").get_json()["data"]["get"]
+    response = client.get(f"{END_POINT}/1?bucket=1d")
+    assert response.status_code == 200
+    response_data = response.get_json()["data"]
+    assert response_data["next"] is None
+    assert sum(bucket["count"] for bucket in response_data["get"]) == len(
+        stock_timeline
+    )
+    assert all(
+        bucket["min"] <= bucket["avg"] <= bucket["max"]
+        for bucket in response_data["get"]
+    )
+
+
+def test_get_timeline_product_bucket_response_fail(client: FlaskClient):
+    response = client.get(f"{END_POINT}/1?bucket=5x")
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "error"
+
+
+def test_get_timeline_product_columnar(client: FlaskClient):
+    stock_timeline = client.get(f"{END_POINT}/1?limit=2").get_json()["data"]
+    response = client.get(f"{END_POINT}/1?limit=2&format=columnar")
+    assert response.status_code == 200
+    response_data = response.get_json()["data"]
+    assert response_data["next"] == stock_timeline["next"]
+    for key in ("vm_id", "prod_id", "stock"):
+        assert response_data["get"][key] == [
+            stock_record[key] for stock_record in stock_timeline["get"]
+        ]
+    assert all(
+        isinstance(time_stamp, int) for time_stamp in response_data["get"]["time_stamp"]
+    )
+    response = client.get(f"{END_POINT}/1?bucket=1d&format=columnar")
+    response_data = response.get_json()["data"]
+    assert set(response_data["get"]) == {
+        "time_stamp",
+        "vm_id",
+        "prod_id",
+        "count",
+        "min",
+        "max",
+        "first",
+        "last",
+        "avg",
+    }
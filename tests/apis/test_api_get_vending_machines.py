@@ -0,0 +1,72 @@
+"""Test: Get Vending Machines API."""
+
+import pytest
+from flask.testing import FlaskClient
+
+END_POINT = "/api/vending_machines"
+
+
+@pytest.mark.parametrize(
+    "vending_machine",
+    [
+        {"id": 1, "name": "vm_001", "location": "canteen"},
+        {"id": 2, "name": "vm_002", "location": "library"},
+        {"id": 3, "name": "vm_003", "location": "canteen"},
+    ],
+)
+def test_set_up(client: FlaskClient, vending_machine: dict):
+    response = client.post("/api/vending_machines/add", data=vending_machine)
+    assert response.status_code == 200
+
+
+def test_get_vending_machines_status(client: FlaskClient):
+    response = client.get(END_POINT)
+    assert response.status_code == 200
+
+
+def test_get_vending_machines_response_success(client: FlaskClient):
+    response = client.get(END_POINT)
+    response_json = response.get_json()
+    response_data = response_json["data"]
+    assert response_data["get"] == [
+        {"id": 1, "name": "vm_001", "location": "canteen"},
+        {"id": 2, "name": "vm_002", "location": "library"},
+        {"id": 3, "name": "vm_003", "location": "canteen"},
+    ]
+    assert response_data["next"] is None
+    assert response_json["status"] == "success"
+    assert response_json["message"] == "vending machines are successfully retrieved"
+
+
+def test_get_vending_machines_pagination(client: FlaskClient):
+    response_data = client.get(f"{END_POINT}?limit=2").get_json()["data"]
+    assert [vending_machine["id"] for vending_machine in response_data["get"]] == [
+        1,
+        2,
+    ]
+    assert response_data["next"] == 2
+    response_data = client.get(
+        f"{END_POINT}?limit=2&after={response_data['next']}"
+    ).get_json()["data"]
+    assert [vending_machine["id"] for vending_machine in response_data["get"]] == [3]
+    assert response_data["next"] is None
+
+
+@pytest.mark.parametrize(
+    "query, vm_ids",
+    [
+        ("location=canteen", [1, 3]),
+        ("location=CANTEEN&name=003", [3]),
+        ("name=vm_00", [1, 2, 3]),
+        ("name=%25", []),
+    ],
+)
+def test_get_vending_machines_filters(client: FlaskClient, query: str, vm_ids: list):
+    response_data = client.get(f"{END_POINT}?{query}").get_json()["data"]
+    assert [vending_machine["id"] for vending_machine in response_data["get"]] == vm_ids
+
+
+@pytest.mark.parametrize("vending_machine", [{"id": 1}, {"id": 2}, {"id": 3}])
+def test_tear_down(client: FlaskClient, vending_machine: dict):
+    response = client.post(f"/api/vending_machines/delete/{vending_machine['id']}")
+    assert response.status_code == 200
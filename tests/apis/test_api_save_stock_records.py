@@ -3,6 +3,12 @@
 import pytest
 from flask.testing import FlaskClient
 
+from vmms_webapp.app import create_app
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
 END_POINT = "/api/stock_records/save"
 
 
@@ -44,11 +50,50 @@ def test_save_stock_records_response_success(client: FlaskClient):
     response = client.post(END_POINT)
     response_json = response.get_json()
     response_data = response_json["data"]
-    assert response_data["post"]
+    assert response_data["count"] == 3
+    assert response_data["time_stamp"]
+    assert "post" not in response_data
     assert response_json["status"] == "success"
     assert response_json["message"] == "current stocks are successfully recorded"
 
 
+def test_save_stock_records_response_echo(client: FlaskClient):
+    response = client.post(f"{END_POINT}?echo=1")
+    response_data = response.get_json()["data"]
+    assert response_data["count"] == 3
+    assert [
+        (stock_record["vm_id"], stock_record["prod_id"], stock_record["stock"])
+        for stock_record in response_data["post"]
+    ] == [(1, 1, 100), (2, 2, 200), (3, 3, 300)]
+
+
+def test_save_stock_records_delta():
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(1, 2, 200))
+    app = create_app(database_service)
+    app.config.update({"TESTING": True, "WTF_CSRF_ENABLED": False})
+    client = app.test_client()
+    response = client.post(f"{END_POINT}?delta=1")
+    assert response.get_json()["data"]["count"] == 2
+    response = client.post(f"{END_POINT}?delta=1&echo=1")
+    assert response.get_json()["data"]["count"] == 0
+    assert response.get_json()["data"]["post"] == []
+    utils.update_product_stock(database_service, Stock(1, 2, 150))
+    response = client.post(f"{END_POINT}?delta=1&echo=1")
+    assert [
+        (stock_record["prod_id"], stock_record["stock"])
+        for stock_record in response.get_json()["data"]["post"]
+    ] == [(2, 150)]
+    response = client.get("/api/stock_records/timeline/vending_machines/1")
+    assert [
+        stock_record["stock"] for stock_record in response.get_json()["data"]["get"]
+    ] == [100, 100, 100, 200, 200, 150]
+
+
 @pytest.mark.parametrize("vending_machine", [{"id": 1}, {"id": 2}, {"id": 3}])
 def test_tear_down(client: FlaskClient, vending_machine: dict):
     response = client.post(f"/api/vending_machines/delete/{vending_machine['id']}")
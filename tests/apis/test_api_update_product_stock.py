@@ -1,7 +1,16 @@
 """Test: Update Product Stock API."""
 
+from pathlib import Path
+
 import pytest
 from flask.testing import FlaskClient
+from sqlalchemy import event
+
+from vmms_webapp.app import create_app
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
 
 END_POINT = "/api/product_stocks/update"
 
@@ -95,6 +104,27 @@ def test_update_product_stocks_response_fail(client: FlaskClient, product_stock:
     )
 
 
+def test_update_product_stock_shares_session(tmp_path: Path):
+    database_service = DatabaseService(f"sqlite:///{tmp_path / 'vending_machine.db'}")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    database_service.get_session().remove()
+    app = create_app(database_service)
+    app.config.update({"TESTING": True, "WTF_CSRF_ENABLED": False})
+    pool = database_service.get_engine().pool
+    checked_out = []
+    event.listen(pool, "checkout", lambda *args: checked_out.append(pool.checkedout()))
+    response = app.test_client().post(f"{END_POINT}/1/1", data={"stock": 50})
+    assert response.status_code == 200
+    # the existence check and the update run in the same session and connection
+    assert checked_out and max(checked_out) == 1
+    assert pool.checkedout() == 0
+    assert not database_service.get_session().registry.has()
+    assert utils.get_stock_by_vm_id_and_prod_id(database_service, 1, 1).stock == 50
+
+
 @pytest.mark.parametrize("vending_machine", [{"id": 1}, {"id": 2}, {"id": 3}])
 def test_tear_down(client: FlaskClient, vending_machine: dict):
     response = client.post(f"/api/vending_machines/delete/{vending_machine['id']}")
@@ -0,0 +1,229 @@
+"""Test: Analytics."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from vmms_webapp.database import analytics, utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
+START = datetime(2023, 1, 1)
+
+
+def test_forecast_depletion():
+    forecast = analytics.forecast_depletion(
+        {
+            # the stock records of a product stock are not contiguous nor ordered
+            "time_stamp": np.array(
+                [0, 3600, 0, 7200, 0, 10800, 14400, 7200, 3600], float
+            ),
+            "vm_id": np.array([1, 1, 2, 1, 1, 1, 1, 3, 1]),
+            "prod_id": np.array([1, 1, 1, 1, 2, 1, 1, 1, 2]),
+            "stock": np.array([100, 90, 5, 80, 7, 120, 110, 9, 7]),
+        }
+    )
+    assert forecast["vm_id"].tolist() == [1, 1, 2, 3]
+    assert forecast["prod_id"].tolist() == [1, 2, 1, 1]
+    assert forecast["stock"].tolist() == [110, 7, 5, 9]
+    # the refill from 80 to 120 is not consumed
+    assert forecast["consumed"].tolist() == [30, 0, 0, 0]
+    assert forecast["rate"][0] == 7.5
+    assert forecast["hours_to_empty"][0] == pytest.approx(110 / 7.5)
+    assert forecast["empty_at"][0] == pytest.approx(14400 + 110 / 7.5 * 3600)
+    # nothing was consumed or there is a single stock record
+    assert forecast["rate"][1] == 0
+    assert np.isnan(forecast["rate"][2:]).all()
+    assert np.isnan(forecast["hours_to_empty"][1:]).all()
+    assert np.isnan(forecast["empty_at"][1:]).all()
+
+
+def test_forecast_depletion_empty():
+    forecast = analytics.forecast_depletion(
+        {key: np.empty(0) for key in utils.STOCK_RECORD_KEYS}
+    )
+    assert set(forecast) == set(analytics.DEPLETION_FORECAST_KEYS)
+    assert all(len(values) == 0 for values in forecast.values())
+
+
+@pytest.mark.parametrize("delta", [False, True])
+def test_get_depletion_forecast(delta: bool):
+    database_service = DatabaseService("sqlite://")
+    for name in ("vm_001", "vm_002"):
+        utils.add_vending_machine(
+            database_service, VendingMachine(name=name, location="loc_001")
+        )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(2, 1, 50))
+    for hours, stock in enumerate([100, 90, 80, 120, 110]):
+        utils.update_product_stock(database_service, Stock(1, 1, stock))
+        utils.save_stock_records(
+            database_service, delta=delta, time_stamp=START + timedelta(hours=hours)
+        )
+    assert analytics.get_depletion_forecast(database_service) == [
+        {
+            "vm_id": 1,
+            "prod_id": 1,
+            "stock": 110,
+            "consumed": 30,
+            "rate": pytest.approx(7.5),
+            "hours_to_empty": pytest.approx(110 / 7.5),
+            "empty_at": START + timedelta(hours=4 + 110 / 7.5),
+        },
+        {
+            "vm_id": 2,
+            "prod_id": 1,
+            "stock": 50,
+            "consumed": 0,
+            "rate": 0.0,
+            "hours_to_empty": None,
+            "empty_at": None,
+        },
+    ]
+    columns = analytics.get_depletion_forecast(
+        database_service, vm_id=1, since=START + timedelta(hours=3), columnar=True
+    )
+    assert columns == {
+        "vm_id": [1],
+        "prod_id": [1],
+        "stock": [110],
+        "consumed": [10],
+        "rate": [pytest.approx(10.0)],
+        "hours_to_empty": [pytest.approx(11.0)],
+        "empty_at": [utils.to_epoch_milliseconds(START + timedelta(hours=15))],
+    }
+    assert (
+        analytics.get_depletion_forecast(
+            database_service, until=START + timedelta(hours=1)
+        )[0]["rate"]
+        is None
+    )
+
+
+def create_fleet() -> DatabaseService:
+    database_service = DatabaseService("sqlite://")
+    for name, location in [
+        ("vm_001", "loc_a"),
+        ("vm_002", "loc_b"),
+        ("vm_003", "loc_a"),
+    ]:
+        utils.add_vending_machine(
+            database_service, VendingMachine(name=name, location=location)
+        )
+    for vm_id, prod_id, stock in [
+        (1, 1, 5),
+        (1, 2, 50),
+        (2, 1, 0),
+        (2, 3, 30),
+        (3, 1, 80),
+        (3, 2, 9),
+    ]:
+        utils.add_product_stock(database_service, Stock(vm_id, prod_id, stock))
+    return database_service
+
+
+def test_get_restock_plan():
+    database_service = create_fleet()
+    assert analytics.get_restock_plan(database_service) == {
+        "locations": [
+            {
+                "location": "loc_a",
+                "units": 186,
+                "vending_machines": [
+                    {
+                        "id": 1,
+                        "name": "vm_001",
+                        "units": 95,
+                        "products": [
+                            {"prod_id": 1, "name": "taro", "stock": 5, "units": 95}
+                        ],
+                    },
+                    {
+                        "id": 3,
+                        "name": "vm_003",
+                        "units": 91,
+                        "products": [
+                            {"prod_id": 2, "name": "pringle", "stock": 9, "units": 91}
+                        ],
+                    },
+                ],
+            },
+            {
+                "location": "loc_b",
+                "units": 100,
+                "vending_machines": [
+                    {
+                        "id": 2,
+                        "name": "vm_002",
+                        "units": 100,
+                        "products": [
+                            {"prod_id": 1, "name": "taro", "stock": 0, "units": 100}
+                        ],
+                    }
+                ],
+            },
+        ],
+        "pick_list": [
+            {"prod_id": 1, "name": "taro", "units": 195},
+            {"prod_id": 2, "name": "pringle", "units": 91},
+        ],
+        "units": 286,
+    }
+    restock_plan = analytics.get_restock_plan(
+        database_service, threshold=40, target=60, location="loc_b"
+    )
+    assert restock_plan["pick_list"] == [
+        {"prod_id": 1, "name": "taro", "units": 60},
+        {"prod_id": 3, "name": "lay's", "units": 30},
+    ]
+    assert [location["location"] for location in restock_plan["locations"]] == ["loc_b"]
+
+
+def test_get_restock_plan_forecast():
+    database_service = create_fleet()
+    # product 2 of vending machine 1 sells 10 units an hour
+    for hours, stock in enumerate([80, 70, 60, 50]):
+        utils.update_product_stock(database_service, Stock(1, 2, stock))
+        utils.save_stock_records(
+            database_service, time_stamp=START + timedelta(hours=hours)
+        )
+    restock_plan = analytics.get_restock_plan(database_service, hours=3)
+    assert restock_plan["units"] == 286
+    restock_plan = analytics.get_restock_plan(database_service, hours=4.5)
+    assert restock_plan["units"] == 336
+    assert restock_plan["locations"][0]["vending_machines"][0]["products"] == [
+        {"prod_id": 1, "name": "taro", "stock": 5, "units": 95},
+        {"prod_id": 2, "name": "pringle", "stock": 50, "units": 50},
+    ]
+
+
+def test_get_restock_plan_forecast_above_target():
+    database_service = create_fleet()
+    # product 1 of vending machine 3 sells 50 units in 9 hours from above the target
+    for hours, stock in [(0, 200), (9, 150)]:
+        utils.update_product_stock(database_service, Stock(3, 1, stock))
+        utils.save_stock_records(
+            database_service, time_stamp=START + timedelta(hours=hours)
+        )
+    restock_plan = analytics.get_restock_plan(
+        database_service, threshold=10, target=100, hours=48
+    )
+    products = [
+        (vending_machine["id"], product["prod_id"], product["units"])
+        for location in restock_plan["locations"]
+        for vending_machine in location["vending_machines"]
+        for product in vending_machine["products"]
+    ]
+    assert products == [(1, 1, 95), (3, 2, 91), (2, 1, 100)]
+    assert restock_plan["units"] == 286
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [{"threshold": -1}, {"threshold": 20, "target": 10}, {"hours": -1}],
+    ids=["negative", "threshold", "hours"],
+)
+def test_get_restock_plan_invalid(arguments: dict):
+    with pytest.raises(ValueError):
+        analytics.get_restock_plan(create_fleet(), **arguments)
@@ -0,0 +1,182 @@
+"""Test: Archiver."""
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from vmms_webapp import archiver
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.snapshot import Snapshot
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.stock_record import StockRecord
+from vmms_webapp.models.vending_machine import VendingMachine
+
+BEFORE = datetime(2023, 3, 1, 1)
+
+
+def create_history(archive_path: str, delta: bool) -> DatabaseService:
+    database_service = DatabaseService(
+        "sqlite://", default_populate=False, archive_path=archive_path
+    )
+    for name in ("vm_001", "vm_002"):
+        utils.add_vending_machine(
+            database_service, VendingMachine(name=name, location="loc_001")
+        )
+    utils.add_product_stock(database_service, Stock(1, 1, 1000))
+    utils.add_product_stock(database_service, Stock(1, 2, 1000))
+    utils.add_product_stock(database_service, Stock(2, 1, 1000))
+    # a snapshot every 5 hours for 2 months
+    for i in range(2 * 30 * 24 // 5):
+        time_stamp = datetime(2023, 1, 15) + timedelta(hours=5 * i)
+        utils.update_product_stock(database_service, Stock(1, 1, 1000 - i))
+        if i % 7 == 0:
+            utils.update_product_stock(database_service, Stock(2, 1, 1000 - i))
+        if i == 100:
+            utils.add_product_stock(database_service, Stock(2, 3, 100))
+        if i == 200:
+            utils.delete_product_stock(database_service, 2, 3)
+        utils.save_stock_records(database_service, delta=delta, time_stamp=time_stamp)
+    return database_service
+
+
+def create_fleet(archive_path: str, vending_machines: int) -> DatabaseService:
+    database_service = DatabaseService(
+        "sqlite://", default_populate=False, archive_path=archive_path
+    )
+    with database_service.begin() as session:
+        session.add_all(
+            VendingMachine(name=f"vm_{vm_id}", location="loc_001")
+            for vm_id in range(1, vending_machines + 1)
+        )
+        session.add_all(
+            Stock(vm_id, prod_id, 100)
+            for vm_id in range(1, vending_machines + 1)
+            for prod_id in (1, 2, 3)
+        )
+    for hours in range(3):
+        utils.update_product_stock(database_service, Stock(hours + 1, 1, 99))
+        utils.save_stock_records(
+            database_service, delta=True, time_stamp=BEFORE + timedelta(hours=hours)
+        )
+    # far less variables than the stock records of a snapshot bind
+    connection = database_service.get_engine().raw_connection()
+    connection.connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 100)
+    connection.close()
+    return database_service
+
+
+def read_stock_records(database_service: DatabaseService) -> dict:
+    def read_pages(**timeline_args) -> list:
+        stock_records, cursor = utils.get_stock_records_page(
+            database_service, limit=7, **timeline_args
+        )
+        while cursor is not None:
+            page, cursor = utils.get_stock_records_page(
+                database_service,
+                limit=7,
+                cursor=utils.decode_stock_record_cursor(cursor),
+                **timeline_args,
+            )
+            stock_records += page
+        return [stock_record.to_dict() for stock_record in stock_records]
+
+    since = datetime(2023, 2, 20)
+    return {
+        "all": read_pages(),
+        "vending machine": read_pages(vm_id=1),
+        "product": read_pages(prod_id=1, since=since),
+        "columns": utils.get_stock_record_columns_page(database_service, vm_id=2)[0],
+        "columns page": utils.get_stock_record_columns_page(
+            database_service, prod_id=1, limit=50, since=since
+        ),
+        "batches": list(utils.iter_stock_record_batches(database_service, 100)),
+        "buckets": [
+            utils.get_stock_record_buckets(database_service, 5 * 24 * 60 * 60, vm_id=2),
+            utils.get_stock_record_buckets(database_service, 24 * 60 * 60, prod_id=1),
+        ],
+        "as of": [
+            [
+                stock_record.to_dict()
+                for stock_record in utils.get_stock_records_at(
+                    database_service, time_stamp
+                )
+            ]
+            for time_stamp in [
+                datetime(2023, 1, 1),
+                datetime(2023, 1, 20, 3),
+                datetime(2023, 2, 28, 23),
+                BEFORE,
+                datetime(2023, 3, 10),
+            ]
+        ],
+    }
+
+
+@pytest.mark.parametrize("delta", [False, True])
+def test_archive_stock_records(tmp_path: Path, delta: bool):
+    database_service = create_history(str(tmp_path), delta)
+    stock_records = read_stock_records(database_service)
+    dry_run_report = archiver.archive_stock_records(
+        database_service, BEFORE, batch_size=100, dry_run=True
+    )
+    assert utils.split_archived_stock_records(database_service) == (None, None)
+    report = archiver.archive_stock_records(database_service, BEFORE, batch_size=100)
+    assert report == {**dry_run_report, "archived_months": 3}
+    assert report["archived_stock_records"] == len(
+        [
+            stock_record
+            for stock_record in stock_records["all"]
+            if stock_record["time_stamp"] < BEFORE
+        ]
+    )
+    assert report["rebased_snapshots"] == int(delta)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "stock_records-2023-01.npy",
+        "stock_records-2023-02.npy",
+        "stock_records-2023-03.npy",
+        "stock_records.json",
+    ]
+    session = database_service.get_session()()
+    assert session.query(Snapshot).filter(Snapshot.time_stamp < BEFORE).count() == 0
+    assert (
+        session.query(StockRecord).filter(StockRecord.time_stamp < BEFORE).count() == 0
+    )
+    assert read_stock_records(database_service) == stock_records
+    # archiving again is a no-op
+    assert archiver.archive_stock_records(database_service, BEFORE) == dict.fromkeys(
+        report, 0
+    )
+    assert read_stock_records(database_service) == stock_records
+
+
+def test_archive_stock_records_without_archive(database_service: DatabaseService):
+    with pytest.raises(ValueError):
+        archiver.archive_stock_records(database_service, BEFORE)
+
+
+def test_get_months():
+    assert archiver.get_months(datetime(2022, 12, 15, 1), datetime(2023, 2, 3)) == [
+        (datetime(2022, 12, 15, 1), datetime(2023, 1, 1)),
+        (datetime(2023, 1, 1), datetime(2023, 2, 1)),
+        (datetime(2023, 2, 1), datetime(2023, 2, 3)),
+    ]
+
+
+@pytest.mark.skipif(
+    not hasattr(sqlite3.Connection, "setlimit"), reason="requires python 3.11"
+)
+def test_archive_stock_records_rebases_in_batches(tmp_path: Path):
+    database_service = create_fleet(str(tmp_path), 100)
+    after = BEFORE + timedelta(hours=2)
+    stock_records = utils.get_stock_records_at(database_service, after)
+    report = archiver.archive_stock_records(
+        database_service, BEFORE + timedelta(hours=1), batch_size=20
+    )
+    assert report["rebased_snapshots"] == 1
+    assert len(stock_records) == 300
+    assert [
+        stock_record.to_dict()
+        for stock_record in utils.get_stock_records_at(database_service, after)
+    ] == [stock_record.to_dict() for stock_record in stock_records]
@@ -0,0 +1,189 @@
+"""Test: Database Service."""
+import sqlite3
+import threading
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.pool import QueuePool
+
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.product import Product
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
+
+def test_database_service_adds_missing_columns(tmp_path: Path):
+    database_path = tmp_path / "vending_machine.db"
+    connection = sqlite3.connect(database_path)
+    connection.execute(
+        "CREATE TABLE vending_machines ("
+        "id INTEGER NOT NULL, name VARCHAR(50), location VARCHAR(100), PRIMARY KEY (id))"
+    )
+    connection.execute("INSERT INTO vending_machines VALUES (1, 'vm_001', 'loc_001')")
+    connection.commit()
+    connection.close()
+    database_service = DatabaseService(f"sqlite:///{database_path}")
+    columns = inspect(database_service.get_engine()).get_columns("vending_machines")
+    assert "version" in [column["name"] for column in columns]
+    with database_service.get_engine().connect() as connection:
+        assert connection.exec_driver_sql(
+            "SELECT version FROM vending_machines"
+        ).all() == [(0,)]
+
+
+def test_database_service_adds_missing_indexes(tmp_path: Path):
+    database_path = tmp_path / "vending_machine.db"
+    connection = sqlite3.connect(database_path)
+    connection.execute(
+        "CREATE TABLE stock_records ("
+        "time_stamp DATETIME NOT NULL, vm_id INTEGER NOT NULL, prod_id INTEGER NOT NULL, "
+        "stock INTEGER, PRIMARY KEY (time_stamp, vm_id, prod_id))"
+    )
+    connection.close()
+    database_service = DatabaseService(f"sqlite:///{database_path}")
+    indexes = inspect(database_service.get_engine()).get_indexes("stock_records")
+    assert sorted(index["name"] for index in indexes) == [
+        "ix_stock_records_prod_id_vm_id_time_stamp",
+        "ix_stock_records_vm_id_prod_id_time_stamp",
+    ]
+
+
+def test_database_service_populates_snapshots_and_rollups(tmp_path: Path):
+    database_path = tmp_path / "vending_machine.db"
+    connection = sqlite3.connect(database_path)
+    connection.execute(
+        "CREATE TABLE stock_records ("
+        "time_stamp DATETIME NOT NULL, vm_id INTEGER NOT NULL, prod_id INTEGER NOT NULL, "
+        "stock INTEGER, PRIMARY KEY (time_stamp, vm_id, prod_id))"
+    )
+    connection.executemany(
+        "INSERT INTO stock_records VALUES (?, ?, ?, ?)",
+        [
+            ("2023-01-01 00:00:00.000000", 1, 1, 100),
+            ("2023-01-01 00:00:00.000000", 1, 2, 200),
+            ("2023-01-01 01:00:00.000000", 1, 1, 90),
+        ],
+    )
+    connection.commit()
+    connection.close()
+    database_service = DatabaseService(f"sqlite:///{database_path}")
+    with database_service.get_engine().connect() as connection:
+        assert connection.exec_driver_sql(
+            "SELECT time_stamp, base, delta FROM snapshots ORDER BY time_stamp"
+        ).all() == [
+            ("2023-01-01 00:00:00.000000", "2023-01-01 00:00:00.000000", 0),
+            ("2023-01-01 01:00:00.000000", "2023-01-01 01:00:00.000000", 0),
+        ]
+        assert connection.exec_driver_sql(
+            "SELECT vm_id, prod_id, stock FROM last_stock_records"
+        ).all() == [(1, 1, 90)]
+    with database_service.get_engine().connect() as connection:
+        assert connection.exec_driver_sql(
+            "SELECT time_stamp, vm_id, prod_id, min, max, last, consumed "
+            "FROM daily_stock_rollups ORDER BY prod_id"
+        ).all() == [
+            ("2023-01-01 00:00:00.000000", 1, 1, 90, 100, 90, 10),
+            ("2023-01-01 00:00:00.000000", 1, 2, 200, 200, 200, 0),
+        ]
+
+
+def test_database_service_sets_pragmas(tmp_path: Path):
+    database_service = DatabaseService(f"sqlite:///{tmp_path / 'vending_machine.db'}")
+    assert isinstance(database_service.get_engine().pool, QueuePool)
+    assert database_service.get_engine().pool.size() == 5
+    with database_service.get_engine().connect() as connection:
+        assert [
+            connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in (
+                "journal_mode",
+                "synchronous",
+                "mmap_size",
+                "cache_size",
+                "busy_timeout",
+                "temp_store",
+            )
+        ] == ["wal", 1, 256 * 1024 * 1024, -64 * 1024, 5000, 2]
+
+
+def test_database_service_engine_options(tmp_path: Path):
+    database_service = DatabaseService(
+        f"sqlite:///{tmp_path / 'vending_machine.db'}",
+        engine_options={"poolclass": QueuePool, "pool_size": 2},
+        pragmas={"cache_size": -1024},
+    )
+    assert database_service.get_engine().pool.size() == 2
+    with database_service.get_engine().connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "delete"
+        assert connection.exec_driver_sql("PRAGMA cache_size").scalar() == -1024
+
+
+def test_database_service_session_per_thread():
+    database_service = DatabaseService("sqlite://")
+    session = database_service.get_session()()
+    assert database_service.get_session()() is session
+    sessions = []
+    thread = threading.Thread(
+        target=lambda: sessions.append(database_service.get_session()())
+    )
+    thread.start()
+    thread.join()
+    assert sessions[0] is not session
+    database_service.get_session().remove()
+    assert database_service.get_session()() is not session
+
+
+def test_database_service_begin():
+    database_service = DatabaseService("sqlite://", default_populate=False)
+    with database_service.begin() as session:
+        session.add(Product(id=1, name="taro", price=20.0))
+    with pytest.raises(IntegrityError):
+        with database_service.begin() as session:
+            session.add(Product(id=2, name="pringle", price=30.0))
+            session.add(Product(id=1, name="taro", price=20.0))
+    # the session is usable again after the rollback
+    assert database_service.get_session()().query(Product.id).all() == [(1,)]
+
+
+def test_database_service_read_uri(tmp_path: Path):
+    database_path = tmp_path / "vending_machine.db"
+    database_service = DatabaseService(
+        f"sqlite:///{database_path}",
+        read_uri=f"sqlite:///file:{database_path}?mode=ro&uri=true",
+    )
+    statements = {"primary": [], "read": []}
+    for name, engine in [
+        ("primary", database_service.get_engine()),
+        ("read", database_service.get_read_engine()),
+    ]:
+        event.listen(
+            engine,
+            "before_cursor_execute",
+            lambda *args, name=name: statements[name].append(args[2]),
+        )
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    assert utils.get_stock_by_vm_id_and_prod_id(database_service, 1, 1).stock == 100
+    assert [
+        vending_machine.name
+        for vending_machine in utils.get_vending_machines(database_service)
+    ] == ["vm_001"]
+    assert all(statement.startswith("SELECT") for statement in statements["read"])
+    assert len(statements["read"]) == 2
+    # a thread reads its own writes
+    utils.update_product_stock(database_service, Stock(1, 1, 50))
+    assert utils.get_stock_by_vm_id_and_prod_id(database_service, 1, 1).stock == 50
+    with pytest.raises(OperationalError):
+        with database_service.get_read_engine().begin() as connection:
+            connection.exec_driver_sql("DELETE FROM stocks")
+
+
+def test_database_service_without_read_uri():
+    database_service = DatabaseService("sqlite://")
+    assert database_service.get_read_uri() is None
+    assert database_service.get_read_engine() is database_service.get_engine()
+    assert database_service.get_read_session() is database_service.get_session()
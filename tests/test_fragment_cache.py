@@ -0,0 +1,42 @@
+"""Test: Fragment Cache."""
+
+from vmms_webapp.fragment_cache import FragmentCache
+
+
+def test_fragment_cache_get_and_set():
+    fragment_cache = FragmentCache()
+    assert fragment_cache.get(1, 0) is None
+    fragment_cache.set(1, 0, "<tr>1</tr>")
+    assert fragment_cache.get(1, 0) == "<tr>1</tr>"
+    assert fragment_cache.get(1, 1) is None
+    assert fragment_cache.stats() == {
+        "size": 1,
+        "max_size": 1024,
+        "hits": 1,
+        "misses": 2,
+        "evictions": 0,
+        "hit_ratio": 1 / 3,
+    }
+
+
+def test_fragment_cache_invalidate():
+    fragment_cache = FragmentCache()
+    fragment_cache.set(1, 0, "<tr>1</tr>")
+    fragment_cache.set(2, 0, "<tr>2</tr>")
+    fragment_cache.invalidate(1)
+    assert fragment_cache.get(1, 0) is None
+    assert fragment_cache.get(2, 0) == "<tr>2</tr>"
+    fragment_cache.clear()
+    assert fragment_cache.get(2, 0) is None
+
+
+def test_fragment_cache_lru_eviction():
+    fragment_cache = FragmentCache(max_size=2)
+    fragment_cache.set(1, 0, "<tr>1</tr>")
+    fragment_cache.set(2, 0, "<tr>2</tr>")
+    assert fragment_cache.get(1, 0) == "<tr>1</tr>"
+    fragment_cache.set(3, 0, "<tr>3</tr>")
+    assert fragment_cache.get(2, 0) is None
+    assert fragment_cache.get(1, 0) == "<tr>1</tr>"
+    assert fragment_cache.get(3, 0) == "<tr>3</tr>"
+    assert fragment_cache.stats()["evictions"] == 1
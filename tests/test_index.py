@@ -0,0 +1,214 @@
+"""Test: Index Page."""
+
+import re
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from sqlalchemy import event
+
+from vmms_webapp.app import create_app
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+
+END_POINT = "/"
+
+
+@pytest.mark.parametrize("number_of_vending_machines", [1, 10, 100])
+def test_index_query_count(number_of_vending_machines: int):
+    database_service = DatabaseService("sqlite://")
+    for i in range(number_of_vending_machines):
+        vending_machine = VendingMachine(name=f"vm_{i}", location=f"loc_{i}")
+        utils.add_vending_machine(database_service, vending_machine)
+        utils.add_product_stock(database_service, Stock(vending_machine.id, 1, i))
+    client = create_app(database_service).test_client()
+    statements = []
+    event.listen(
+        database_service.get_engine(),
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+    response = client.get(END_POINT)
+    assert response.status_code == 200
+    assert response.data.count(b"/vending_machines/update/") == min(
+        number_of_vending_machines, utils.DEFAULT_PAGE_SIZE
+    )
+    # data version, vending machines page, products and stocks
+    assert len(statements) == 4
+
+
+def test_index_pagination():
+    database_service = DatabaseService("sqlite://")
+    for i in range(1, 4):
+        utils.add_vending_machine(
+            database_service, VendingMachine(name=f"vm_00{i}", location=f"loc_00{i}")
+        )
+    client = create_app(database_service).test_client()
+    response = client.get(f"{END_POINT}?limit=2")
+    assert b"/vending_machines/update/2" in response.data
+    assert b"/vending_machines/update/3" not in response.data
+    assert b"/?after=2&amp;limit=2" in response.data
+    response = client.get(f"{END_POINT}?limit=2&after=2")
+    assert b"/vending_machines/update/2" not in response.data
+    assert b"/vending_machines/update/3" in response.data
+    assert b"after=" not in response.data
+    response = client.get(f"{END_POINT}?location=loc_001")
+    assert b"/vending_machines/update/1" in response.data
+    assert b"/vending_machines/update/2" not in response.data
+
+
+def test_index_fragment_cache():
+    database_service = DatabaseService("sqlite://")
+    for i in range(1, 3):
+        vending_machine = VendingMachine(name=f"vm_00{i}", location=f"loc_00{i}")
+        utils.add_vending_machine(database_service, vending_machine)
+        utils.add_product_stock(database_service, Stock(vending_machine.id, 1, 10))
+    app = create_app(database_service)
+    app.config.update({"TESTING": True, "WTF_CSRF_ENABLED": False})
+    client = app.test_client()
+    fragment_cache = database_service.get_fragment_cache()
+    response = client.get(END_POINT)
+    assert fragment_cache.stats()["misses"] == 2
+    assert b"__csrf_token_placeholder__" not in response.data
+    client.get(END_POINT)
+    assert fragment_cache.stats()["hits"] == 2
+    client.post("/api/product_stocks/update/1/1", data={"stock": 12345})
+    response = client.get(END_POINT)
+    assert b"12345" in response.data
+    assert fragment_cache.stats()["hits"] == 3
+    assert fragment_cache.stats()["misses"] == 3
+    client.post(
+        "/api/vending_machines/update/2", data={"name": "vm_new", "location": "loc"}
+    )
+    response = client.get(END_POINT)
+    assert b"vm_new" in response.data
+    assert fragment_cache.stats()["misses"] == 4
+
+
+def test_index_fragment_cache_reused_id(tmp_path: Path):
+    # every database service stands for a process serving the same database with its own fragment cache
+    database_uri = f"sqlite:///{tmp_path / 'vending_machine.db'}"
+    database_services = [DatabaseService(database_uri) for _ in range(2)]
+    for i in range(1, 3):
+        utils.add_vending_machine(
+            database_services[0],
+            VendingMachine(name=f"vm_00{i}", location=f"loc_00{i}"),
+        )
+    app = create_app(database_services[0])
+    app.config.update({"TESTING": True, "WTF_CSRF_ENABLED": False})
+    client = app.test_client()
+    assert b"vm_002" in client.get(END_POINT).data
+    utils.delete_vending_machine(database_services[1], 2)
+    response = utils.add_vending_machine(
+        database_services[1], VendingMachine(name="vm_new", location="loc_new")
+    )
+    # sqlite reuses the largest id of a deleted row
+    assert response["data"]["post"]["id"] == 2
+    response = client.get(END_POINT)
+    assert b"vm_new" in response.data
+    assert b"vm_002" not in response.data
+
+
+@pytest.mark.parametrize(
+    "mutation",
+    [
+        lambda database_service: utils.add_product_stock(
+            database_service, Stock(1, 2, 20)
+        ),
+        lambda database_service: utils.update_product_stock(
+            database_service, Stock(1, 1, 20)
+        ),
+        lambda database_service: utils.delete_product_stock(database_service, 1, 1),
+        lambda database_service: utils.update_vending_machine(
+            database_service, VendingMachine(name="vm", location="loc"), 1
+        ),
+        lambda database_service: utils.delete_vending_machine(database_service, 1),
+    ],
+)
+def test_index_fragment_cache_invalidation(mutation: Callable):
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 10))
+    client = create_app(database_service).test_client()
+    fragment_cache = database_service.get_fragment_cache()
+    client.get(END_POINT)
+    assert fragment_cache.stats()["size"] == 1
+    mutation(database_service)
+    assert fragment_cache.stats()["size"] == 0
+
+
+def test_index_stream():
+    database_service = DatabaseService("sqlite://")
+    for i in range(1, 6):
+        vending_machine = VendingMachine(name=f"vm_00{i}", location=f"loc_00{i}")
+        utils.add_vending_machine(database_service, vending_machine)
+        utils.add_product_stock(database_service, Stock(vending_machine.id, 1, 10))
+    client = create_app(database_service).test_client()
+    response = client.get(f"{END_POINT}?stream=1&limit=2")
+    assert response.is_streamed
+    chunks = list(response.iter_encoded())
+    assert len(chunks) > 1
+    data = b"".join(chunks)
+    assert data.count(b"/vending_machines/update/") == 5
+    assert b"__csrf_token_placeholder__" not in data
+    assert data.endswith(b"</html>")
+
+
+def test_index_stream_csrf_token():
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    client = create_app(database_service).test_client()
+    response = client.get(f"{END_POINT}?stream=1")
+    csrf_tokens = set(
+        re.findall(rb'name="csrf_token" value="([^"]+)"', response.get_data())
+    )
+    # the page and the fragments share the token stored in the session cookie
+    assert len(csrf_tokens) == 1
+    assert "session=" in response.headers["Set-Cookie"]
+    response = client.post(
+        "/api/stock_records/save", headers={"X-CSRFToken": csrf_tokens.pop().decode()}
+    )
+    assert response.status_code == 200
+
+
+def test_index_stream_filters():
+    database_service = DatabaseService("sqlite://")
+    for i in range(1, 6):
+        utils.add_vending_machine(
+            database_service, VendingMachine(name=f"vm_00{i}", location=f"loc_{i % 2}")
+        )
+    client = create_app(database_service).test_client()
+    response = client.get(f"{END_POINT}?stream=true&limit=1&location=loc_1")
+    assert response.get_data().count(b"/vending_machines/update/") == 3
+
+
+def test_index_not_modified():
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    client = create_app(database_service).test_client()
+    response = client.get(END_POINT)
+    etag = response.headers["ETag"]
+    assert "private" in response.headers["Cache-Control"]
+    statements = []
+    event.listen(
+        database_service.get_engine(),
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+    response = client.get(END_POINT, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert len(statements) == 1
+    assert "data_versions" in statements[0]
+    utils.update_vending_machine(
+        database_service, VendingMachine(name="vm", location="loc"), 1
+    )
+    response = client.get(END_POINT, headers={"If-None-Match": etag})
+    assert response.status_code == 200
@@ -0,0 +1,141 @@
+"""Test: Metrics."""
+import json
+import os
+import threading
+import weakref
+from pathlib import Path
+
+from vmms_webapp.metrics import (
+    COUNTER,
+    GAUGE,
+    HISTOGRAM,
+    MetricsRegistry,
+    flush_at_exit,
+)
+
+
+def create_registry(directory: Path = None) -> MetricsRegistry:
+    metrics = MetricsRegistry(directory and str(directory))
+    metrics.describe("requests_total", COUNTER, "Number of requests")
+    metrics.describe("latency_seconds", HISTOGRAM, "Latency", buckets=(0.1, 1.0))
+    metrics.describe("connections", GAUGE, "Number of connections")
+    return metrics
+
+
+def test_metrics_inc_from_threads():
+    metrics = create_registry()
+
+    def record() -> None:
+        for _ in range(1000):
+            metrics.inc("requests_total", {"route": "/"})
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.inc("requests_total", {"route": "/"}, 2)
+    assert 'requests_total{route="/"} 4002' in metrics.render().splitlines()
+    # the shards of the threads that finished are merged into the retired samples
+    assert len(metrics.shards) == 1
+
+
+def test_metrics_retire_shards():
+    metrics = create_registry()
+    for _ in range(300):
+        thread = threading.Thread(target=metrics.inc, args=("requests_total",))
+        thread.start()
+        thread.join()
+    # a new thread drops the shards of the finished ones before adding its own
+    assert len(metrics.shards) == 1
+    metrics.observe("latency_seconds", 0.5)
+    assert len(metrics.shards) == 1
+    assert "requests_total 300" in metrics.render().splitlines()
+    assert metrics.retired == {("requests_total", "", ()): 300}
+
+
+def test_metrics_observe():
+    metrics = create_registry()
+    for value in (0.05, 0.5, 0.5, 5):
+        metrics.observe("latency_seconds", value, {"route": "/"})
+    lines = metrics.render().splitlines()
+    assert lines[lines.index("# TYPE latency_seconds histogram") + 1 :][:5] == [
+        'latency_seconds_bucket{route="/",le="0.1"} 1',
+        'latency_seconds_bucket{route="/",le="1.0"} 3',
+        'latency_seconds_bucket{route="/",le="+Inf"} 4',
+        'latency_seconds_count{route="/"} 4',
+        'latency_seconds_sum{route="/"} 6.05',
+    ]
+
+
+def test_metrics_render_collectors_and_labels():
+    metrics = create_registry()
+    metrics.add_collector(lambda: [("connections", {"engine": "primary"}, 3)])
+    metrics.inc("requests_total", {"route": 'say "hi"\\'})
+    assert metrics.render() == "\n".join(
+        [
+            "# HELP requests_total Number of requests",
+            "# TYPE requests_total counter",
+            'requests_total{route="say \\"hi\\"\\\\"} 1',
+            "# HELP latency_seconds Latency",
+            "# TYPE latency_seconds histogram",
+            "# HELP connections Number of connections",
+            "# TYPE connections gauge",
+            'connections{engine="primary"} 3',
+            "",
+        ]
+    )
+
+
+def test_metrics_aggregate_processes(tmp_path: Path):
+    metrics = create_registry(tmp_path)
+    metrics.add_collector(lambda: [("connections", {}, 3)])
+    metrics.inc("requests_total", {"route": "/"}, 2)
+    metrics.observe("latency_seconds", 0.5)
+    # the files of another worker which has exited, and of an earlier process with the same id
+    for pid, started in [(999999999, 1), (os.getpid(), 0)]:
+        (tmp_path / f"metrics_{pid}_{started}.json").write_text(
+            json.dumps(
+                {
+                    "pid": pid,
+                    "started": started,
+                    "samples": [
+                        ["requests_total", "", [["route", "/"]], 3],
+                        ["latency_seconds", "_count", [], 1],
+                    ],
+                    "gauges": [["connections", "", [], 4]],
+                }
+            )
+        )
+    lines = metrics.render().splitlines()
+    assert 'requests_total{route="/"} 8' in lines
+    assert "latency_seconds_count 3" in lines
+    # the gauges of a process that exited are dropped
+    assert "connections 3" in lines
+    assert Path(metrics.get_path()).exists()
+    assert Path(metrics.get_path()).name == (
+        f"metrics_{os.getpid()}_{metrics.started}.json"
+    )
+
+
+def test_metrics_flush_interval(tmp_path: Path):
+    metrics = create_registry(tmp_path)
+    path = Path(metrics.get_path())
+    metrics.flush(force=False)
+    metrics.inc("requests_total")
+    metrics.flush(force=False)
+    assert json.loads(path.read_text())["samples"] == []
+    metrics.flush()
+    assert json.loads(path.read_text())["samples"] == [["requests_total", "", [], 1]]
+
+
+def test_metrics_flush_at_exit(tmp_path: Path):
+    metrics = create_registry(tmp_path)
+    metrics.inc("requests_total")
+    flush_at_exit(weakref.ref(metrics))
+    samples = json.loads(Path(metrics.get_path()).read_text())["samples"]
+    assert samples == [["requests_total", "", [], 1]]
+    # a registry dropped before the process exits is not written
+    reference = weakref.ref(create_registry(tmp_path / "dropped"))
+    flush_at_exit(reference)
+    assert os.listdir(tmp_path / "dropped") == []
@@ -0,0 +1,40 @@
+"""Test: Query Stats."""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from vmms_webapp.query_stats import QueryStatsCollector
+
+
+def test_query_stats_collector():
+    query_stats = QueryStatsCollector()
+    engine = create_engine("sqlite://")
+    query_stats.instrument(engine)
+    with engine.connect() as connection:
+        # statements outside of a request are not counted
+        connection.exec_driver_sql("SELECT 1")
+        token = query_stats.start()
+        connection.exec_driver_sql("SELECT 1")
+        connection.exec_driver_sql("SELECT 2")
+        with pytest.raises(OperationalError):
+            connection.exec_driver_sql("SELECT * FROM missing")
+        assert connection.info["query_start"] == []
+        stats = query_stats.stop(token, "GET", "/")
+        assert query_stats.get_current() is None
+        assert stats.statements == 2
+        assert stats.duration > 0
+        token = query_stats.start()
+        connection.exec_driver_sql("SELECT 1")
+        query_stats.stop(token, "GET", "/")
+        token = query_stats.start()
+        query_stats.stop(token, "POST", "/save")
+    summary = query_stats.get_summary()
+    assert [
+        (route["method"], route["route"], route["requests"], route["statements"])
+        for route in summary
+    ] == [("GET", "/", 2, 3), ("POST", "/save", 1, 0)]
+    assert summary[0]["avg_statements"] == 1.5
+    assert summary[0]["max_statements"] == 2
+    assert summary[0]["avg_duration"] == pytest.approx(summary[0]["duration"] / 2)
+    query_stats.reset()
+    assert query_stats.get_summary() == []
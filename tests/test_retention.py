@@ -0,0 +1,168 @@
+"""Test: Retention."""
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from vmms_webapp import retention
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.snapshot import Snapshot
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.stock_record import StockRecord
+from vmms_webapp.models.vending_machine import VendingMachine
+
+NOW = datetime(2023, 3, 1)
+POLICY = retention.RetentionPolicy(raw_days=1, hourly_days=2, drop_days=3)
+
+
+def create_history(delta: bool) -> DatabaseService:
+    database_service = DatabaseService("sqlite://")
+    for name in ("vm_001", "vm_002"):
+        utils.add_vending_machine(
+            database_service, VendingMachine(name=name, location="loc_001")
+        )
+    utils.add_product_stock(database_service, Stock(1, 1, 1000))
+    utils.add_product_stock(database_service, Stock(1, 2, 1000))
+    utils.add_product_stock(database_service, Stock(2, 1, 1000))
+    # a snapshot every 20 minutes for 4 days
+    for i in range(4 * 72):
+        time_stamp = NOW - timedelta(days=4) + timedelta(minutes=20 * i)
+        utils.update_product_stock(database_service, Stock(1, 1, 1000 - i))
+        if i % 5 == 0:
+            utils.update_product_stock(database_service, Stock(1, 2, 1000 - i))
+        if i == 100:
+            utils.add_product_stock(database_service, Stock(1, 3, 100))
+        if i == 150:
+            utils.delete_product_stock(database_service, 1, 3)
+        utils.save_stock_records(database_service, delta=delta, time_stamp=time_stamp)
+    return database_service
+
+
+def get_snapshot_time_stamps(database_service: DatabaseService) -> list:
+    session = database_service.get_session()()
+    return [
+        time_stamp
+        for time_stamp, in session.query(Snapshot.time_stamp).order_by(
+            Snapshot.time_stamp
+        )
+    ]
+
+
+@pytest.mark.parametrize(
+    "days", [(-1, 1, 2), (2, 1, 3), (1, 3, 2)], ids=["negative", "raw", "hourly"]
+)
+def test_retention_policy_invalid(days: tuple):
+    with pytest.raises(ValueError):
+        retention.RetentionPolicy(*days)
+
+
+@pytest.mark.parametrize("delta", [False, True])
+def test_apply_retention(delta: bool):
+    database_service = create_history(delta)
+    time_stamps = get_snapshot_time_stamps(database_service)
+    stocks = {
+        time_stamp: retention.get_stocks_at(database_service, time_stamp)
+        for time_stamp in time_stamps
+    }
+    dry_run_report = retention.apply_retention(
+        database_service, POLICY, now=NOW, batch_size=7, dry_run=True
+    )
+    assert get_snapshot_time_stamps(database_service) == time_stamps
+    report = retention.apply_retention(database_service, POLICY, now=NOW, batch_size=7)
+    assert report == dry_run_report
+    kept_time_stamps = get_snapshot_time_stamps(database_service)
+    assert kept_time_stamps == (
+        [datetime(2023, 2, 26, 23, 40), datetime(2023, 2, 27)]
+        + [datetime(2023, 2, 27, hour, 40) for hour in range(24)]
+        + [
+            time_stamp
+            for time_stamp in time_stamps
+            if time_stamp >= datetime(2023, 2, 28)
+        ]
+    )
+    assert report["dropped_snapshots"] == len(time_stamps) - len(kept_time_stamps)
+    assert report["rebased_snapshots"] == (25 if delta else 0)
+    assert report["deleted_orphan_stock_records"] == 0
+    for time_stamp in kept_time_stamps:
+        assert (
+            retention.get_stocks_at(database_service, time_stamp) == stocks[time_stamp]
+        )
+    assert utils.has_delta_snapshots(database_service) == delta
+    assert retention.apply_retention(
+        database_service, POLICY, now=NOW, batch_size=7
+    ) == dict.fromkeys(report, 0)
+
+
+def test_apply_retention_orphans():
+    database_service = create_history(delta=True)
+    utils.delete_vending_machine(database_service, 2)
+    session = database_service.get_session()()
+    orphans = session.query(StockRecord).filter(StockRecord.vm_id == 2).count()
+    report = retention.apply_retention(
+        database_service,
+        retention.RetentionPolicy(30, 60, 90),
+        now=NOW,
+        dry_run=True,
+    )
+    assert report["dropped_snapshots"] == 0
+    assert report["deleted_orphan_stock_records"] == orphans
+    assert report["deleted_orphan_stock_rollups"] > 0
+    assert (
+        retention.apply_retention(
+            database_service, retention.RetentionPolicy(30, 60, 90), now=NOW
+        )
+        == report
+    )
+    assert session.query(StockRecord).filter(StockRecord.vm_id == 2).count() == 0
+    assert {
+        stock_rollup.vm_id
+        for model in utils.STOCK_ROLLUPS.values()
+        for stock_rollup in utils.get_stock_rollups(database_service, model)
+    } == {1}
+
+
+def create_fleet(vending_machines: int) -> DatabaseService:
+    database_service = DatabaseService("sqlite://")
+    with database_service.begin() as session:
+        session.add_all(
+            VendingMachine(name=f"vm_{vm_id}", location="loc_001")
+            for vm_id in range(1, vending_machines + 1)
+        )
+        session.add_all(
+            Stock(vm_id, prod_id, 100)
+            for vm_id in range(1, vending_machines + 1)
+            for prod_id in (1, 2, 3)
+        )
+    for hours in range(3):
+        utils.update_product_stock(database_service, Stock(hours + 1, 1, 99))
+        utils.save_stock_records(
+            database_service, delta=True, time_stamp=NOW + timedelta(hours=hours)
+        )
+    # far less variables than the stock records of a snapshot bind
+    connection = database_service.get_engine().raw_connection()
+    connection.connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 100)
+    connection.close()
+    return database_service
+
+
+@pytest.mark.skipif(
+    not hasattr(sqlite3.Connection, "setlimit"), reason="requires python 3.11"
+)
+def test_rebase_snapshot_in_batches():
+    database_service = create_fleet(100)
+    time_stamps = [NOW + timedelta(hours=hours) for hours in range(3)]
+    stocks = retention.get_stocks_at(database_service, time_stamps[1])
+    assert retention.rebase_snapshot(
+        database_service, None, time_stamps[1], batch_size=20
+    )
+    session = database_service.get_session()()
+    assert not session.get(Snapshot, time_stamps[1]).delta
+    assert session.get(Snapshot, time_stamps[2]).base == time_stamps[1]
+    assert retention.get_stocks_at(database_service, time_stamps[1]) == stocks
+    assert (
+        session.query(StockRecord)
+        .filter(StockRecord.time_stamp == time_stamps[1])
+        .count()
+        == 300
+    )
@@ -0,0 +1,68 @@
+"""Test: Slow Query Log."""
+from sqlalchemy import create_engine
+
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.vending_machine import VendingMachine
+from vmms_webapp.slow_query_log import SlowQueryLog
+
+
+def test_slow_query_log_captures_query_plan():
+    database_service = DatabaseService("sqlite://", slow_query_threshold=0)
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 10))
+    utils.save_stock_records(database_service)
+    slow_query_log = database_service.get_slow_query_log()
+    slow_query_log.clear()
+    utils.get_stock_records_by_vm_id(database_service, 1)
+    entries = slow_query_log.get_entries()
+    entry = next(
+        entry for entry in entries if "FROM stock_records" in entry["statement"]
+    )
+    assert entry["duration"] >= 0
+    assert 1 in entry["parameters"]
+    assert any(
+        "stock_records USING" in step and "INDEX" in step for step in entry["plan"]
+    )
+
+
+def test_slow_query_log_threshold():
+    slow_query_log = SlowQueryLog(threshold=60)
+    engine = create_engine("sqlite://")
+    slow_query_log.instrument(engine)
+    with engine.connect() as connection:
+        connection.exec_driver_sql("SELECT 1")
+    assert slow_query_log.get_entries() == []
+    slow_query_log.threshold = None
+    with engine.connect() as connection:
+        connection.exec_driver_sql("SELECT 1")
+    assert slow_query_log.get_entries() == []
+
+
+def test_slow_query_log_is_bounded():
+    slow_query_log = SlowQueryLog(threshold=0, size=3)
+    engine = create_engine("sqlite://")
+    slow_query_log.instrument(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE numbers (value INTEGER)")
+        connection.exec_driver_sql(
+            "INSERT INTO numbers VALUES (?)", [(value,) for value in range(20)]
+        )
+        for value in range(5):
+            connection.exec_driver_sql(
+                "SELECT value FROM numbers WHERE value = ?", (value,)
+            )
+    entries = slow_query_log.get_entries()
+    assert [entry["parameters"] for entry in entries] == [[4], [3], [2]]
+    assert entries[0]["plan"] == ["SCAN numbers"]
+    slow_query_log.clear()
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO numbers VALUES (?)", [(value,) for value in range(20)]
+        )
+    (entry,) = slow_query_log.get_entries()
+    assert entry["executemany"]
+    assert entry["parameters"] == [[value] for value in range(10)]
@@ -0,0 +1,114 @@
+"""Test: Snapshot Scheduler."""
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from vmms_webapp.database import utils
+from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.snapshot import Snapshot
+from vmms_webapp.snapshot_scheduler import SnapshotScheduler
+
+
+def create_database_service(tmp_path: Path) -> DatabaseService:
+    # every thread has its own in-memory database, so the background runs need a database file
+    return DatabaseService(f"sqlite:///{tmp_path / 'vending_machine.db'}")
+
+
+def count_snapshots(database_service: DatabaseService) -> int:
+    return database_service.get_session()().query(Snapshot).count()
+
+
+def test_snapshot_scheduler_run_once():
+    database_service = DatabaseService("sqlite://")
+    snapshot_scheduler = SnapshotScheduler(database_service, 60)
+    assert snapshot_scheduler.get_status()["last_run"] is None
+    assert snapshot_scheduler.run_once()
+    status = snapshot_scheduler.get_status()
+    assert not status["running"]
+    assert status["runs"] == 1
+    assert status["skipped"] == 0
+    assert status["last_run"]["rows"] == len(utils.get_stock_records(database_service))
+    assert status["last_run"]["error"] is None
+    # the lease has not expired yet, so the next run is skipped
+    assert not snapshot_scheduler.run_once()
+    assert snapshot_scheduler.get_status()["skipped"] == 1
+
+
+def test_snapshot_scheduler_lease():
+    database_service = DatabaseService("sqlite://")
+    snapshot_schedulers = [SnapshotScheduler(database_service, 60) for _ in range(3)]
+    assert [
+        snapshot_scheduler.run_once() for snapshot_scheduler in snapshot_schedulers
+    ] == [True, False, False]
+    assert count_snapshots(database_service) == 1
+
+
+def test_snapshot_scheduler_overlap(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    database_service = create_database_service(tmp_path)
+    snapshot_scheduler = SnapshotScheduler(database_service, 60)
+    started, finished = threading.Event(), threading.Event()
+    save_stock_records = utils.save_stock_records
+
+    def slow_save_stock_records(*args, **kwargs) -> dict:
+        started.set()
+        finished.wait(5)
+        return save_stock_records(*args, **kwargs)
+
+    monkeypatch.setattr(utils, "save_stock_records", slow_save_stock_records)
+    thread = threading.Thread(target=snapshot_scheduler.run_once)
+    thread.start()
+    assert started.wait(5)
+    assert not snapshot_scheduler.run_once()
+    finished.set()
+    thread.join()
+    assert snapshot_scheduler.get_status()["runs"] == 1
+    assert snapshot_scheduler.get_status()["skipped"] == 1
+
+
+def test_snapshot_scheduler_renew_lease(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    database_service = create_database_service(tmp_path)
+    snapshot_schedulers = [SnapshotScheduler(database_service, 0.2) for _ in range(2)]
+    started, finished = threading.Event(), threading.Event()
+    save_stock_records = utils.save_stock_records
+
+    def slow_save_stock_records(*args, **kwargs) -> dict:
+        started.set()
+        finished.wait(5)
+        return save_stock_records(*args, **kwargs)
+
+    monkeypatch.setattr(utils, "save_stock_records", slow_save_stock_records)
+    thread = threading.Thread(target=snapshot_schedulers[0].run_once)
+    thread.start()
+    assert started.wait(5)
+    # the run lasts longer than the interval, but it still holds the lease
+    time.sleep(0.5)
+    assert not snapshot_schedulers[1].run_once()
+    finished.set()
+    thread.join()
+    assert snapshot_schedulers[0].get_status()["runs"] == 1
+    assert count_snapshots(database_service) == 1
+
+
+def test_snapshot_scheduler_start_stop(tmp_path: Path):
+    database_service = create_database_service(tmp_path)
+    snapshot_scheduler = SnapshotScheduler(database_service, 0.05)
+    snapshot_scheduler.start()
+    assert snapshot_scheduler.get_status()["running"]
+    deadline = time.monotonic() + 5
+    while snapshot_scheduler.get_status()["runs"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    snapshot_scheduler.stop()
+    status = snapshot_scheduler.get_status()
+    assert not status["running"]
+    assert status["runs"] >= 2
+    assert count_snapshots(database_service) == status["runs"]
+
+
+@pytest.mark.parametrize("interval", [0, -1])
+def test_snapshot_scheduler_invalid_interval(interval: float):
+    with pytest.raises(ValueError):
+        SnapshotScheduler(DatabaseService("sqlite://"), interval)
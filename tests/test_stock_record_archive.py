@@ -0,0 +1,127 @@
+"""Test: Stock Record Archive."""
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from vmms_webapp.stock_record_archive import ARCHIVE_DTYPE, StockRecordArchive
+
+
+def create_records(*records: tuple) -> np.ndarray:
+    return np.array(list(records), dtype=ARCHIVE_DTYPE)
+
+
+def test_stock_record_archive_empty(tmp_path: Path):
+    archive = StockRecordArchive(str(tmp_path / "archive"))
+    assert archive.get_until() is None
+    assert archive.get_months() == []
+    assert len(archive.select()) == 0
+    assert len(archive.get_at(datetime(2023, 1, 1))) == 0
+    assert archive.get_buckets(60) == []
+
+
+def test_stock_record_archive(tmp_path: Path):
+    archive = StockRecordArchive(str(tmp_path))
+    assert (
+        archive.add(
+            create_records(
+                (datetime(2023, 1, 31, 23), 2, 1, 5),
+                (datetime(2023, 1, 31, 23), 1, 1, 8),
+                (datetime(2023, 2, 1), 1, 1, 7),
+                (datetime(2023, 2, 2), 1, 1, 6),
+            )
+        )
+        == 2
+    )
+    # an archived stock record is replaced when it is added again
+    assert archive.add(create_records((datetime(2023, 2, 1), 1, 1, 9))) == 1
+    archive.set_until(datetime(2023, 2, 2))
+    assert archive.get_until() == datetime(2023, 2, 2)
+    assert archive.get_months() == [np.datetime64("2023-01"), np.datetime64("2023-02")]
+    assert archive.select().tolist() == [
+        (datetime(2023, 1, 31, 23), 1, 1, 8),
+        (datetime(2023, 1, 31, 23), 2, 1, 5),
+        (datetime(2023, 2, 1), 1, 1, 9),
+    ]
+    assert archive.select(
+        vm_id=1, order=("vm_id", "prod_id", "time_stamp")
+    ).tolist() == [
+        (datetime(2023, 1, 31, 23), 1, 1, 8),
+        (datetime(2023, 2, 1), 1, 1, 9),
+    ]
+    assert archive.select(
+        cursor={"time_stamp": datetime(2023, 1, 31, 23), "vm_id": 1, "prod_id": 1},
+        limit=1,
+    ).tolist() == [(datetime(2023, 1, 31, 23), 2, 1, 5)]
+    assert archive.select(since=datetime(2023, 2, 1)).tolist() == [
+        (datetime(2023, 2, 1), 1, 1, 9)
+    ]
+    assert archive.get_at(datetime(2023, 2, 1, 12), vm_id=1).tolist() == [
+        (datetime(2023, 2, 1), 1, 1, 9)
+    ]
+    assert archive.get_at(datetime(2023, 1, 1)).tolist() == []
+    assert archive.get_buckets(24 * 60 * 60, vm_id=1) == [
+        {
+            "time_stamp": datetime(2023, 1, 31),
+            "vm_id": 1,
+            "prod_id": 1,
+            "count": 1,
+            "min": 8,
+            "max": 8,
+            "first": 8,
+            "last": 8,
+            "avg": 8.0,
+        },
+        {
+            "time_stamp": datetime(2023, 2, 1),
+            "vm_id": 1,
+            "prod_id": 1,
+            "count": 1,
+            "min": 9,
+            "max": 9,
+            "first": 9,
+            "last": 9,
+            "avg": 9.0,
+        },
+    ]
+
+
+def test_stock_record_archive_batches(tmp_path: Path):
+    archive = StockRecordArchive(str(tmp_path))
+    archive.add(create_records((datetime(2023, 1, 2), 1, 1, 1)))
+    batches = [
+        create_records(
+            (datetime(2023, 2, 1), 2, 1, 5),
+            (datetime(2023, 1, 2), 1, 1, 2),
+            (datetime(2023, 1, 1), 2, 1, 3),
+        ),
+        create_records(
+            (datetime(2023, 1, 1), 1, 1, 4),
+            (datetime(2023, 2, 1), 1, 1, 6),
+        ),
+    ]
+    assert archive.add_batches(batches, batch_size=2) == 2
+    # only the files of the months are left
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "stock_records-2023-01.npy",
+        "stock_records-2023-02.npy",
+    ]
+    archive.set_until(datetime(2023, 3, 1))
+    iterator = archive.iter_batches(batch_size=2)
+    assert next(iterator).tolist() == [
+        (datetime(2023, 1, 1), 1, 1, 4),
+        (datetime(2023, 1, 1), 2, 1, 3),
+    ]
+    # the next months are only read once their stock records are reached
+    assert list(archive.files) == [archive.get_path(np.datetime64("2023-01"))]
+    assert [batch.tolist() for batch in iterator] == [
+        [(datetime(2023, 1, 2), 1, 1, 2)],
+        [(datetime(2023, 2, 1), 1, 1, 6), (datetime(2023, 2, 1), 2, 1, 5)],
+    ]
+    assert [
+        batch.tolist()
+        for batch in archive.iter_batches(
+            cursor={"time_stamp": datetime(2023, 1, 2), "vm_id": 1, "prod_id": 1},
+            until=datetime(2023, 2, 2),
+        )
+    ] == [[(datetime(2023, 2, 1), 1, 1, 6), (datetime(2023, 2, 1), 2, 1, 5)]]
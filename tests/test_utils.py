@@ -1,10 +1,16 @@
 """Test: Utilities."""
+from datetime import datetime, timedelta
+
 import pytest
 
 from vmms_webapp.database import utils
 from vmms_webapp.database.database_service import DatabaseService
+from vmms_webapp.models.last_stock_record import LastStockRecord
+from vmms_webapp.models.lease import Lease
 from vmms_webapp.models.product import Product
 from vmms_webapp.models.stock import Stock
+from vmms_webapp.models.stock_record import StockRecord
+from vmms_webapp.models.stock_rollup import DailyStockRollup, HourlyStockRollup
 from vmms_webapp.models.vending_machine import VendingMachine
 
 
@@ -18,6 +24,26 @@ def test_populate_products(database_service: DatabaseService):
     ]
 
 
+def test_get_data_version(database_service: DatabaseService):
+    vending_machines_version = utils.get_data_version(
+        database_service, utils.VENDING_MACHINES_DATA
+    )
+    stock_records_version = utils.get_data_version(
+        database_service, utils.STOCK_RECORDS_DATA
+    )
+    session = database_service.get_session()()
+    utils.bump_data_version(session, utils.VENDING_MACHINES_DATA)
+    session.commit()
+    assert (
+        utils.get_data_version(database_service, utils.VENDING_MACHINES_DATA)
+        == vending_machines_version + 1
+    )
+    assert (
+        utils.get_data_version(database_service, utils.STOCK_RECORDS_DATA)
+        == stock_records_version
+    )
+
+
 def test_get_vending_machines(database_service: DatabaseService):
     assert utils.get_vending_machines(database_service) == []
     utils.add_vending_machine(
@@ -26,6 +52,27 @@ def test_get_vending_machines(database_service: DatabaseService):
     assert len(utils.get_vending_machines(database_service)) == 1
 
 
+def test_get_vending_machines_page(database_service: DatabaseService):
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_002", location="loc_002")
+    )
+    vending_machines, next_cursor = utils.get_vending_machines_page(
+        database_service, limit=1
+    )
+    assert [vending_machine.id for vending_machine in vending_machines] == [1]
+    assert next_cursor == 1
+    vending_machines, next_cursor = utils.get_vending_machines_page(
+        database_service, after_id=next_cursor, limit=1
+    )
+    assert [vending_machine.id for vending_machine in vending_machines] == [2]
+    assert next_cursor is None
+    vending_machines, _ = utils.get_vending_machines_page(
+        database_service, location="002"
+    )
+    assert [vending_machine.id for vending_machine in vending_machines] == [2]
+    utils.delete_vending_machine(database_service, 2)
+
+
 def test_get_products(database_service: DatabaseService):
     assert len(utils.get_products(database_service)) == 3
     assert utils.get_products(database_service) == [
@@ -96,6 +143,432 @@ def test_get_stock_records(database_service: DatabaseService):
     assert utils.get_stock_records(database_service)
 
 
+def test_iter_stock_record_batches():
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(1, 2, 200))
+    utils.save_stock_records(database_service)
+    utils.save_stock_records(database_service)
+    stock_records = utils.get_stock_records(database_service)
+    batches = list(utils.iter_stock_record_batches(database_service, batch_size=3))
+    assert [len(batch) for batch in batches] == [3, 1]
+    assert [stock_record for batch in batches for stock_record in batch] == sorted(
+        (stock_record.to_dict() for stock_record in stock_records),
+        key=lambda stock_record: (
+            stock_record["time_stamp"],
+            stock_record["vm_id"],
+            stock_record["prod_id"],
+        ),
+    )
+
+
+def test_get_stock_records_page():
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(1, 2, 200))
+    utils.save_stock_records(database_service)
+    utils.save_stock_records(database_service)
+    first, second = sorted(
+        {
+            stock_record.time_stamp
+            for stock_record in utils.get_stock_records(database_service)
+        }
+    )
+    stock_records, next_cursor = utils.get_stock_records_page(
+        database_service, since=second
+    )
+    assert [stock_record.time_stamp for stock_record in stock_records] == [second] * 2
+    assert next_cursor is None
+    stock_records, _ = utils.get_stock_records_page(database_service, until=second)
+    assert [stock_record.time_stamp for stock_record in stock_records] == [first] * 2
+    stock_records, next_cursor = utils.get_stock_records_page(
+        database_service, vm_id=1, limit=3
+    )
+    assert [
+        (stock_record.prod_id, stock_record.time_stamp)
+        for stock_record in stock_records
+    ] == [(1, first), (1, second), (2, first)]
+    stock_records, next_cursor = utils.get_stock_records_page(
+        database_service,
+        vm_id=1,
+        limit=3,
+        cursor=utils.decode_stock_record_cursor(next_cursor),
+    )
+    assert [
+        (stock_record.prod_id, stock_record.time_stamp)
+        for stock_record in stock_records
+    ] == [(2, second)]
+    assert next_cursor is None
+
+
+def test_to_epoch_milliseconds():
+    assert utils.to_epoch_milliseconds(datetime(1970, 1, 1)) == 0
+    assert (
+        utils.to_epoch_milliseconds(datetime(2023, 1, 1, 0, 0, 1, 234567))
+        == 1672531201234
+    )
+
+
+def test_get_stock_record_columns_page():
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(1, 2, 200))
+    utils.save_stock_records(database_service)
+    utils.save_stock_records(database_service)
+    for limit in (None, 3):
+        stock_records, next_cursor = utils.get_stock_records_page(
+            database_service, vm_id=1, limit=limit
+        )
+        columns, next_columns_cursor = utils.get_stock_record_columns_page(
+            database_service, vm_id=1, limit=limit
+        )
+        assert next_columns_cursor == next_cursor
+        assert columns == {
+            "time_stamp": [
+                utils.to_epoch_milliseconds(stock_record.time_stamp)
+                for stock_record in stock_records
+            ],
+            "vm_id": [stock_record.vm_id for stock_record in stock_records],
+            "prod_id": [stock_record.prod_id for stock_record in stock_records],
+            "stock": [stock_record.stock for stock_record in stock_records],
+        }
+    columns, next_cursor = utils.get_stock_record_columns_page(
+        database_service, vm_id=2
+    )
+    assert columns == {"time_stamp": [], "vm_id": [], "prod_id": [], "stock": []}
+    assert next_cursor is None
+
+
+def test_save_stock_records_delta():
+    full_database_service = DatabaseService("sqlite://")
+    delta_database_service = DatabaseService("sqlite://")
+    stock_records = {}
+    for delta, database_service in (
+        (False, full_database_service),
+        (True, delta_database_service),
+    ):
+        utils.add_vending_machine(
+            database_service, VendingMachine(name="vm_001", location="loc_001")
+        )
+        utils.add_product_stock(database_service, Stock(1, 1, 100))
+        utils.add_product_stock(database_service, Stock(1, 2, 200))
+        utils.save_stock_records(database_service, delta=delta)
+        utils.save_stock_records(database_service, delta=delta)
+        utils.update_product_stock(database_service, Stock(1, 1, 90))
+        utils.add_product_stock(database_service, Stock(1, 3, 300))
+        utils.save_stock_records(database_service, delta=delta)
+        utils.delete_product_stock(database_service, 1, 2)
+        utils.save_stock_records(database_service, delta=delta)
+        stock_records[delta] = utils.get_stock_records(database_service)
+    assert len(stock_records[False]) == 9
+    assert [
+        (stock_record.vm_id, stock_record.prod_id, stock_record.stock)
+        for stock_record in sorted(
+            stock_records[True], key=lambda stock_record: stock_record.time_stamp
+        )
+    ] == [(1, 1, 100), (1, 2, 200), (1, 1, 90), (1, 3, 300), (1, 2, None)]
+    assert not utils.has_delta_snapshots(full_database_service)
+    assert utils.has_delta_snapshots(delta_database_service)
+
+    def to_series(database_service: DatabaseService, **filters) -> list:
+        stock_records, _ = utils.get_stock_records_page(database_service, **filters)
+        return [
+            (stock_record.vm_id, stock_record.prod_id, stock_record.stock)
+            for stock_record in stock_records
+        ]
+
+    for filters in ({}, {"vm_id": 1}, {"prod_id": 2}):
+        assert to_series(delta_database_service, **filters) == to_series(
+            full_database_service, **filters
+        )
+    assert utils.get_stock_record_columns_page(delta_database_service, vm_id=1)[0][
+        "stock"
+    ] == [100, 100, 90, 90, 200, 200, 200, 300, 300]
+
+
+def test_get_stock_records_at():
+    database_service = DatabaseService("sqlite://")
+    assert utils.get_stock_records_at(database_service, datetime.utcnow()) == []
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(1, 2, 200))
+    utils.save_stock_records(database_service)
+    first = datetime.utcnow()
+    utils.update_product_stock(database_service, Stock(1, 1, 90))
+    utils.delete_product_stock(database_service, 1, 2)
+    utils.save_stock_records(database_service, delta=True)
+    assert [
+        (stock_record.prod_id, stock_record.stock)
+        for stock_record in utils.get_stock_records_at(database_service, first)
+    ] == [(1, 100), (2, 200)]
+    assert [
+        (stock_record.prod_id, stock_record.stock)
+        for stock_record in utils.get_stock_records_at(
+            database_service, datetime.utcnow(), prod_id=1
+        )
+    ] == [(1, 90)]
+
+
+def test_update_stock_rollups():
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(1, 2, 200))
+    for time_stamp, stocks in [
+        (datetime(2023, 1, 1, 0, 10), [Stock(1, 1, 100), Stock(1, 2, 200)]),
+        (datetime(2023, 1, 1, 0, 20), [Stock(1, 1, 90), Stock(1, 2, 200)]),
+        (datetime(2023, 1, 1, 0, 30), [Stock(1, 1, 95), Stock(1, 2, 180)]),
+        (datetime(2023, 1, 1, 1, 10), [Stock(1, 1, 80), Stock(1, 2, 180)]),
+    ]:
+        for stock in stocks:
+            utils.update_product_stock(database_service, stock)
+        utils.save_stock_records(database_service, time_stamp=time_stamp)
+    assert [
+        stock_rollup.to_dict()
+        for stock_rollup in utils.get_stock_rollups(
+            database_service, HourlyStockRollup, vm_id=1
+        )
+    ] == [
+        {
+            "time_stamp": datetime(2023, 1, 1, 0),
+            "vm_id": 1,
+            "prod_id": 1,
+            "min": 90,
+            "max": 100,
+            "last": 95,
+            "consumed": 10,
+        },
+        {
+            "time_stamp": datetime(2023, 1, 1, 1),
+            "vm_id": 1,
+            "prod_id": 1,
+            "min": 80,
+            "max": 80,
+            "last": 80,
+            "consumed": 15,
+        },
+        {
+            "time_stamp": datetime(2023, 1, 1, 0),
+            "vm_id": 1,
+            "prod_id": 2,
+            "min": 180,
+            "max": 200,
+            "last": 180,
+            "consumed": 20,
+        },
+        {
+            "time_stamp": datetime(2023, 1, 1, 1),
+            "vm_id": 1,
+            "prod_id": 2,
+            "min": 180,
+            "max": 180,
+            "last": 180,
+            "consumed": 0,
+        },
+    ]
+    assert [
+        (
+            stock_rollup.prod_id,
+            stock_rollup.min,
+            stock_rollup.last,
+            stock_rollup.consumed,
+        )
+        for stock_rollup in utils.get_stock_rollups(
+            database_service, DailyStockRollup, since=datetime(2023, 1, 1)
+        )
+    ] == [(1, 80, 80, 25), (2, 180, 180, 20)]
+
+
+@pytest.mark.parametrize("delta", [False, True])
+def test_save_stock_records_last_stock_records(delta: bool):
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(1, 2, 200))
+    utils.save_stock_records(database_service, delta=delta)
+    utils.update_product_stock(database_service, Stock(1, 1, 90))
+    utils.delete_product_stock(database_service, 1, 2)
+    utils.add_product_stock(database_service, Stock(1, 3, 300))
+    utils.save_stock_records(database_service, delta=delta)
+    session = database_service.get_session()()
+    assert sorted(
+        (last_stock_record.prod_id, last_stock_record.stock)
+        for last_stock_record in session.query(LastStockRecord)
+    ) == [(1, 90), (3, 300)]
+
+
+@pytest.mark.parametrize("delta", [False, True])
+def test_populate_stock_rollups(delta: bool):
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    utils.add_product_stock(database_service, Stock(1, 1, 100))
+    utils.add_product_stock(database_service, Stock(1, 2, 200))
+    utils.save_stock_records(database_service, delta=delta)
+    utils.update_product_stock(database_service, Stock(1, 1, 90))
+    utils.save_stock_records(database_service, delta=delta)
+    utils.update_product_stock(database_service, Stock(1, 1, 120))
+    utils.delete_product_stock(database_service, 1, 2)
+    utils.save_stock_records(database_service, delta=delta)
+    stock_rollups = {
+        model: [
+            stock_rollup.to_dict()
+            for stock_rollup in utils.get_stock_rollups(database_service, model)
+        ]
+        for model in (HourlyStockRollup, DailyStockRollup)
+    }
+    assert (
+        sum(
+            stock_rollup["consumed"] for stock_rollup in stock_rollups[DailyStockRollup]
+        )
+        == 10
+    )
+    with database_service.begin() as session:
+        session.query(HourlyStockRollup).delete()
+        session.query(DailyStockRollup).delete()
+    utils.populate_stock_rollups(database_service)
+    for model in (HourlyStockRollup, DailyStockRollup):
+        assert [
+            stock_rollup.to_dict()
+            for stock_rollup in utils.get_stock_rollups(database_service, model)
+        ] == stock_rollups[model]
+
+
+@pytest.mark.parametrize(
+    "bucket, width",
+    [("30s", 30), ("5m", 300), ("1h", 3600), ("1d", 86400), (" 2h ", 7200)],
+)
+def test_parse_bucket_width(bucket: str, width: int):
+    assert utils.parse_bucket_width(bucket) == width
+
+
+@pytest.mark.parametrize("bucket", ["", "0m", "5", "m", "-5m", "5w", "1.5h"])
+def test_parse_bucket_width_invalid(bucket: str):
+    with pytest.raises(ValueError):
+        utils.parse_bucket_width(bucket)
+
+
+def test_get_stock_record_buckets():
+    database_service = DatabaseService("sqlite://")
+    utils.add_vending_machine(
+        database_service, VendingMachine(name="vm_001", location="loc_001")
+    )
+    session = database_service.get_session()()
+    session.add_all(
+        StockRecord(1, prod_id, stock, datetime(2023, 1, 1, hour, minute))
+        for prod_id, hour, minute, stock in [
+            (1, 0, 0, 10),
+            (1, 0, 30, 4),
+            (1, 0, 59, 7),
+            (1, 1, 15, 3),
+            (2, 0, 10, 20),
+            (2, 2, 0, 22),
+        ]
+    )
+    session.commit()
+    buckets = utils.get_stock_record_buckets(database_service, 3600, vm_id=1)
+    assert buckets == [
+        {
+            "time_stamp": datetime(2023, 1, 1, 0),
+            "vm_id": 1,
+            "prod_id": 1,
+            "count": 3,
+            "min": 4,
+            "max": 10,
+            "first": 10,
+            "last": 7,
+            "avg": 7.0,
+        },
+        {
+            "time_stamp": datetime(2023, 1, 1, 1),
+            "vm_id": 1,
+            "prod_id": 1,
+            "count": 1,
+            "min": 3,
+            "max": 3,
+            "first": 3,
+            "last": 3,
+            "avg": 3.0,
+        },
+        {
+            "time_stamp": datetime(2023, 1, 1, 0),
+            "vm_id": 1,
+            "prod_id": 2,
+            "count": 1,
+            "min": 20,
+            "max": 20,
+            "first": 20,
+            "last": 20,
+            "avg": 20.0,
+        },
+        {
+            "time_stamp": datetime(2023, 1, 1, 2),
+            "vm_id": 1,
+            "prod_id": 2,
+            "count": 1,
+            "min": 22,
+            "max": 22,
+            "first": 22,
+            "last": 22,
+            "avg": 22.0,
+        },
+    ]
+    buckets = utils.get_stock_record_buckets(
+        database_service, 86400, prod_id=1, since=datetime(2023, 1, 1, 0, 30)
+    )
+    assert [
+        (bucket["time_stamp"], bucket["count"], bucket["first"], bucket["last"])
+        for bucket in buckets
+    ] == [(datetime(2023, 1, 1), 3, 4, 3)]
+    buckets = utils.get_stock_record_buckets(
+        database_service, 3600, until=datetime(2023, 1, 1, 1)
+    )
+    assert [(bucket["prod_id"], bucket["count"]) for bucket in buckets] == [
+        (1, 3),
+        (2, 1),
+    ]
+
+
+@pytest.mark.parametrize(
+    "filters, index",
+    [
+        ({"vm_id": 1}, "ix_stock_records_vm_id_prod_id_time_stamp"),
+        ({"prod_id": 1}, "ix_stock_records_prod_id_vm_id_time_stamp"),
+    ],
+)
+def test_select_stock_records_query_plan(
+    database_service: DatabaseService, filters: dict, index: str
+):
+    statement = utils.select_stock_records(
+        StockRecord, since=datetime(2023, 1, 1), **filters
+    ).compile(database_service.get_engine())
+    with database_service.get_engine().connect() as connection:
+        query_plan = " ".join(
+            row[-1]
+            for row in connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", tuple(statement.params.values())
+            )
+        )
+    assert index in query_plan
+    assert "TEMP B-TREE" not in query_plan
+
+
 def test_get_stock_records_by_vm_id(database_service: DatabaseService):
     assert len(utils.get_stock_records_by_vm_id(database_service, 1)) == 2
     assert all(
@@ -107,3 +580,35 @@ def test_get_stock_records_by_vm_id(database_service: DatabaseService):
 def test_get_stock_records_by_prod_id(database_service: DatabaseService):
     assert len(utils.get_stock_records_by_prod_id(database_service, 1)) == 0
     assert utils.get_stock_records_by_prod_id(database_service, 1) == []
+
+
+def test_get_vending_machines_with_stocks(database_service: DatabaseService):
+    vending_machines_with_stocks = utils.get_vending_machines_with_stocks(
+        database_service
+    )
+    assert len(vending_machines_with_stocks) == 1
+    vending_machine, product_choices, stocks = vending_machines_with_stocks[0]
+    assert vending_machine == utils.get_vending_machine_by_id(database_service, 1)
+    assert product_choices == utils.get_product_choices_by_vm_id(database_service, 1)
+    assert stocks == utils.get_stocks_by_vm_id(database_service, 1)
+
+
+def test_acquire_lease():
+    database_service = DatabaseService("sqlite://")
+    now = datetime(2023, 3, 1)
+    duration = timedelta(minutes=5)
+    assert utils.acquire_lease(database_service, "job", "a", duration, now=now)
+    assert not utils.acquire_lease(database_service, "job", "b", duration, now=now)
+    assert utils.acquire_lease(database_service, "other job", "b", duration, now=now)
+    assert not utils.acquire_lease(
+        database_service, "job", "b", duration, now=now + timedelta(minutes=4)
+    )
+    assert utils.acquire_lease(
+        database_service, "job", "b", duration, now=now + duration
+    )
+    lease = database_service.get_session()().get(Lease, "job")
+    assert lease.to_dict() == {
+        "name": "job",
+        "owner": "b",
+        "expires_at": now + 2 * duration,
+    }